@@ -0,0 +1,46 @@
+# gunicorn.conf.py
+# Run with: gunicorn -c gunicorn.conf.py
+#
+# ASGI deployment: gunicorn manages the processes, each running uvicorn's event
+# loop. The dashboard and report pages are async views that push their queries
+# to thread pools, so a slow page or a long-lived export no longer occupies a
+# whole worker process the way it did with sync workers.
+import multiprocessing
+
+import decouple  # not `from decouple import config`: gunicorn reads `config` as a setting
+
+wsgi_app = 'usg_records.asgi:application'
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+bind = decouple.config('GUNICORN_BIND', default='0.0.0.0:8000')
+# Async workers do not need 2 x CPUs + 1 to stay busy, and every extra worker
+# is another copy that may grow to MEMORY_RECYCLE_MB: the box needs about
+# workers x MEMORY_RECYCLE_MB of RAM in the worst case.
+workers = decouple.config('GUNICORN_WORKERS', default=min(multiprocessing.cpu_count() + 1, 6), cast=int)
+timeout = decouple.config('GUNICORN_TIMEOUT', default=120, cast=int)  # large PDF exports
+graceful_timeout = 30
+keepalive = 5
+
+# Replace workers regularly, whatever their size; the jitter stops them all
+# restarting at the same moment.
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', default=2000, cast=int)
+max_requests_jitter = decouple.config('GUNICORN_MAX_REQUESTS_JITTER', default=200, cast=int)
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    # Let reports.memory retire this worker (SIGTERM: finish in-flight requests,
+    # then exit) once it has grown past MEMORY_RECYCLE_MB; the arbiter replaces it.
+    from reports import memory
+    memory.enable_recycling()
+
+
+def worker_exit(server, worker):
+    # Recycled or not, a worker exits only after the audit entries it queued are
+    # written (reports.audit); the writer is a daemon thread and would die unflushed.
+    # Master data merges run in the scheduler process, not in workers.
+    from reports import audit
+    if not audit.flush(timeout=graceful_timeout - 5):
+        server.log.warning("Worker %s exited before its audit entries were written", worker.pid)
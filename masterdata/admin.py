@@ -1,24 +1,32 @@
 from django.contrib import admin
-from .models import ExamName, ExamType, Referrer, Sonologist
+from .models import Branch, ExamName, ExamType, Referrer, Sonologist
+
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code', 'is_active')
+    search_fields = ('name', 'code')
 
 @admin.register(ExamName)
 class ExamNameAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'branch')
+    list_filter = ('branch',)
     search_fields = ('name',)
 
 @admin.register(ExamType)
 class ExamTypeAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'branch')
+    list_filter = ('branch',)
     search_fields = ('name',)
 
 @admin.register(Referrer)
 class ReferrerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'is_active')
-    list_filter = ('is_active',)
+    list_display = ('name', 'branch', 'is_active')
+    list_filter = ('branch', 'is_active')
 
 @admin.register(Sonologist)
 class SonologistAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'branch')
+    list_filter = ('branch',)
     search_fields = ('name',)
 
     
@@ -1,36 +1,93 @@
 from django import forms
-from .models import ExamName, ExamType, Referrer, Sonologist
+from django.db.models import Q
+from django.forms.models import ModelChoiceIterator
+from .models import Branch, ExamName, ExamType, Referrer, Sonologist
+from .tenancy import get_current_branch
 
 INPUT_CLASS = 'form-control'
 
-class ExamNameForm(forms.ModelForm):
+
+class NameChoiceIterator(ModelChoiceIterator):
+    """Dropdown options from ``(id, name)`` rows instead of one model instance per option."""
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        yield from self.queryset.values_list('pk', 'name')
+
+
+class ActiveChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField for master data: renders from names only; the chosen row is still fetched on clean."""
+    iterator = NameChoiceIterator
+
+
+class MasterdataForm(forms.ModelForm):
+    """
+    Name and branch of a master data row; no branch means shared by all branches.
+
+    At a branch, new rows belong to it and only that branch can be chosen
+    (shared rows edited there may stay shared). A name may not repeat within
+    a branch, nor between a branch and the shared rows, so no dropdown lists
+    it twice.
+    """
+    branch = forms.ModelChoiceField(
+        queryset=Branch.active.all(),
+        required=False,
+        empty_label='All branches (shared)',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        current = get_current_branch()
+        if current is not None:
+            field = self.fields['branch']
+            field.queryset = Branch.objects.filter(pk=current.pk)
+            if self.instance.pk is None:
+                self.initial['branch'] = current.pk
+            if self.instance.pk is None or self.instance.branch_id is not None:
+                field.empty_label = None
+                field.required = True
+
+    def clean(self):
+        cleaned = super().clean()
+        name, branch = cleaned.get('name'), cleaned.get('branch')
+        if name and 'branch' not in self.errors:
+            clashes = type(self.instance).objects.filter(name=name).exclude(pk=self.instance.pk)
+            if branch is not None:
+                clashes = clashes.filter(Q(branch=branch) | Q(branch__isnull=True))
+            if clashes.exists():
+                self.add_error('name', 'This name is already used in this branch or by a shared entry.')
+        return cleaned
+
+
+class ExamNameForm(MasterdataForm):
     class Meta:
         model = ExamName
-        fields = ['name']
+        fields = ['name', 'branch']
         widgets = {
             'name': forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Exam name (e.g. Whole Abdomen)'}),
         }
 
-class ExamTypeForm(forms.ModelForm):
+class ExamTypeForm(MasterdataForm):
     class Meta:
         model = ExamType
-        fields = ['name']
+        fields = ['name', 'branch']
         widgets = {
             'name': forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Exam type (e.g. Normal)'}),
         }
 
-class ReferrerForm(forms.ModelForm):
+class ReferrerForm(MasterdataForm):
     class Meta:
         model = Referrer
-        fields = ['name']
+        fields = ['name', 'branch']
         widgets = {
             'name': forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Doctor name'}),
         }
 
-class SonologistForm(forms.ModelForm):
+class SonologistForm(MasterdataForm):
     class Meta:
         model = Sonologist
-        fields = ['name']
+        fields = ['name', 'branch']
         widgets = {
             'name': forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Sonologist name'}),
         }
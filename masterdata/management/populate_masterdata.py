@@ -70,16 +70,16 @@ class Command(BaseCommand):
 
         created = 0
         for name in exam_names:
-            obj, _ = ExamName.objects.get_or_create(name=name)
+            obj, _ = ExamName.objects.get_or_create(name=name, branch=None)
             created += 1
         for name in exam_types:
-            obj, _ = ExamType.objects.get_or_create(name=name)
+            obj, _ = ExamType.objects.get_or_create(name=name, branch=None)
             created += 1
         for name in referrers:
-            obj, _ = Referrer.objects.get_or_create(name=name)
+            obj, _ = Referrer.objects.get_or_create(name=name, branch=None)
             created += 1
         for name in sonologists:
-            obj, _ = Sonologist.objects.get_or_create(name=name)
+            obj, _ = Sonologist.objects.get_or_create(name=name, branch=None)
             created += 1
 
         self.stdout.write(self.style.SUCCESS(f'Populated masterdata with {created} items.'))
@@ -0,0 +1,79 @@
+# masterdata/middleware.py
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Branch
+from .tenancy import reset_current_branch, set_current_branch
+
+SESSION_KEY = 'branch'
+
+# Lookups (misses too) are reused for this long; a Branch saved in this process
+# clears them at once, other processes see the change when theirs expire.
+BRANCH_CACHE_SECONDS = 60
+
+_branches = {}
+
+
+def branch_for_code(code):
+    """Active Branch for ``code`` (cached per process for BRANCH_CACHE_SECONDS), or None."""
+    if not code:
+        return None
+    now = time.monotonic()
+    branch, expires = _branches.get(code, (None, 0))
+    if now >= expires:
+        branch = Branch.active.filter(code=code).first()
+        _branches[code] = (branch, now + BRANCH_CACHE_SECONDS)
+    return branch
+
+
+@receiver([post_save, post_delete], sender=Branch)
+def forget_branches(sender, **kwargs):
+    _branches.clear()
+
+
+class CurrentBranchMiddleware:
+    """
+    Resolve the branch for the request and make it current.
+
+    A branch deployment pins its branch with the BRANCH_CODE setting. Without it
+    (head office), ``?branch=<code>`` switches the session to one branch and
+    ``?branch=`` goes back to all branches.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def resolve(self, request):
+        code = settings.BRANCH_CODE
+        if not code and hasattr(request, 'session'):
+            if 'branch' in request.GET:
+                request.session[SESSION_KEY] = request.GET['branch']
+            code = request.session.get(SESSION_KEY)
+        return branch_for_code(code)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.branch = self.resolve(request)
+        token = set_current_branch(request.branch)
+        try:
+            return self.get_response(request)
+        finally:
+            reset_current_branch(token)
+
+    async def __acall__(self, request):
+        request.branch = await sync_to_async(self.resolve)(request)  # session and Branch lookups
+        token = set_current_branch(request.branch)
+        try:
+            return await self.get_response(request)
+        finally:
+            reset_current_branch(token)
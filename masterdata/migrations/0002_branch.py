@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Branch',
+                'verbose_name_plural': 'Branches',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='examname',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='masterdata.branch'),
+        ),
+        migrations.AddField(
+            model_name='examtype',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='masterdata.branch'),
+        ),
+        migrations.AddField(
+            model_name='referrer',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='masterdata.branch'),
+        ),
+        migrations.AddField(
+            model_name='sonologist',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='masterdata.branch'),
+        ),
+        migrations.AddIndex(
+            model_name='examname',
+            index=models.Index(fields=['branch', 'is_active', 'name'], name='examname_branch_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examtype',
+            index=models.Index(fields=['branch', 'is_active', 'name'], name='examtype_branch_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referrer',
+            index=models.Index(fields=['branch', 'is_active', 'name'], name='referrer_branch_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sonologist',
+            index=models.Index(fields=['branch', 'is_active', 'name'], name='sonologist_branch_active_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0002_branch'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='examname',
+            name='examname_branch_active_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='examtype',
+            name='examtype_branch_active_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='referrer',
+            name='referrer_branch_active_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sonologist',
+            name='sonologist_branch_active_idx',
+        ),
+        migrations.AddIndex(
+            model_name='examname',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='examname_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examname',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['branch', 'name'], name='examname_branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examtype',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='examtype_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examtype',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['branch', 'name'], name='examtype_branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referrer',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='referrer_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referrer',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['branch', 'name'], name='referrer_branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sonologist',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='sonologist_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sonologist',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['branch', 'name'], name='sonologist_branch_name_idx'),
+        ),
+    ]
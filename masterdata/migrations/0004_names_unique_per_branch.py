@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0003_active_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='examname',
+            name='name',
+            field=models.CharField(max_length=150),
+        ),
+        migrations.AlterField(
+            model_name='examtype',
+            name='name',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='referrer',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='sonologist',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddConstraint(
+            model_name='examname',
+            constraint=models.UniqueConstraint(fields=('branch', 'name'), name='examname_branch_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='examname',
+            constraint=models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('name',), name='examname_shared_name_uniq', violation_error_message='A shared entry with this name already exists.'),
+        ),
+        migrations.AddConstraint(
+            model_name='examtype',
+            constraint=models.UniqueConstraint(fields=('branch', 'name'), name='examtype_branch_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='examtype',
+            constraint=models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('name',), name='examtype_shared_name_uniq', violation_error_message='A shared entry with this name already exists.'),
+        ),
+        migrations.AddConstraint(
+            model_name='referrer',
+            constraint=models.UniqueConstraint(fields=('branch', 'name'), name='referrer_branch_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='referrer',
+            constraint=models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('name',), name='referrer_shared_name_uniq', violation_error_message='A shared entry with this name already exists.'),
+        ),
+        migrations.AddConstraint(
+            model_name='sonologist',
+            constraint=models.UniqueConstraint(fields=('branch', 'name'), name='sonologist_branch_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='sonologist',
+            constraint=models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('name',), name='sonologist_shared_name_uniq', violation_error_message='A shared entry with this name already exists.'),
+        ),
+    ]
@@ -1,4 +1,48 @@
 from django.db import models
+from django.db.models import Q
+
+from .tenancy import get_current_branch
+
+
+class BranchQuerySet(models.QuerySet):
+    """
+    QuerySet limited to the current branch once scoped().
+
+    Scoping is re-applied by all(), which ModelChoiceField calls for every form
+    instance, so class-level ``queryset=Model.active.all()`` declarations pick up
+    the branch of the request that renders the form.
+    """
+    _branch_scoped = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._branch_scoped = self._branch_scoped
+        return clone
+
+    def branch_q(self, branch):
+        # Masterdata without a branch is shared by every branch
+        return Q(branch=branch) | Q(branch__isnull=True)
+
+    def for_branch(self, branch):
+        qs = self.filter(self.branch_q(branch))
+        qs._branch_scoped = True
+        return qs
+
+    def scoped(self):
+        branch = get_current_branch()
+        if branch is None or self._branch_scoped:
+            return self
+        return self.for_branch(branch)
+
+    def all(self):
+        return super().all().scoped()
+
+
+class BranchManager(models.Manager.from_queryset(BranchQuerySet)):
+    """Manager limited to the current branch (all rows when no branch is set)."""
+    def get_queryset(self):
+        return super().get_queryset().scoped()
+
 
 class ActiveManager(models.Manager):
     """Custom manager to return only active records."""
@@ -6,15 +50,68 @@ class ActiveManager(models.Manager):
         return super().get_queryset().filter(is_active=True)
 
 
+class BranchActiveManager(ActiveManager, BranchManager):
+    """Active records of the current branch, plus shared ones."""
+
+
+class Branch(models.Model):
+    code = models.SlugField(max_length=20, unique=True)
+    name = models.CharField(max_length=200, unique=True)
+    is_active = models.BooleanField(default=True)
+
+    objects = models.Manager()
+    active = ActiveManager()
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Branch"
+        verbose_name_plural = "Branches"
+
+    def __str__(self):
+        return self.name
+
+
+def branch_field():
+    """Nullable branch FK for masterdata; no branch means shared by all branches."""
+    return models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+
+
+def branch_indexes(prefix):
+    # Partial indexes over active rows only: dropdowns and lists read them in name
+    # order (per branch or across branches) without a sort or touching inactive rows.
+    active = Q(is_active=True)
+    return [
+        models.Index(fields=['name'], name=f'{prefix}_active_name_idx', condition=active),
+        models.Index(fields=['branch', 'name'], name=f'{prefix}_branch_name_idx', condition=active),
+    ]
+
+
+def branch_constraints(prefix):
+    # Names are unique within a branch and among shared rows (NULL branches never collide).
+    # MasterdataForm also keeps a branch's names apart from the shared ones.
+    return [
+        models.UniqueConstraint(fields=['branch', 'name'], name=f'{prefix}_branch_name_uniq'),
+        models.UniqueConstraint(
+            fields=['name'],
+            condition=Q(branch__isnull=True),
+            name=f'{prefix}_shared_name_uniq',
+            violation_error_message="A shared entry with this name already exists.",
+        ),
+    ]
+
+
 class ExamName(models.Model):
-    name = models.CharField(max_length=150, unique=True)
+    name = models.CharField(max_length=150)
     is_active = models.BooleanField(default=True)
+    branch = branch_field()
 
     objects = models.Manager()         # Default manager
-    active = ActiveManager()           # Manager for active records only
+    active = BranchActiveManager()     # Active records of the current branch
 
     class Meta:
         ordering = ['name']
+        indexes = branch_indexes('examname')
+        constraints = branch_constraints('examname')
         verbose_name = "Exam Name"
         verbose_name_plural = "Exam Names"
 
@@ -23,14 +120,17 @@ class ExamName(models.Model):
 
 
 class ExamType(models.Model):
-    name = models.CharField(max_length=50, unique=True)
+    name = models.CharField(max_length=50)
     is_active = models.BooleanField(default=True)
+    branch = branch_field()
 
     objects = models.Manager()
-    active = ActiveManager()
+    active = BranchActiveManager()
 
     class Meta:
         ordering = ['name']
+        indexes = branch_indexes('examtype')
+        constraints = branch_constraints('examtype')
         verbose_name = "Exam Type"
         verbose_name_plural = "Exam Types"
 
@@ -39,14 +139,17 @@ class ExamType(models.Model):
 
 
 class Referrer(models.Model):
-    name = models.CharField(max_length=200, unique=True)
+    name = models.CharField(max_length=200)
     is_active = models.BooleanField(default=True)
+    branch = branch_field()
 
     objects = models.Manager()
-    active = ActiveManager()
+    active = BranchActiveManager()
 
     class Meta:
         ordering = ['name']
+        indexes = branch_indexes('referrer')
+        constraints = branch_constraints('referrer')
         verbose_name = "Referrer (Doctor)"
         verbose_name_plural = "Referrers (Doctors)"
 
@@ -55,14 +158,17 @@ class Referrer(models.Model):
 
 
 class Sonologist(models.Model):
-    name = models.CharField(max_length=200, unique=True)
+    name = models.CharField(max_length=200)
     is_active = models.BooleanField(default=True)
+    branch = branch_field()
 
     objects = models.Manager()
-    active = ActiveManager()
+    active = BranchActiveManager()
 
     class Meta:
         ordering = ['name']
+        indexes = branch_indexes('sonologist')
+        constraints = branch_constraints('sonologist')
         verbose_name = "Sonologist"
         verbose_name_plural = "Sonologists"
 
@@ -0,0 +1,35 @@
+# masterdata/tenancy.py
+"""
+Current branch (diagnostic centre) for the running request or task.
+
+``CurrentBranchMiddleware`` sets it per request; management commands and shells
+run with no branch, which means "all branches". Branch-aware managers read it
+when a queryset is built (see ``BranchQuerySet.scoped``).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_branch = ContextVar('current_branch', default=None)
+
+
+def get_current_branch():
+    return _current_branch.get()
+
+
+def set_current_branch(branch):
+    """Set the current branch; returns a token for reset_current_branch()."""
+    return _current_branch.set(branch)
+
+
+def reset_current_branch(token):
+    _current_branch.reset(token)
+
+
+@contextmanager
+def using_branch(branch):
+    """Run a block as ``branch`` (``None`` for all branches)."""
+    token = _current_branch.set(branch)
+    try:
+        yield branch
+    finally:
+        _current_branch.reset(token)
@@ -1,3 +1,98 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+
+from . import middleware
+from .forms import ReferrerForm
+from .models import Branch, Referrer
+from .tenancy import using_branch
+
+
+class BranchForCodeTests(TestCase):
+    def setUp(self):
+        middleware._branches.clear()
+        self.addCleanup(middleware._branches.clear)
+
+    def test_lookups_are_cached_misses_included(self):
+        self.assertIsNone(middleware.branch_for_code('north'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(middleware.branch_for_code('north'))
+
+    def test_saving_a_branch_clears_the_cache(self):
+        self.assertIsNone(middleware.branch_for_code('north'))
+        branch = Branch.objects.create(code='north', name='North')
+        self.assertEqual(middleware.branch_for_code('north'), branch)
+        branch.is_active = False
+        branch.save()
+        self.assertIsNone(middleware.branch_for_code('north'))
+
+    def test_entries_expire(self):
+        branch = Branch.objects.create(code='north', name='North')
+        with mock.patch('time.monotonic', return_value=1000.0):
+            self.assertEqual(middleware.branch_for_code('north'), branch)
+        # Renamed by another process: no signal reaches this one
+        Branch.objects.filter(pk=branch.pk).update(name='North wing')
+        with mock.patch('time.monotonic', return_value=1000.0 + middleware.BRANCH_CACHE_SECONDS - 1):
+            self.assertEqual(middleware.branch_for_code('north').name, 'North')
+        with mock.patch('time.monotonic', return_value=1000.0 + middleware.BRANCH_CACHE_SECONDS):
+            self.assertEqual(middleware.branch_for_code('north').name, 'North wing')
+
+
+class MasterdataFormTests(TestCase):
+    def setUp(self):
+        self.north = Branch.objects.create(code='north', name='North')
+        self.south = Branch.objects.create(code='south', name='South')
+
+    def test_head_office_can_create_shared_or_branch_rows(self):
+        form = ReferrerForm({'name': 'Dr. A', 'branch': ''})
+        self.assertTrue(form.is_valid())
+        self.assertIsNone(form.save().branch)
+        form = ReferrerForm({'name': 'Dr. B', 'branch': self.south.pk})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save().branch, self.south)
+
+    def test_new_rows_at_a_branch_belong_to_it(self):
+        with using_branch(self.north):
+            form = ReferrerForm()
+            self.assertEqual(form.initial['branch'], self.north.pk)
+            self.assertEqual(list(form.fields['branch'].queryset), [self.north])
+            self.assertFalse(ReferrerForm({'name': 'Dr. A', 'branch': ''}).is_valid())
+            self.assertFalse(ReferrerForm({'name': 'Dr. A', 'branch': self.south.pk}).is_valid())
+            form = ReferrerForm({'name': 'Dr. A', 'branch': self.north.pk})
+            self.assertTrue(form.is_valid())
+            self.assertEqual(form.save().branch, self.north)
+
+    def test_shared_rows_edited_at_a_branch_may_stay_shared(self):
+        shared = Referrer.objects.create(name='Self')
+        with using_branch(self.north):
+            form = ReferrerForm({'name': 'Self (walk-in)', 'branch': ''}, instance=shared)
+            self.assertTrue(form.is_valid())
+            self.assertIsNone(form.save().branch)
+
+    def test_names_are_unique_per_branch(self):
+        Referrer.objects.create(name='Dr. A', branch=self.north)
+        Referrer.objects.create(name='Shared', branch=None)
+        self.assertTrue(ReferrerForm({'name': 'Dr. A', 'branch': self.south.pk}).is_valid())
+        self.assertFalse(ReferrerForm({'name': 'Dr. A', 'branch': self.north.pk}).is_valid())
+        self.assertFalse(ReferrerForm({'name': 'Dr. A', 'branch': ''}).is_valid())
+        self.assertFalse(ReferrerForm({'name': 'Shared', 'branch': self.south.pk}).is_valid())
+
+    def test_database_enforces_uniqueness(self):
+        Referrer.objects.create(name='Dr. A', branch=self.north)
+        Referrer.objects.create(name='Dr. A', branch=self.south)
+        Referrer.objects.create(name='Shared')
+        for branch in (self.north, None):
+            name = 'Shared' if branch is None else 'Dr. A'
+            with self.subTest(branch=branch), self.assertRaises(IntegrityError), transaction.atomic():
+                Referrer.objects.create(name=name, branch=branch)
+
+    @override_settings(BRANCH_CODE='north')
+    def test_create_view_at_a_branch_deployment(self):
+        middleware._branches.clear()
+        self.addCleanup(middleware._branches.clear)
+        response = self.client.post('/settings/referrers/add/', {'name': 'Dr. A', 'branch': self.north.pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Referrer.objects.get(name='Dr. A').branch, self.north)
+        response = self.client.get('/settings/referrers/add/')
+        self.assertContains(response, f'<option value="{self.north.pk}" selected>North</option>', html=True)
@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.core.paginator import Paginator
 from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import reverse
 
@@ -7,9 +8,16 @@ from .models import ExamName, ExamType, Referrer, Sonologist
 from .forms import ExamNameForm, ExamTypeForm, ReferrerForm, SonologistForm
 
 # Generic helpers to reduce repetition
+PAGE_SIZE = 50
+
+
 def _list_view(request, Model, template, context_name='items'):
-    items = Model.active.all()  # Only active
-    return render(request, template, {context_name: items})
+    items = Model.active.all()  # Only active, in name order (see branch_indexes)
+    search = request.GET.get('search', '').strip()
+    if search:
+        items = items.filter(name__icontains=search)
+    page = Paginator(items.only('pk', 'name'), PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(request, template, {context_name: page, 'page': page, 'search': search})
 
 
 def _form_view(request, form_class, template, title, redirect_name):
@@ -1,6 +1,11 @@
 # reports/admin.py
+import json
+
 from django.contrib import admin
-from .models import Report
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+from . import profiling
+from .models import Report, ReportAudit, RequestProfile, ScheduledJob
 
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
@@ -28,3 +33,69 @@ class ReportAdmin(admin.ModelAdmin):
         'sonologist__name',
         'notes'
     )
+
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'task', 'cron', 'is_active', 'last_run_at', 'last_status')
+    list_filter = ('task', 'is_active')
+    readonly_fields = ('last_run_at', 'last_status')
+
+
+@admin.register(ReportAudit)
+class ReportAuditAdmin(admin.ModelAdmin):
+    list_display = ('at', 'report_id', 'action', 'user', 'changes')
+    list_filter = ('action',)
+    search_fields = ('=report_id',)
+    date_hierarchy = 'at'
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'sql_count', 'sql_ms',
+                    'samples', 'user', 'files')
+    list_filter = ('method', 'status_code')
+    search_fields = ('path',)
+    date_hierarchy = 'created_at'
+    list_select_related = ('user',)
+    readonly_fields = ('files', 'slowest_queries')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False  # profiling.prune() removes old rows together with their files
+
+    @admin.display(description='Files')
+    def files(self, obj):
+        return format_html(
+            '<a href="{}">flamegraph</a> · <a href="{}">SQL timeline</a>',
+            reverse('reports:profile_file', args=[obj.pk, 'flamegraph']),
+            reverse('reports:profile_file', args=[obj.pk, 'sql']),
+        )
+
+    @admin.display(description='Slowest queries')
+    def slowest_queries(self, obj):
+        try:
+            with open(profiling.file_path(obj, 'sql')) as f:
+                queries = json.load(f)['queries']
+        except FileNotFoundError:
+            return '-'
+        queries = sorted(queries, key=lambda q: q['duration_ms'], reverse=True)[:10]
+        return format_html('<ol>{}</ol>', format_html_join(
+            '', '<li>{} ms at +{} ms: <code>{}</code><br><small>{}</small></li>',
+            ((q['duration_ms'], q['start_ms'], q['sql'][:300], ' ← '.join(q['origin'])) for q in queries),
+        ))
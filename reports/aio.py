@@ -0,0 +1,51 @@
+# reports/aio.py
+"""
+Helpers for the async views.
+
+The ORM is synchronous, so blocking work runs in pool threads
+(``thread_sensitive=False``) where independent queries overlap instead of
+queueing behind each other on one thread. Each call closes its thread's database
+connection when it finishes, so idle pool threads never hold connections.
+The current branch and other context variables follow the call into the thread.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.views import View
+
+
+def _closing(func):
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return run
+
+
+async def run_query(func, *args, **kwargs):
+    """Run a blocking call in a pool thread with its own database connection."""
+    return await sync_to_async(_closing(func), thread_sensitive=False)(*args, **kwargs)
+
+
+async def gather_queries(*funcs):
+    """Run independent blocking calls concurrently; returns their results in order."""
+    return await asyncio.gather(*(run_query(func) for func in funcs))
+
+
+class ThreadedView(View):
+    """
+    Async view whose synchronous ``render_get()`` runs in a pool thread.
+
+    Under ASGI Django runs plain sync views one at a time on a single shared
+    thread; offloading keeps slow report pages from queueing behind each other
+    or blocking the event loop.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await run_query(self.render_get, request, *args, **kwargs)
+
+    def render_get(self, request, *args, **kwargs):
+        """Build the GET response; runs in a pool thread, so it may query freely."""
+        raise NotImplementedError(f"{type(self).__name__} must define render_get()")
@@ -0,0 +1,155 @@
+# reports/analytics.py
+"""
+Report volume analytics computed with NumPy.
+
+One grouped query (per archive partition) pulls ``(date, sonologist, referrer,
+exam type) -> USG total`` as columns; every statistic is then a vectorised
+group-by over those arrays (``np.bincount`` with weights), never a Python loop
+over reports. NumPy is imported on first use so workers that never open the
+dashboard don't load it.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Count, Q, Sum
+
+from masterdata.models import ExamType, Referrer, Sonologist
+from .archive import partitions, union_all
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MAX_DAYS = 3 * 366  # longest range compute() accepts; its per-sonologist grid is sonologists x days
+
+
+def load_columns(start, end):
+    """Return columnar arrays for reports dated start..end, pre-grouped by the database."""
+    import numpy as np
+
+    rows = list(union_all([
+        qs.values_list('date', 'sonologist_id', 'referred_by_id', 'exam_type_id')
+          .annotate(ultra=Sum('total_ultra'), reports=Count('id'))
+        for qs in partitions(Q(date__gte=start, date__lte=end), start, end)
+    ]))
+    n = len(rows)
+    first = start.toordinal()
+    return {
+        'day': np.fromiter((r[0].toordinal() - first for r in rows), dtype=np.int32, count=n),
+        'sonologist': np.fromiter((r[1] or 0 for r in rows), dtype=np.int64, count=n),
+        'referrer': np.fromiter((r[2] or 0 for r in rows), dtype=np.int64, count=n),
+        'exam_type': np.fromiter((r[3] or 0 for r in rows), dtype=np.int64, count=n),
+        'ultra': np.fromiter((r[4] for r in rows), dtype=np.float64, count=n),
+        'reports': np.fromiter((r[5] for r in rows), dtype=np.float64, count=n),
+    }
+
+
+def _group_totals(keys, weights):
+    """Sum ``weights`` per distinct key: returns (unique keys, totals)."""
+    import numpy as np
+
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights, minlength=len(unique))
+
+
+def _moving_average(series, window):
+    import numpy as np
+
+    out = np.full(series.shape, np.nan)
+    if len(series) >= window:
+        cumsum = np.cumsum(np.insert(series, 0, 0.0))
+        out[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return out
+
+
+def _rounded(values, digits=2):
+    import numpy as np
+
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+def compute(start, end, horizon=14):
+    """Trend, moving averages, weekday seasonality, load percentiles and a forecast."""
+    import numpy as np
+
+    cols = load_columns(start, end)
+    ndays = (end - start).days + 1
+    days = np.arange(ndays)
+    weekday = (start.toordinal() - 1 + days) % 7  # date.toordinal() 1 is a Monday
+
+    # Daily volume series
+    volume = np.bincount(cols['day'], weights=cols['ultra'], minlength=ndays)
+    reports = np.bincount(cols['day'], weights=cols['reports'], minlength=ndays)
+
+    # Linear trend (least squares)
+    slope, intercept = np.polyfit(days, volume, 1) if ndays > 1 else (0.0, float(volume.mean()))
+    trend = intercept + slope * days
+
+    # Weekday seasonality: mean volume per weekday relative to the overall mean
+    per_weekday = np.bincount(weekday, weights=volume, minlength=7) / np.maximum(np.bincount(weekday, minlength=7), 1)
+    overall = volume.mean() if ndays else 0.0
+    seasonal_index = per_weekday / overall if overall else np.ones(7)
+
+    # Seasonal forecast: extend the trend and scale it by the weekday index
+    future = np.arange(ndays, ndays + horizon)
+    future_weekday = (start.toordinal() - 1 + future) % 7
+    forecast = np.clip((intercept + slope * future) * seasonal_index[future_weekday], 0, None)
+
+    # Per-sonologist daily load percentiles (over the days each sonologist worked)
+    sonologist_ids, son_index = np.unique(cols['sonologist'], return_inverse=True)
+    load = np.bincount(son_index * ndays + cols['day'], weights=cols['ultra'],
+                       minlength=len(sonologist_ids) * ndays).reshape(len(sonologist_ids), ndays)
+    worked = np.where(load > 0, load, np.nan)
+    names = dict(Sonologist.objects.filter(pk__in=sonologist_ids.tolist()).values_list('id', 'name'))
+    sonologist_load = []
+    if len(sonologist_ids):
+        p50, p90 = np.nanpercentile(worked, [50, 90], axis=1)
+        for i, sid in enumerate(sonologist_ids.tolist()):
+            sonologist_load.append({
+                'sonologist': names.get(sid, 'Unknown'),
+                'total': int(load[i].sum()),
+                'days_worked': int((load[i] > 0).sum()),
+                'p50': round(float(p50[i]), 1),
+                'p90': round(float(p90[i]), 1),
+                'max': int(load[i].max()),
+            })
+        sonologist_load.sort(key=lambda row: row['total'], reverse=True)
+
+    # Top referrers and exam type mix
+    referrer_ids, referrer_totals = _group_totals(cols['referrer'], cols['ultra'])
+    top = np.argsort(referrer_totals)[::-1][:10]
+    referrer_names = dict(Referrer.objects.filter(pk__in=referrer_ids[top].tolist()).values_list('id', 'name'))
+    exam_type_ids, exam_type_totals = _group_totals(cols['exam_type'], cols['ultra'])
+    exam_type_names = dict(ExamType.objects.filter(pk__in=exam_type_ids.tolist()).values_list('id', 'name'))
+
+    return {
+        'start_date': start,
+        'end_date': end,
+        'days': [start + timedelta(days=int(d)) for d in days],
+        'volume': volume.astype(int).tolist(),
+        'reports': reports.astype(int).tolist(),
+        'moving_average_7': _rounded(_moving_average(volume, 7)),
+        'moving_average_28': _rounded(_moving_average(volume, 28)),
+        'trend': {
+            'slope_per_day': round(float(slope), 4),
+            'values': _rounded(trend),
+        },
+        'weekday_seasonality': [
+            {'weekday': WEEKDAYS[i], 'mean': round(float(per_weekday[i]), 2), 'index': round(float(seasonal_index[i]), 3)}
+            for i in range(7)
+        ],
+        'forecast': [
+            {'date': end + timedelta(days=i + 1), 'total_ultra': round(float(v), 1)}
+            for i, v in enumerate(forecast)
+        ],
+        'sonologist_load': sonologist_load,
+        'top_referrers': [
+            {'referrer': referrer_names.get(int(referrer_ids[i]), 'Unknown'), 'total': int(referrer_totals[i])}
+            for i in top
+        ],
+        'exam_type_mix': [
+            {'exam_type': exam_type_names.get(int(eid), 'Unknown'), 'total': int(total)}
+            for eid, total in zip(exam_type_ids.tolist(), exam_type_totals)
+        ],
+    }
+
+
+def default_range(today=None):
+    today = today or date.today()
+    return today - timedelta(days=364), today
@@ -0,0 +1,190 @@
+# reports/archive.py
+"""
+Yearly archive partitions for Report.
+
+Closed years are moved out of ``reports_report`` into ``reports_report_y<YEAR>``
+tables with the same columns, a date index and a CHECK constraint on the year's
+date range (the same layout on SQLite and PostgreSQL, where the constraint lets
+the planner exclude the table). ``ReportArchive`` keeps each year's row count and
+USG total so all-time totals never scan archived rows.
+
+Report queries go through ``partitions()``, which returns the live table plus only
+the archived years that overlap the requested date range, and ``union_all()``
+to combine them into a single queryset.
+"""
+from datetime import date
+
+from django.apps import apps
+from django.db import connection, models, transaction
+from django.db.models import Q, Sum
+
+from masterdata.tenancy import get_current_branch
+from .models import (
+    ChangeSequence, DailyRollup, Report, ReportArchive, ReportManager, normalize_patient_id, period_values,
+)
+
+_models = {}
+
+
+def table_name(year):
+    return f'{Report._meta.db_table}_y{year}'
+
+
+def archive_model(year):
+    """Unmanaged model for one archived year, with the same fields as Report."""
+    if year in _models:
+        return _models[year]
+
+    attrs = {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {
+            'app_label': 'reports',
+            'db_table': table_name(year),
+            'managed': False,
+            'ordering': ['-date'],
+            'indexes': [
+                models.Index(fields=['date'], name=f'report_y{year}_date_idx'),
+                # Patient history reaches back into closed years
+                models.Index(fields=['patient_key'], name=f'report_y{year}_patient_idx',
+                             condition=Q(patient_key__isnull=False)),
+            ],
+            'constraints': [models.CheckConstraint(
+                condition=Q(date__gte=date(year, 1, 1), date__lte=date(year, 12, 31)),
+                name=f'report_y{year}_date_range',
+            )],
+        }),
+        'objects': ReportManager(),
+    }
+    for field in Report._meta.local_fields:
+        name, path, args, kwargs = field.deconstruct()
+        if field.is_relation:
+            kwargs['to'] = field.related_model
+            kwargs['related_name'] = '+'
+        if kwargs.get('db_index'):
+            kwargs['db_index'] = False  # cold data keeps only the indexes in Meta
+        attrs[name] = field.__class__(*args, **kwargs)
+
+    model = type(f'ArchivedReport{year}', (models.Model,), attrs)
+    # Keep archive models out of the app registry so makemigrations never sees them.
+    del apps.all_models['reports'][model._meta.model_name]
+    apps.clear_cache()
+    _models[year] = model
+    return model
+
+
+def archived_years(start=None, end=None):
+    years = ReportArchive.objects.order_by('year').values_list('year', flat=True)
+    return [
+        year for year in years
+        if (start is None or start.year <= year) and (end is None or end.year >= year)
+    ]
+
+
+def partitions(filters=Q(), start=None, end=None):
+    """Filtered querysets for the live table and every archived year overlapping [start, end]."""
+    querysets = [Report.objects.filter(filters)]
+    for year in archived_years(start, end):
+        querysets.append(archive_model(year).objects.filter(filters))
+    return querysets
+
+
+def union_all(querysets):
+    """Combine per-partition querysets; order_by() on the result orders the union."""
+    if len(querysets) == 1:
+        return querysets[0]
+    first, *rest = (qs.order_by() for qs in querysets)
+    return first.union(*rest, all=True)
+
+
+def total_ultra(filters=Q(), start=None, end=None):
+    return sum(
+        qs.aggregate(total=Sum('total_ultra'))['total'] or 0
+        for qs in partitions(filters, start, end)
+    )
+
+
+def all_time_total_ultra():
+    """All-time USG total: live rows plus the stored totals of archived years."""
+    branch = get_current_branch()
+    if branch is not None:
+        # Archive totals are for all branches; the rollups have them per branch
+        return DailyRollup.objects.filter(branch=branch).aggregate(total=Sum('total_ultra'))['total'] or 0
+    live = Report.objects.aggregate(total=Sum('total_ultra'))['total'] or 0
+    archived = ReportArchive.objects.aggregate(total=Sum('total_ultra'))['total'] or 0
+    return live + archived
+
+
+def _columns(model):
+    return ', '.join(connection.ops.quote_name(f.column) for f in model._meta.local_fields)
+
+
+def ensure_table(year):
+    """Create the year's table, or add any columns and indexes Report has gained since it was created."""
+    model = archive_model(year)
+    table = model._meta.db_table
+    existing = connection.introspection.table_names()
+    with connection.schema_editor() as editor:
+        if table not in existing:
+            editor.create_model(model)
+            return model
+        with connection.cursor() as cursor:
+            columns = {c.name for c in connection.introspection.get_table_description(cursor, table)}
+            constraints = connection.introspection.get_constraints(cursor, table)
+        added = [field for field in model._meta.local_fields if field.column not in columns]
+        for field in added:
+            editor.add_field(model, field)
+        for index in model._meta.indexes:
+            if index.name not in constraints:
+                editor.add_index(model, index)
+    fill_derived(model, {field.name for field in added})
+    return model
+
+
+def fill_derived(model, names):
+    """Compute newly added derived columns (Report.DERIVED_FIELDS) on rows that predate them."""
+    rows = model._base_manager.order_by()
+    if names & set(Report.PERIOD_FIELDS):
+        for day in rows.values_list('date', flat=True).distinct():
+            rows.filter(date=day).update(**period_values(day))
+    if 'patient_key' in names:
+        for id_number in rows.exclude(id_number=None).values_list('id_number', flat=True).distinct():
+            rows.filter(id_number=id_number).update(patient_key=normalize_patient_id(id_number))
+
+
+def archive_year(year):
+    """Move every live report dated in ``year`` into its archive table. Returns rows moved."""
+    start, end = date(year, 1, 1), date(year, 12, 31)
+    live = Report._meta.db_table
+    model = ensure_table(year)  # DDL first: SQLite's schema editor can't run inside atomic()
+    with transaction.atomic():
+        columns = _columns(model)
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            # Raw SQL on purpose: archiving is a move, not a delete, so no tombstones.
+            cursor.execute(
+                f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+                f'SELECT {columns} FROM {quote(live)} WHERE {quote("date")} BETWEEN %s AND %s',
+                [start, end],
+            )
+            cursor.execute(f'DELETE FROM {quote(live)} WHERE {quote("date")} BETWEEN %s AND %s', [start, end])
+            moved = cursor.rowcount
+        if moved:
+            # The raw SQL bypasses Report.save(); advance the data version here so cached
+            # pages (reports.caching) stop showing the moved rows as live.
+            ChangeSequence.next(Report.CHANGE_STREAM)
+
+        totals = model.objects.aggregate(count=models.Count('pk'), total=Sum('total_ultra'))
+        ReportArchive.objects.update_or_create(year=year, defaults={
+            'table_name': model._meta.db_table,
+            'report_count': totals['count'],
+            'total_ultra': totals['total'] or 0,
+        })
+    return moved
+
+
+def sync_tables(**kwargs):
+    """post_migrate hook: keep archive tables in step with Report's columns."""
+    if ReportArchive._meta.db_table not in connection.introspection.table_names():
+        return
+    for year in ReportArchive.objects.values_list('year', flat=True):
+        ensure_table(year)
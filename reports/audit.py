@@ -0,0 +1,180 @@
+# reports/audit.py
+"""
+Append-only audit log of Report changes.
+
+``Report.save()`` already reads the stored row to check its version, so the
+diff against it costs no extra query. A save or delete inserts its entry in
+the same transaction, so a committed change always has its entry and a rolled
+back one leaves none.
+
+Bulk changes (``record_updates()``, used by the master data merge) are handed
+on commit to a background writer thread instead, which bulk-inserts them in
+batches of AUDIT_BATCH_SIZE or every AUDIT_FLUSH_SECONDS, whichever comes
+first. ``flush()`` blocks until everything queued so far is written; it runs
+at exit and is what management commands and shells should call before reading
+the log.
+
+The acting user comes from ``reports.middleware.AuditUserMiddleware``;
+changes made outside a request (commands, the scheduler) have no user.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import ReportAudit
+
+logger = logging.getLogger(__name__)
+
+# The request, not request.user: asgiref inspects context values when it switches
+# threads, which would evaluate the lazy user on the event loop.
+_current_request = ContextVar('audit_request', default=None)
+
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_current_user():
+    # request.user is lazy: only a request that saves a report pays for the lookup
+    user = getattr(_current_request.get(), 'user', None)
+    return user if user is not None and user.is_authenticated else None
+
+
+def set_current_request(request):
+    """Make ``request.user`` the acting user; returns a token for reset_current_request()."""
+    return _current_request.set(request)
+
+
+def reset_current_request(token):
+    _current_request.reset(token)
+
+
+def _encode(changes):
+    return json.dumps(changes, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def _diff(old, new):
+    return {field: [old[field], value] for field, value in new.items() if old.get(field) != value}
+
+
+def _non_empty(values):
+    return {field: value for field, value in values.items() if value not in (None, '')}
+
+
+def record_save(report, created):
+    """Insert the entry for a report save; called inside the saving transaction."""
+    if created:
+        action, changes = ReportAudit.CREATE, _non_empty(report.tracked_values())
+    else:
+        action, changes = ReportAudit.UPDATE, _diff(report._previous, report.tracked_values())
+        if not changes:
+            return
+    _record(report.pk, action, changes)
+
+
+def record_delete(report):
+    """Insert the entry for a report delete; called inside the deleting transaction."""
+    _record(report.pk, ReportAudit.DELETE, _non_empty(report.tracked_values()))
+
+
+def record_updates(changes):
+    """UPDATE entries for changes made by queryset updates, as {report_id: {field: [old, new]}}."""
+    user = get_current_user()
+    at = timezone.now()
+    entries = [_entry(report_id, ReportAudit.UPDATE, diff, user, at) for report_id, diff in changes.items()]
+    transaction.on_commit(lambda: _enqueue(*entries))
+
+
+def _record(report_id, action, changes):
+    _entry(report_id, action, changes, get_current_user(), timezone.now()).save()
+
+
+def _entry(report_id, action, changes, user, at):
+    return ReportAudit(
+        report_id=report_id,
+        action=action,
+        user_id=user.pk if user else None,
+        at=at,
+        changes=_encode(changes),
+    )
+
+
+def _enqueue(*entries):
+    for entry in entries:
+        _queue.put(entry)
+    _start_writer()
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name='report-audit-writer', daemon=True)
+            _writer.start()
+
+
+def _write(batch):
+    try:
+        ReportAudit.objects.bulk_create(batch)
+    except Exception:
+        logger.exception("Could not write %d audit entries", len(batch))
+        connections.close_all()
+
+
+def _run():
+    size = settings.AUDIT_BATCH_SIZE
+    interval = settings.AUDIT_FLUSH_SECONDS
+    while True:
+        batch, waiters = [], []
+        item = _queue.get()
+        deadline = time.monotonic() + interval
+        while True:
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                batch.append(item)
+            remaining = deadline - time.monotonic()
+            if waiters or len(batch) >= size or remaining <= 0:
+                break
+            try:
+                item = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        if batch:
+            _write(batch)
+        for waiter in waiters:
+            waiter.set()
+
+
+def flush(timeout=10):
+    """Write every entry queued so far; returns False if the writer did not finish in time."""
+    if _writer is None or not _writer.is_alive():
+        batch = []
+        while True:
+            try:
+                item = _queue.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(item, threading.Event):
+                batch.append(item)
+        if batch:
+            _write(batch)
+        return True
+    done = threading.Event()
+    _queue.put(done)
+    return done.wait(timeout)
+
+
+atexit.register(flush)
+
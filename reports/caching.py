@@ -0,0 +1,178 @@
+# reports/caching.py
+"""
+Page cache and conditional GET for the report pages.
+
+Every cached page is keyed by the URL path, the branch, the normalized query string
+and the *data version*: the 'report' and 'masterdata' ChangeSequence counters,
+which move on every save or delete. A change anywhere makes every old key
+unreachable, so entries never need invalidating; they just expire. The same
+version is the ETag (and the counters' update time is Last-Modified), so a
+browser revisiting an unchanged page gets a 304 without the view running at all.
+
+Pages are neither cached nor served from the cache while a flash message is
+pending, so the message is shown (and consumed) by a real render.
+
+A miss renders under the key's single-flight lock (reports.locks): when several
+people open the same month-end report or PDF at once, one worker renders it and
+the others wait, then serve its cached copy.
+"""
+import hashlib
+from datetime import date
+from functools import wraps
+from inspect import iscoroutinefunction
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition
+
+from .aio import run_query
+from .locks import SingleFlight
+from .models import MASTERDATA_STREAM, ChangeSequence, Report
+
+STREAMS = (Report.CHANGE_STREAM, MASTERDATA_STREAM)
+
+
+def data_version(request=None):
+    """(version string, last modified) for the report and masterdata streams; memoized per request."""
+    if request is not None and hasattr(request, '_data_version'):
+        return request._data_version
+    values = {name: (value, updated) for name, value, updated in
+              ChangeSequence.objects.filter(name__in=STREAMS).values_list('name', 'value', 'updated_at')}
+    version = '.'.join(str(values.get(name, (0, None))[0]) for name in STREAMS)
+    modified = max((updated for _, updated in values.values() if updated), default=None)
+    if request is not None:
+        request._data_version = (version, modified)
+    return version, modified
+
+
+def query_key(request, exclude=()):
+    """Stable digest of the GET parameters: sorted, blanks dropped."""
+    items = sorted(
+        (key, value)
+        for key in request.GET
+        if key not in exclude
+        for value in request.GET.getlist(key)
+        if value != ''
+    )
+    return hashlib.sha1(urlencode(items).encode()).hexdigest()
+
+
+def page_key(request):
+    branch = getattr(request, 'branch', None)
+    parts = [
+        request.path,
+        branch.pk if branch else 'all',
+        data_version(request)[0],
+        date.today().isoformat(),  # pages default to today's date range
+        query_key(request),
+    ]
+    return 'page:' + hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def _has_pending_messages(request):
+    return bool(len(messages.get_messages(request)))
+
+
+def _etag(request, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    return page_key(request)[5:]
+
+
+def _last_modified(request, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    return data_version(request)[1]
+
+
+def _cacheable(request):
+    if getattr(request, 'profiling', False):
+        return False
+    return request.method in ('GET', 'HEAD') and not _has_pending_messages(request)
+
+
+CACHED_HEADERS = ('Content-Type', 'Content-Disposition')
+
+
+def _store(request, response):
+    if response.status_code == 200 and not response.streaming and not _has_pending_messages(request):
+        headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+        cache.set(page_key(request), (response.content, headers), settings.PAGE_CACHE_TIMEOUT)
+
+
+def _cached_response(request):
+    entry = cache.get(page_key(request))
+    if entry is None:
+        return None
+    content, headers = entry
+    return HttpResponse(content, headers=headers)
+
+
+def cached_page(view_func):
+    """Serve a GET view (page or document export) from the cache, with ETag / Last-Modified and 304s."""
+    conditional = condition(etag_func=_etag, last_modified_func=_last_modified)
+
+    if iscoroutinefunction(view_func):
+        async def cached(request, *args, **kwargs):
+            response = await run_query(_cached_response, request)
+            if response is not None:
+                return response
+            flight = SingleFlight(page_key(request))
+            await run_query(flight.acquire)
+            try:
+                # Rendered by another request while this one waited
+                response = await run_query(_cached_response, request)
+                if response is not None:
+                    return response
+                response = await view_func(request, *args, **kwargs)
+                await run_query(_store, request, response)
+            finally:
+                flight.release()
+            return response
+
+        checked = conditional(cached)
+
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            # Session, message and version lookups block: do them in a thread up front, after
+            # which the ETag functions only read values memoized on the request.
+            if not await run_query(lambda: _cacheable(request) and data_version(request)):
+                return await view_func(request, *args, **kwargs)
+            return await checked(request, *args, **kwargs)
+
+        return wrapper
+
+    @wraps(view_func)
+    def cached(request, *args, **kwargs):
+        response = _cached_response(request)
+        if response is not None:
+            return response
+        with SingleFlight(page_key(request)):
+            response = _cached_response(request)
+            if response is not None:
+                return response
+            response = view_func(request, *args, **kwargs)
+            _store(request, response)
+        return response
+
+    checked = conditional(cached)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable(request):
+            return view_func(request, *args, **kwargs)
+        return checked(request, *args, **kwargs)
+
+    return wrapper
+
+
+def page_cache_context(request):
+    """Context processor: ``data_version`` and ``filter_key`` for ``{% cache %}`` fragments."""
+    return {
+        'data_version': SimpleLazyObject(lambda: data_version(request)[0]),
+        'filter_key': SimpleLazyObject(lambda: query_key(request, exclude=('page',))),
+    }
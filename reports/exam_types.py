@@ -0,0 +1,156 @@
+# reports/exam_types.py
+"""
+Two-phase grouping for the exam-type report (USG totals per sonologist, broken
+down by exam type).
+
+Phase one is a single grouped query for per-sonologist subtotals that also
+carries the grand total and the number of sonologists as window aggregates, so
+a page of the report costs one query however many sonologists there are.
+Phase two fetches the exam-type breakdown only for the sonologists being shown
+(the current page, or one batch at a time for exports).
+"""
+from django.db.models import F, Func, IntegerField, Q, Sum
+
+from .archive import partitions, union_all
+
+EXPORT_BATCH = 50
+
+
+class OverAll(Func):
+    """``FUNC(<aggregate>) OVER ()``: a value over all groups, repeated on every group row."""
+    template = '%(function)s(%(expressions)s) OVER ()'
+    output_field = IntegerField()
+    contains_over_clause = True
+
+
+def _subtotal_queryset(qs):
+    return qs.values('sonologist_id').annotate(
+        sonologist_name=F('sonologist__name'),
+        total_usg=Sum('total_ultra'),
+        grand_total=OverAll(Sum('total_ultra'), function='SUM'),
+        groups=OverAll(Sum('total_ultra'), function='COUNT'),
+    )
+
+
+class SonologistSubtotals:
+    """
+    Phase one, as a sequence Paginator can slice.
+
+    With only the live table in range, the requested page is fetched up front and
+    its rows carry the count and grand total, so Paginator's count() and slice
+    are answered from that one query. Without ``per_page`` (exports) every row is
+    read at once. When archived years are in range the window values are per
+    partition, so the (small) subtotal rows of every partition are merged in
+    Python instead.
+    """
+
+    def __init__(self, filters, start=None, end=None, page=None, per_page=None):
+        querysets = partitions(filters, start, end)
+        self._rows = None
+        self._cached = {}
+        self._count = None
+        self.grand_total = 0
+
+        if len(querysets) > 1:
+            self._rows = self._merge(union_all([_subtotal_queryset(qs) for qs in querysets])
+                                     .order_by('sonologist_name', 'sonologist_id'))
+            self._count = len(self._rows)
+            self.grand_total = sum(row['total_usg'] for row in self._rows)
+            return
+
+        self._qs = _subtotal_queryset(querysets[0]).order_by('sonologist_name', 'sonologist_id')
+        if per_page is None:
+            self._rows = list(self._qs)
+            self._count = len(self._rows)
+            self.grand_total = self._rows[0]['grand_total'] if self._rows else 0
+            return
+
+        try:
+            number = max(int(page or 1), 1)
+        except (TypeError, ValueError):
+            number = 1
+        self[(number - 1) * per_page:number * per_page]
+        if self._count is None:
+            # Requested page is past the end (or there is no data): read the totals from the first row
+            self[0:per_page]
+        if self._count is None:
+            self._count = 0
+
+    @staticmethod
+    def _merge(rows):
+        merged = []
+        for row in rows:
+            if merged and merged[-1]['sonologist_id'] == row['sonologist_id']:
+                # Same sonologist from another archive partition
+                merged[-1]['total_usg'] += row['total_usg']
+            else:
+                merged.append(dict(row))
+        return merged
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if self._rows is not None:
+            return self._rows[index]
+        key = (index.start, index.stop)
+        if key not in self._cached:
+            rows = list(self._qs[index])
+            if rows:
+                self._count, self.grand_total = rows[0]['groups'], rows[0]['grand_total']
+            self._cached[key] = rows
+        return self._cached[key]
+
+    def __iter__(self):
+        return iter(self._rows if self._rows is not None else self._qs)
+
+
+def exam_type_detail(filters, start, end, sonologist_ids):
+    """Phase two: {sonologist_id: [{"exam_type", "total_usg"}, ...]} for the given sonologists only."""
+    ids = [sid for sid in sonologist_ids if sid is not None]
+    scope = Q(sonologist_id__in=ids)
+    if None in sonologist_ids:
+        scope |= Q(sonologist__isnull=True)
+
+    rows = union_all([
+        qs.filter(scope)
+          .values('sonologist_id', 'exam_type_id')
+          .annotate(exam_type_name=F('exam_type__name'), total_usg=Sum('total_ultra'))
+        for qs in partitions(filters, start, end)
+    ]).order_by('sonologist_id', 'exam_type_name', 'exam_type_id')
+
+    detail = {}
+    for r in rows:
+        exams = detail.setdefault(r['sonologist_id'], [])
+        exam_type = r['exam_type_name'] or 'Unknown'
+        if exams and exams[-1]['exam_type'] == exam_type:
+            # Same group from another archive partition
+            exams[-1]['total_usg'] += r['total_usg']
+        else:
+            exams.append({'exam_type': exam_type, 'total_usg': r['total_usg']})
+    return detail
+
+
+def grouped(filters, start, end, subtotals):
+    """[(sonologist name, {"exams": [...], "total_usg": n}), ...] for the given subtotal rows."""
+    detail = exam_type_detail(filters, start, end, [row['sonologist_id'] for row in subtotals])
+    return [
+        (row['sonologist_name'] or 'Unknown',
+         {'exams': detail.get(row['sonologist_id'], []), 'total_usg': row['total_usg']})
+        for row in subtotals
+    ]
+
+
+def iter_grouped(filters, start, end, subtotals, batch=EXPORT_BATCH):
+    """Like grouped() over every subtotal row, running phase two one batch of sonologists at a time."""
+    pending = []
+    for row in subtotals:
+        pending.append(row)
+        if len(pending) == batch:
+            yield from grouped(filters, start, end, pending)
+            pending = []
+    if pending:
+        yield from grouped(filters, start, end, pending)
@@ -0,0 +1,160 @@
+# reports/exporters.py
+"""
+Export format registry.
+
+The ``<str:fmt>`` URL segment of the export views is looked up here. Each format
+maps to a ``Writer`` that takes a row iterator and returns the response:
+
+- text formats (csv, jsonl) stream chunk by chunk, optionally gzipped, so
+  memory stays constant however many rows are exported;
+- document formats (xlsx, pdf) need the whole table, so they materialise the
+  rows and also get the Grand Total footer rows (``include_totals``).
+
+Writers are registered by dotted path and imported on first use, so a worker
+that never exports never loads openpyxl or xhtml2pdf.
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+CHUNK_SIZE = 64 * 1024
+
+_writers = {}
+
+
+def register(fmt, writer):
+    """Register a Writer class (or its dotted path) for a format."""
+    _writers[fmt.lower()] = writer
+
+
+def get_writer(fmt):
+    """Return a Writer instance for ``fmt``, importing it on first use, or None."""
+    fmt = fmt.lower()
+    writer = _writers.get(fmt)
+    if isinstance(writer, str):
+        writer = _writers[fmt] = import_string(writer)
+    return writer() if writer else None
+
+
+def wants_gzip(request):
+    return request.GET.get('gzip') in ('1', 'true', 'yes')
+
+
+def is_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+
+async def async_chunks(chunks):
+    """
+    Hand a sync chunk iterator to the ASGI server one chunk at a time.
+
+    Given a sync iterator under ASGI, Django reads the whole body into memory
+    first. Here each next() runs on the shared sync thread, so the DB cursor
+    behind the rows is always used from the thread that opened it.
+    """
+    chunks = iter(chunks)
+    pull = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    while (chunk := await pull(chunks, done)) is not done:
+        yield chunk
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class Writer:
+    content_type = 'application/octet-stream'
+    extension = ''
+    include_totals = False
+
+    def chunks(self, rows, headers):
+        """
+        Yield the encoded body in chunks of roughly CHUNK_SIZE bytes.
+
+        Streaming formats define this; document formats override export() instead.
+        """
+        raise NotImplementedError(f"{type(self).__name__} must define chunks() or override export()")
+
+    def export(self, rows, headers, filename, extra_context=None, template_name=None, compress=False, asgi=False):
+        body = self.chunks(rows, headers)
+        filename = f'{filename}.{self.extension}'
+        content_type = self.content_type
+        if compress:
+            body = gzip_chunks(body)
+            filename += '.gz'
+            content_type = 'application/gzip'
+        if asgi:
+            body = async_chunks(body)
+
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+        return response
+
+
+class CsvWriter(Writer):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def chunks(self, rows, headers):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class JsonLinesWriter(Writer):
+    content_type = 'application/x-ndjson'
+    extension = 'jsonl'
+
+    def chunks(self, rows, headers):
+        lines, size = [], 0
+        for row in rows:
+            line = json.dumps(dict(zip(headers, row)), default=str, ensure_ascii=False) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                yield ''.join(lines).encode()
+                lines, size = [], 0
+        yield ''.join(lines).encode()
+
+
+class XlsxWriter(Writer):
+    include_totals = True
+
+    def export(self, rows, headers, filename, extra_context=None, template_name=None, compress=False, asgi=False):
+        from .utils import export_to_excel
+        return export_to_excel(list(rows), headers, filename)
+
+
+class PdfWriter(Writer):
+    include_totals = True
+
+    def export(self, rows, headers, filename, extra_context=None, template_name=None, compress=False, asgi=False):
+        from .utils import export_to_pdf
+        return export_to_pdf(list(rows), headers, filename, extra_context=extra_context,
+                             template_name=template_name or "reports/report_pdf.html")
+
+
+register('csv', 'reports.exporters.CsvWriter')
+register('jsonl', 'reports.exporters.JsonLinesWriter')
+register('xlsx', 'reports.exporters.XlsxWriter')
+register('pdf', 'reports.exporters.PdfWriter')
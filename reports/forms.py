@@ -1,6 +1,8 @@
 from django import forms
 from django.utils import timezone
+from . import analytics, pivot
 from .models import Report
+from masterdata.forms import ActiveChoiceField
 from masterdata.models import Referrer, Sonologist, ExamName, ExamType
 
 INPUT_CLASS = 'form-control'
@@ -32,6 +34,12 @@ class ReportForm(forms.ModelForm):
             'total_ultra',
             'notes'
         ]
+        field_classes = {
+            'exam_name': ActiveChoiceField,
+            'exam_type': ActiveChoiceField,
+            'referred_by': ActiveChoiceField,
+            'sonologist': ActiveChoiceField,
+        }
         widgets = {
             'id_number': forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Patient ID'}),
             'exam_name': forms.Select(attrs={'class': 'form-select'}),
@@ -70,6 +78,35 @@ class ReportForm(forms.ModelForm):
         self.fields['sonologist'].required = True
 
 
+class ReportEditForm(ReportForm):
+    """ReportForm plus the version the user started from, checked when saving (see Report.save)."""
+    version = forms.IntegerField(widget=forms.HiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault('version', self.instance.version)
+
+    def conflicts(self, current):
+        """(label, your value, saved value) for each field where this form differs from ``current``."""
+        rows = []
+        for name in self.Meta.fields:
+            field = self.fields[name]
+            mine = self._display(self.cleaned_data.get(name))
+            theirs = self._display(getattr(current, name))
+            if mine != theirs:
+                rows.append((field.label, mine, theirs))
+        return rows
+
+    @staticmethod
+    def _display(value):
+        if value in (None, ''):
+            return '—'
+        if hasattr(value, 'strftime'):
+            return value.strftime('%d/%m/%Y')
+        return str(value)
+
+
 class ReportFilterForm(forms.Form):
     start_date = forms.DateField(
         required=False,
@@ -89,26 +126,26 @@ class ReportFilterForm(forms.Form):
             'placeholder': 'DD/MM/YYYY'
         })
     )
-    referred_by = forms.ModelChoiceField(
+    referred_by = ActiveChoiceField(
         required=False,
         queryset=Referrer.active.all(),
         empty_label="All Doctors",
         widget=forms.Select(attrs={'class': 'form-select'})
     )
-    sonologist = forms.ModelChoiceField(
+    sonologist = ActiveChoiceField(
         required=False,
         queryset=Sonologist.active.all(),
         empty_label="All Sonologists",
         widget=forms.Select(attrs={'class': 'form-select'})
     )
-    exam_type = forms.ModelChoiceField(
+    exam_type = ActiveChoiceField(
         required=False,
         queryset=ExamType.active.all(),
         empty_label="All Exam Types",
         widget=forms.Select(attrs={'class': 'form-select'})
     )
 
-    exam_name = forms.ModelChoiceField(
+    exam_name = ActiveChoiceField(
         required=False,
         queryset=ExamName.active.all(),
         empty_label="All Exam Names",
@@ -145,7 +182,7 @@ class DailyReportFilterForm(forms.Form):
             'placeholder': 'DD/MM/YYYY'
         })
     )
-    referred_by = forms.ModelChoiceField(
+    referred_by = ActiveChoiceField(
         required=False,
         queryset=Referrer.active.all(),
         empty_label="All Doctors",
@@ -173,10 +210,10 @@ class ExamTypeReportFilterForm(forms.Form):
         })
         
     )
-    sonologist = forms.ModelChoiceField(
+    sonologist = ActiveChoiceField(
         queryset=Sonologist.active.all(), required=False, empty_label="All"
     )
-    exam_type = forms.ModelChoiceField(
+    exam_type = ActiveChoiceField(
         queryset=ExamType.active.all(), required=False, empty_label="All"
     )
 
@@ -199,9 +236,98 @@ class MonthlyReportFilterForm(forms.Form):
             'placeholder': 'DD/MM/YYYY'
         })
     )
-    sonologist = forms.ModelChoiceField(
+    sonologist = ActiveChoiceField(
         required=False,
         queryset=Sonologist.active.all(),
         empty_label="All Sonologists",
         widget=forms.Select(attrs={'class': 'form-select'})
     )
+
+
+class BranchSummaryFilterForm(forms.Form):
+    start_date = forms.DateField(
+        required=False,
+        input_formats=['%d/%m/%Y'],
+        widget=forms.TextInput(attrs={
+            'type': 'text',
+            'class': 'form-control date-picker',
+            'placeholder': 'DD/MM/YYYY'
+        })
+    )
+    end_date = forms.DateField(
+        required=False,
+        input_formats=['%d/%m/%Y'],
+        widget=forms.TextInput(attrs={
+            'type': 'text',
+            'class': 'form-control date-picker',
+            'placeholder': 'DD/MM/YYYY'
+        })
+    )
+
+
+class PivotForm(forms.Form):
+    DIMENSION_CHOICES = [(name, label) for name, (label, _, _) in pivot.DIMENSIONS.items()]
+
+    rows = forms.ChoiceField(choices=DIMENSION_CHOICES, initial='referrer', required=False,
+                             widget=forms.Select(attrs={'class': 'form-select'}))
+    columns = forms.ChoiceField(choices=DIMENSION_CHOICES, initial='exam_name', required=False,
+                                widget=forms.Select(attrs={'class': 'form-select'}))
+    layer = forms.ChoiceField(choices=[('', '--- None ---')] + DIMENSION_CHOICES, required=False,
+                              label='Split by', widget=forms.Select(attrs={'class': 'form-select'}))
+    measure = forms.ChoiceField(choices=list(pivot.MEASURES.items()), initial='usg', required=False,
+                                widget=forms.Select(attrs={'class': 'form-select'}))
+    start_date = forms.DateField(
+        required=False,
+        input_formats=['%d/%m/%Y'],
+        widget=forms.TextInput(attrs={
+            'type': 'text',
+            'class': 'form-control date-picker',
+            'placeholder': 'DD/MM/YYYY'
+        })
+    )
+    end_date = forms.DateField(
+        required=False,
+        input_formats=['%d/%m/%Y'],
+        widget=forms.TextInput(attrs={
+            'type': 'text',
+            'class': 'form-control date-picker',
+            'placeholder': 'DD/MM/YYYY'
+        })
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        for name in ('rows', 'columns', 'measure'):
+            cleaned[name] = cleaned.get(name) or self.fields[name].initial
+        dims = [cleaned.get(name) for name in ('rows', 'columns', 'layer') if cleaned.get(name)]
+        if len(set(dims)) != len(dims):
+            raise forms.ValidationError('Rows, columns and split must be different dimensions.')
+        sd, ed = cleaned.get('start_date'), cleaned.get('end_date')
+        if sd and ed and sd > ed:
+            raise forms.ValidationError('Start date must be on or before end date.')
+        return cleaned
+
+
+class AnalyticsFilterForm(forms.Form):
+    start_date = forms.DateField(required=False, input_formats=['%d/%m/%Y', '%Y-%m-%d'])
+    end_date = forms.DateField(required=False, input_formats=['%d/%m/%Y', '%Y-%m-%d'])
+    horizon = forms.IntegerField(required=False, min_value=1, max_value=90)
+
+    def clean(self):
+        cleaned = super().clean()
+        if 'start_date' in self.errors or 'end_date' in self.errors:
+            return cleaned
+        # Missing dates default to the last year; the effective range is what gets checked
+        default_start, default_end = analytics.default_range(timezone.localdate())
+        sd = cleaned['start_date'] = cleaned.get('start_date') or default_start
+        ed = cleaned['end_date'] = cleaned.get('end_date') or default_end
+        if sd > ed:
+            raise forms.ValidationError('start_date must be on or before end_date.')
+        if (ed - sd).days + 1 > analytics.MAX_DAYS:
+            raise forms.ValidationError(f'The range can span at most {analytics.MAX_DAYS} days.')
+        return cleaned
+
+
+class StatementMonthForm(forms.Form):
+    month = forms.DateField(input_formats=['%Y-%m', '%m/%Y'],
+                            widget=forms.DateInput(attrs={'type': 'month', 'class': 'form-control'}, format='%Y-%m'))
@@ -0,0 +1,145 @@
+# reports/locks.py
+"""
+File locks shared by all worker processes on the box.
+
+``SingleFlight`` coalesces identical heavy requests. The first request for a
+page key takes the key's lock and renders. Identical requests arriving
+meanwhile wait on the lock instead of rendering too, then find the page in the
+cache (see reports.caching.cached_page). The master data merge holds one
+so that only one merge runs at a time.
+
+``admit_export`` caps how many exports render at once. Each export holds one of
+EXPORT_CONCURRENCY slot locks until its response is closed; with every slot
+taken the request gets 503 and Retry-After straight away, leaving the workers
+to report entry.
+
+The locks are flock()s on files in LOCK_DIR, so a worker that dies releases
+its locks with it. Without fcntl (Windows development boxes) nothing is locked.
+"""
+import hashlib
+import os
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .aio import run_query
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+POLL_SECONDS = 0.05
+
+
+def _open(name):
+    os.makedirs(settings.LOCK_DIR, exist_ok=True)
+    return open(os.path.join(settings.LOCK_DIR, name), 'a')
+
+
+def _try_lock(handle):
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _unlock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    handle.close()
+
+
+class SingleFlight:
+    """Exclusive lock on one cache key; acquire() blocks, so async callers run it in a thread."""
+
+    def __init__(self, key):
+        self.name = 'flight-' + hashlib.sha1(key.encode()).hexdigest() + '.lock'
+        self.handle = None
+
+    def acquire(self, wait=None):
+        """Wait up to ``wait`` seconds (SINGLE_FLIGHT_WAIT) for the lock; False if it stayed taken."""
+        if fcntl is None:
+            return True
+        wait = settings.SINGLE_FLIGHT_WAIT if wait is None else wait
+        handle = _open(self.name)
+        deadline = time.monotonic() + wait
+        while not _try_lock(handle):
+            if time.monotonic() >= deadline:
+                handle.close()
+                return False
+            time.sleep(POLL_SECONDS)
+        self.handle = handle
+        return True
+
+    def release(self):
+        if self.handle is not None:
+            _unlock(self.handle)
+            self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def take_export_slot():
+    """An open, locked slot file, or None when EXPORT_CONCURRENCY exports are already running."""
+    if fcntl is None:
+        return open(os.devnull)
+    for slot in range(settings.EXPORT_CONCURRENCY):
+        handle = _open(f'export-slot-{slot}.lock')
+        if _try_lock(handle):
+            return handle
+        handle.close()
+    return None
+
+
+def _busy():
+    response = HttpResponse("Too many exports are running right now; please try again shortly.",
+                            status=503, content_type='text/plain')
+    response['Retry-After'] = str(settings.EXPORT_RETRY_AFTER)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def _hold_until_closed(response, slot):
+    # Streaming exports render while the body is sent; close() runs after the last chunk
+    response._resource_closers.append(lambda: _unlock(slot))
+    return response
+
+
+def admit_export(view_func):
+    """Run an export view only while an export slot is free; otherwise answer 503."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            slot = await run_query(take_export_slot)
+            if slot is None:
+                return _busy()
+            try:
+                response = await view_func(request, *args, **kwargs)
+            except BaseException:
+                _unlock(slot)
+                raise
+            return _hold_until_closed(response, slot)
+        return wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        slot = take_export_slot()
+        if slot is None:
+            return _busy()
+        try:
+            response = view_func(request, *args, **kwargs)
+        except BaseException:
+            _unlock(slot)
+            raise
+        return _hold_until_closed(response, slot)
+    return wrapper
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import localdate
+
+from reports import archive
+from reports.models import Report
+
+
+class Command(BaseCommand):
+    help = (
+        "Move closed years of reports into yearly archive tables (reports_report_y<YEAR>). "
+        "Archived rows stay visible to the report pages and exports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, action='append', help='Archive this year (repeatable).')
+        parser.add_argument(
+            '--keep-years',
+            type=int,
+            default=2,
+            help='When --year is not given, archive every year older than this many years (default: 2).',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        current = localdate().year
+        if options['year']:
+            years = sorted(set(options['year']))
+        else:
+            cutoff = current - options['keep_years']
+            years = sorted({d.year for d in Report.objects.filter(date__year__lte=cutoff).dates('date', 'year')})
+
+        if any(year >= current for year in years):
+            raise CommandError(f'Only closed years can be archived (before {current}).')
+        if not years:
+            self.stdout.write('Nothing to archive.')
+            return
+
+        for year in years:
+            if options['dry_run']:
+                count = Report.objects.filter(date__year=year).count()
+                self.stdout.write(f'{year}: would move {count} reports to {archive.table_name(year)}')
+                continue
+            moved = archive.archive_year(year)
+            self.stdout.write(self.style.SUCCESS(f'{year}: moved {moved} reports to {archive.table_name(year)}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from masterdata.models import Branch
+from reports import archive, rollups
+from reports.models import ReferrerStatement, Report
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign every report without a branch (live and archived) to a branch, creating "
+        "the branch if needed. Run once on an existing single-branch install before "
+        "setting BRANCH_CODE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('code', help='Branch code, e.g. "main".')
+        parser.add_argument('--name', help='Branch name when creating it (default: the code).')
+
+    def handle(self, *args, **options):
+        branch, created = Branch.objects.get_or_create(
+            code=options['code'], defaults={'name': options['name'] or options['code']},
+        )
+        if created:
+            self.stdout.write(f'Created branch {branch.name}.')
+
+        with transaction.atomic():
+            # Queryset updates on purpose: a branch assignment is not a content change for the change feed.
+            moved = Report.objects.filter(branch__isnull=True).update(branch=branch)
+            for year in archive.archived_years():
+                moved += archive.archive_model(year).objects.filter(branch__isnull=True).update(branch=branch)
+            ReferrerStatement.objects.filter(branch__isnull=True).update(branch=branch)
+            rollups.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Assigned {moved} reports to {branch.name}.'))
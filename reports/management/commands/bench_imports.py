@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules a worker should only import once it serves an export (or analytics).
+HEAVY_MODULES = ('openpyxl', 'xhtml2pdf', 'reportlab', 'html5lib', 'pyhanko', 'cryptography', 'numpy')
+
+BOOT_SCRIPT = """
+import resource, sys
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns  # import every URLconf and view module, as the first request would
+print('RSS_KB', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+print('LOADED', ','.join(sorted({m.split('.')[0] for m in sys.modules})))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot a worker-equivalent interpreter under `python -X importtime`, then report "
+        "import time, peak RSS and the slowest imports. Fails if an export backend "
+        "(openpyxl, xhtml2pdf, ...) is imported at boot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='How many of the slowest imports to list.')
+        parser.add_argument('--allow-heavy', action='store_true', help='Report heavy imports without failing.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'usg_records.settings'))
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode:
+            raise CommandError(proc.stderr[-2000:])
+
+        imports = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            # Nested imports are indented by two spaces per level after the separator.
+            imports.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+
+        stdout = dict(line.split(' ', 1) for line in proc.stdout.splitlines() if ' ' in line)
+        loaded = set(stdout.get('LOADED', '').split(','))
+        total_ms = sum(self_us for _, self_us, _ in imports) / 1000
+
+        self.stdout.write(f'modules imported: {len(imports)}  total import time: {total_ms:.1f} ms  '
+                          f'peak RSS: {int(stdout.get("RSS_KB", 0)) / 1024:.1f} MB')
+        self.stdout.write(f'{"cumulative ms":>14}  {"self ms":>8}  module')
+        top_level = [entry for entry in imports if not entry[2].startswith(' ')]
+        for cumulative_us, self_us, name in sorted(top_level, reverse=True)[:options['top']]:
+            self.stdout.write(f'{cumulative_us / 1000:>14.1f}  {self_us / 1000:>8.1f}  {name}')
+
+        heavy = sorted(m for m in HEAVY_MODULES if m in loaded)
+        if heavy and not options['allow_heavy']:
+            raise CommandError(f'Export backends imported at worker boot: {", ".join(heavy)}')
+        if heavy:
+            self.stdout.write(self.style.WARNING(f'Heavy modules at boot: {", ".join(heavy)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No export backend is imported at worker boot.'))
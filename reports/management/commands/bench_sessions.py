@@ -0,0 +1,94 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.timezone import localdate
+
+from masterdata.models import ExamName, ExamType, Referrer, Sonologist
+
+LEGACY = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'MESSAGE_STORAGE': 'django.contrib.messages.storage.fallback.FallbackStorage',
+}
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+PASSWORD = 'bench-sessions-password'
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the database writes a logged-in staff member's requests cost with the legacy "
+        "database sessions and with the configured SESSION_ENGINE/MESSAGE_STORAGE. Replays "
+        "report entry and master-data edits through the full middleware stack inside a "
+        "transaction that is rolled back, so the database is left as it was."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20, help='Times to replay the request sequence.')
+
+    def handle(self, *args, **options):
+        configured = {'SESSION_ENGINE': settings.SESSION_ENGINE, 'MESSAGE_STORAGE': settings.MESSAGE_STORAGE}
+        for label, overrides in (('legacy', LEGACY), ('configured', configured)):
+            with transaction.atomic():
+                with override_settings(**overrides):
+                    stats = self._replay(options['rounds'])
+                transaction.set_rollback(True)
+            self._report(label, overrides, stats)
+
+    def _fixtures(self):
+        get_user_model().objects.create_user('bench-sessions', password=PASSWORD, is_staff=True)
+        return {
+            'exam_name': ExamName.objects.create(name='Bench exam').pk,
+            'exam_type': ExamType.objects.create(name='Bench type').pk,
+            'referred_by': Referrer.objects.create(name='Bench referrer').pk,
+            'sonologist': Sonologist.objects.create(name='Bench sonologist').pk,
+        }
+
+    def _replay(self, rounds):
+        choices = self._fixtures()
+        client = Client()
+        stats = Counter()
+
+        def request(method, url, data=None):
+            with CaptureQueriesContext(connection) as queries:
+                getattr(client, method)(url, data)
+            sql = [q['sql'] for q in queries.captured_queries]
+            writes = [statement for statement in sql if statement.lstrip().upper().startswith(WRITES)]
+            session_writes = sum('django_session' in statement for statement in writes)
+            stats['requests'] += 1
+            stats['writes'] += len(writes)
+            stats['session_writes'] += session_writes
+            stats['session_reads'] += sum('django_session' in statement for statement in sql) - session_writes
+            stats['requests_writing'] += bool(writes)
+            # Requests that would have been read-only without the session store
+            stats['session_only'] += bool(writes) and session_writes == len(writes)
+
+        home, referrers = reverse('reports:home'), reverse('masterdata:referrer_list')
+        request('post', reverse('admin:login'), {'username': 'bench-sessions', 'password': PASSWORD})
+        for i in range(rounds):
+            request('get', home)
+            request('post', home, {
+                'date': localdate().strftime('%d/%m/%Y'), 'id_number': f'BENCH-{i}', 'total_ultra': 1, **choices,
+            })
+            request('get', home)  # shows "Report saved successfully!"
+            request('get', referrers)
+            request('post', reverse('masterdata:referrer_create'), {'name': f'Bench referrer {i}'})
+            request('get', referrers)  # shows "Referrer saved."
+        request('post', reverse('admin:logout'))
+        return stats
+
+    def _report(self, label, overrides, stats):
+        self.stdout.write(f"{label}: {overrides['SESSION_ENGINE'].rsplit('.', 1)[-1]} sessions, "
+                          f"{overrides['MESSAGE_STORAGE'].rsplit('.', 1)[-1]}")
+        requests = stats['requests']
+        self.stdout.write(
+            f"  {requests} requests, {stats['requests_writing']} wrote to the database "
+            f"({stats['session_only']} only for the session), "
+            f"{stats['writes']} write statements ({stats['writes'] / requests:.2f} per request), "
+            f"{stats['session_writes']} to django_session; {stats['session_reads']} django_session reads"
+        )
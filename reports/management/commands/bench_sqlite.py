@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent-writer stress test for the SQLite profile. Runs against a scratch "
+        "database: one long-running export-style reader plus several writers inserting "
+        "report rows, then prints write latency and 'database is locked' errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--rows', type=int, default=200000, help='Rows seeded for the reader to scan.')
+        parser.add_argument(
+            '--journal-mode',
+            default=None,
+            help='Override journal_mode (e.g. DELETE) to compare against settings.SQLITE_PRAGMAS.',
+        )
+
+    def handle(self, *args, **options):
+        pragmas = dict(settings.SQLITE_PRAGMAS)
+        if options['journal_mode']:
+            pragmas['journal_mode'] = options['journal_mode']
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.sqlite3')
+            self._seed(path, pragmas, options['rows'])
+            result = self._run(path, pragmas, options['writers'], options['seconds'])
+
+        latencies = sorted(result['latencies'])
+        self.stdout.write(f"journal_mode={pragmas['journal_mode']} writers={options['writers']}")
+        self.stdout.write(f"reader passes: {result['reads']}")
+        self.stdout.write(f"writes ok: {len(latencies)}  locked errors: {result['locked']}")
+        if latencies:
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+            self.stdout.write(
+                f"write latency ms: p50={statistics.median(latencies) * 1000:.2f} "
+                f"p95={p95 * 1000:.2f} max={latencies[-1] * 1000:.2f}"
+            )
+
+        if result['locked']:
+            self.stdout.write(self.style.ERROR('Writers hit "database is locked".'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No writer was blocked out by the reader.'))
+
+    def _connect(self, path, pragmas):
+        conn = sqlite3.connect(path, timeout=pragmas['busy_timeout'] / 1000, isolation_level=None,
+                               check_same_thread=False)
+        for key, value in pragmas.items():
+            # journal_mode is persistent and was set once while seeding.
+            if key != 'journal_mode':
+                conn.execute(f'PRAGMA {key}={value}')
+        return conn
+
+    def _seed(self, path, pragmas, rows):
+        conn = self._connect(path, pragmas)
+        conn.execute(f"PRAGMA journal_mode={pragmas['journal_mode']}")
+        conn.execute(
+            'CREATE TABLE report (id INTEGER PRIMARY KEY, date TEXT NOT NULL, '
+            'sonologist_id INTEGER, referred_by_id INTEGER, total_ultra INTEGER NOT NULL)'
+        )
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO report (date, sonologist_id, referred_by_id, total_ultra) VALUES (?, ?, ?, ?)',
+            ((f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', i % 5, i % 40, i % 2 + 1) for i in range(rows)),
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def _run(self, path, pragmas, writers, seconds):
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {'latencies': [], 'locked': 0, 'reads': 0}
+
+        # Open every connection up front so connection setup isn't part of the contention.
+        conns = [self._connect(path, pragmas) for _ in range(writers + 1)]
+
+        def reader(conn):
+            while not stop.is_set():
+                # Hold one read transaction open across a slow full scan, like an export.
+                conn.execute('BEGIN')
+                for _ in conn.execute('SELECT * FROM report ORDER BY date'):
+                    if stop.is_set():
+                        break
+                conn.execute('COMMIT')
+                with lock:
+                    result['reads'] += 1
+            conn.close()
+
+        def writer(n, conn):
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    conn.execute(
+                        'INSERT INTO report (date, sonologist_id, referred_by_id, total_ultra) '
+                        "VALUES (date('now'), ?, ?, 1)",
+                        (n, n),
+                    )
+                    conn.execute('COMMIT')
+                except sqlite3.OperationalError as exc:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    if 'locked' not in str(exc):
+                        raise
+                    with lock:
+                        result['locked'] += 1
+                    continue
+                with lock:
+                    result['latencies'].append(time.perf_counter() - started)
+                time.sleep(0.005)
+            conn.close()
+
+        threads = [threading.Thread(target=reader, args=(conns[0],))]
+        threads += [threading.Thread(target=writer, args=(n, conns[n + 1])) for n in range(writers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        return result
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import localdate
+
+from masterdata.middleware import branch_for_code
+from masterdata.tenancy import using_branch
+from reports import statements
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the monthly per-referrer statement PDFs. Statements whose content "
+        "has not changed since the last run are kept as they are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='YYYY-MM (default: last month).')
+        parser.add_argument('--workers', type=int, help='PDF rendering processes (default: STATEMENT_WORKERS or one per CPU).')
+        parser.add_argument('--output', help='Also write the zip archive to this path.')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month must be YYYY-MM.')
+        else:
+            month = (localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+
+        # The same branch as the scheduler's run, so the download page finds the statements
+        with using_branch(branch_for_code(settings.BRANCH_CODE)):
+            result = statements.generate(month, workers=options['workers'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{month:%Y-%m}: rendered {result['rendered']}, unchanged {result['unchanged']}"
+            ))
+            if options['output']:
+                with open(options['output'], 'wb') as fileobj:
+                    statements.write_zip(month, fileobj)
+                self.stdout.write(f"Wrote {options['output']}")
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports import audit, merge
+
+
+class Command(BaseCommand):
+    help = (
+        "List likely duplicate referrers, exam names, exam types or sonologists, or merge "
+        "duplicates into one row: their reports (live and archived) move in small batches "
+        "and the duplicates are deactivated. The merge is queued and run here together with "
+        "any other queued or interrupted merges."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(merge.KINDS))
+        parser.add_argument('losers', nargs='*', type=int, metavar='ID', help='Rows to merge into --into.')
+        parser.add_argument('--into', type=int, metavar='ID', help='Row that keeps the reports.')
+        parser.add_argument('--threshold', type=float, default=merge.THRESHOLD,
+                            help=f'Similarity needed to list two names together (default: {merge.THRESHOLD}).')
+        parser.add_argument('--chunk-size', type=int, default=merge.CHUNK_SIZE,
+                            help=f'Reports moved per transaction (default: {merge.CHUNK_SIZE}).')
+        parser.add_argument('--pause', type=float, default=merge.PAUSE_SECONDS,
+                            help=f'Seconds to wait between batches (default: {merge.PAUSE_SECONDS}).')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        if options['into'] is None:
+            if options['losers']:
+                raise CommandError('Give the surviving row with --into.')
+            self.list_duplicates(kind, options['threshold'])
+            return
+
+        model = merge.KINDS[kind][0]
+        rows = model.objects.in_bulk([options['into'], *options['losers']])
+        missing = {options['into'], *options['losers']} - set(rows)
+        if missing:
+            raise CommandError(f"No {model._meta.verbose_name} with id {', '.join(map(str, sorted(missing)))}.")
+        survivor = rows[options['into']]
+        losers = [rows[pk] for pk in options['losers']]
+        try:
+            job = merge.queue(kind, survivor, losers)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if merge.run_queued(options['chunk_size'], options['pause']) is None:
+            self.stdout.write(f'Queued merge {job.pk}; another process is running merges and will run it.')
+            return
+        audit.flush()
+        job.refresh_from_db()
+        if job.status != job.DONE:
+            raise CommandError(f'Merge {job.pk} failed: {job.error}')
+        self.stdout.write(self.style.SUCCESS(f"Merged {len(losers)} into {survivor}: moved {job.moved} reports."))
+
+    def list_duplicates(self, kind, threshold):
+        groups = merge.find_duplicates(kind, threshold)
+        if not groups:
+            self.stdout.write('No likely duplicates.')
+            return
+        for group in groups:
+            survivor = group[0][0]
+            self.stdout.write(f'{survivor.name}')
+            for obj, count, score in group:
+                self.stdout.write(f'  {obj.pk:>6}  {count:>8} reports  {score:.2f}  {obj.name}')
+            losers = ' '.join(str(obj.pk) for obj, _, _ in group[1:])
+            self.stdout.write(f'  merge with: manage.py merge_masterdata {kind} --into {survivor.pk} {losers}')
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+DB_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the rows the database session backend left in django_session, in small "
+        "batches so report entry is not held up. With cookie or cache sessions (the "
+        "default SESSION_ENGINE) every row is dead; otherwise only expired ones are removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--expired-only', action='store_true',
+                            help='Keep unexpired sessions even when the database backend is not in use.')
+
+    def handle(self, *args, **options):
+        rows = Session.objects.all()
+        if options['expired_only'] or settings.SESSION_ENGINE in DB_ENGINES:
+            rows = rows.filter(expire_date__lt=timezone.now())
+
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                keys = list(rows.values_list('pk', flat=True)[:options['batch_size']])
+                if not keys:
+                    break
+                deleted += Session.objects.filter(pk__in=keys).delete()[0]
+            time.sleep(0.05)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} sessions; {Session.objects.count()} left.'))
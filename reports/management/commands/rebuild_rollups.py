@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports import rollups
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r} (expected YYYY-MM-DD).')
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and hourly rollup tables from the reports (live and archived)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--end', type=parse_date, help='Last day to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup rows.'))
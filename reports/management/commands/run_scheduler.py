@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from reports import scheduler
+from reports.models import ScheduledJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the scheduled jobs (Reports > Scheduled jobs in the admin) as their cron "
+        "specs fall due. Runs until stopped; use --once from an external cron instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs due this minute and exit.')
+        parser.add_argument('--run', metavar='NAME', help='Run one job now, whatever its schedule, and exit.')
+
+    def handle(self, *args, **options):
+        if options['run']:
+            job = ScheduledJob.objects.filter(name=options['run']).first()
+            if job is None:
+                raise CommandError(f"No scheduled job named {options['run']!r}.")
+            self.stdout.write(f'{job.name}: {scheduler.run_job(job)}')
+            return
+
+        while True:
+            self.run_due(timezone.now())
+            if options['once']:
+                return
+            connections.close_all()
+            time.sleep(60 - time.time() % 60 + 1)
+
+    def run_due(self, now):
+        for job, minute in scheduler.due_jobs(now):
+            if scheduler.claim(job, minute):
+                status = scheduler.run_job(job)
+                self.stdout.write(f'{timezone.localtime():%Y-%m-%d %H:%M} {job.name}: {status}')
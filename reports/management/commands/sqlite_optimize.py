@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Run PRAGMA optimize (and optionally a WAL checkpoint) on SQLite databases. "
+        "Schedule it every few hours, e.g. from cron: "
+        "0 */4 * * * python manage.py sqlite_optimize --checkpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias (default: "default").')
+        parser.add_argument(
+            '--checkpoint',
+            action='store_true',
+            help='Also fold the WAL back into the main database file and truncate it.',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            self.stdout.write(f'Skipping: {options["database"]} is {connection.vendor}, not sqlite.')
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA optimize')
+            if options['checkpoint']:
+                cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                busy, wal_pages, moved = cursor.fetchone()
+                self.stdout.write(f'WAL checkpoint: busy={busy} pages={wal_pages} checkpointed={moved}')
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'PRAGMA optimize done (journal_mode={journal_mode}).'))
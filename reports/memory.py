@@ -0,0 +1,124 @@
+# reports/memory.py
+"""
+Per-request memory accounting and worker recycling.
+
+CPython keeps the arenas a big export allocated instead of returning them to
+the OS, so a worker that rendered one month-end PDF stays hundreds of MB large
+for the rest of its life. MemoryWatchdogMiddleware measures every request when
+its response is closed (after a streamed body's last chunk):
+
+- the worker's RSS before and after, and its high-water mark (ru_maxrss);
+- for one request in MEMORY_TRACE_EVERY, the peak of new Python allocations
+  and the lines that made them, using tracemalloc. Only one request is traced
+  at a time; allocations made by requests running alongside it are counted too.
+
+Requests that grew the worker by MEMORY_LOG_MB or more, and traced requests,
+are logged. A worker whose RSS is past MEMORY_RECYCLE_MB after a request is
+retired: it finishes the requests it has in flight and exits, and gunicorn
+starts a fresh one. Retiring only happens once gunicorn.conf.py has called
+``enable_recycling()`` in the worker, so runserver is never killed. Its
+worker_exit hook drains the audit writer before the process goes; no other
+background work runs in web workers (merges run in the scheduler).
+"""
+import itertools
+import logging
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+TRACE_FRAMES = 1
+TOP_LINES = 5
+
+_counter = itertools.count(1)
+_tracing = threading.Lock()
+_retire = None
+_retiring = False
+
+
+def rss():
+    """The worker's resident set size in bytes, or None where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss():
+    """The worker's highest RSS so far in bytes, or None without the resource module."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # bytes on macOS, kilobytes elsewhere
+
+
+def enable_recycling(retire=None):
+    """Allow retiring this worker; ``retire`` defaults to a graceful SIGTERM to itself."""
+    global _retire
+    _retire = retire or (lambda: os.kill(os.getpid(), signal.SIGTERM))
+
+
+def _mb(size):
+    return None if size is None else round(size / MB, 1)
+
+
+class Measurement:
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.path
+        self.rss = rss()
+        self.peak = peak_rss()
+        every = settings.MEMORY_TRACE_EVERY
+        self.traced = bool(every) and next(_counter) % every == 0 and _tracing.acquire(blocking=False)
+        if self.traced:
+            tracemalloc.start(TRACE_FRAMES)
+
+    def finish(self, status_code):
+        traced_peak = top = None
+        if self.traced:
+            try:
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                top = tracemalloc.take_snapshot().statistics('lineno')[:TOP_LINES]
+            finally:
+                tracemalloc.stop()
+                _tracing.release()
+
+        after, peak = rss(), peak_rss()
+        grown = after - self.rss if after is not None and self.rss is not None else 0
+        heavy = grown >= settings.MEMORY_LOG_MB * MB
+        if heavy or self.traced:
+            level = logging.WARNING if heavy else logging.INFO
+            logger.log(
+                level,
+                "%s %s (%s): rss %s MB -> %s MB, worker peak %s MB%s%s",
+                self.method, self.path, status_code, _mb(self.rss), _mb(after), _mb(peak),
+                " (new high)" if peak and self.peak and peak > self.peak else "",
+                f", traced peak {_mb(traced_peak)} MB" if traced_peak is not None else "",
+            )
+            for stat in top or ():
+                logger.log(level, "  %s MB in %s blocks at %s", _mb(stat.size), stat.count, stat.traceback)
+
+        if after is not None and after >= settings.MEMORY_RECYCLE_MB * MB:
+            retire(after)
+
+
+def retire(size):
+    global _retiring
+    if _retire is None or _retiring:
+        return
+    _retiring = True
+    logger.warning("Worker %s is at %s MB (MEMORY_RECYCLE_MB=%s); retiring it after its in-flight requests",
+                   os.getpid(), _mb(size), settings.MEMORY_RECYCLE_MB)
+    _retire()
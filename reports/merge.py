@@ -0,0 +1,308 @@
+# reports/merge.py
+"""
+Merging duplicate master data ("Dr. Masud (EMO)" entered three ways).
+
+``find_duplicates()`` normalises names to token sets (case, punctuation and
+titles such as "Dr." dropped) and only compares names that share a blocking key
+(a token, or the first four letters of a longer one), so the work grows with
+block sizes instead of with every pair of names. Keys shared by more than
+MAX_BLOCK names ("hospital", "clinic") identify nothing and are skipped.
+
+``merge()`` moves every report of the losers to the survivor in chunks of
+``chunk_size`` rows. Each chunk is one short transaction that moves the rows
+and applies their rollup deltas (reports.rollups.apply_changes), so a merge cut
+off at any point leaves consistent data, and running it again carries on with
+the rows still left. The pause between chunks outlasts SQLite's busy-handler
+backoff (up to 100 ms); with shorter ones a waiting writer keeps missing its
+turn. Each moved report gets a new change_seq (the change feed sees it), a
+version bump (an open edit form reports a conflict instead of moving it back)
+and an audit entry. Archived years are moved the same way. Losers are
+deactivated only once their reports have moved, and a last pass picks up
+reports entered for them meanwhile. The new change_seq values move the data
+version, so cached pages (reports.caching) miss by themselves, and referrer
+statements need nothing: the next generate() re-renders whatever changed.
+
+Staff queue merges (``queue()``, a MasterdataMerge row) and the scheduler's
+``masterdata_merges`` task or ``manage.py merge_masterdata`` runs them with
+``run_queued()``. A file lock (reports.locks) keeps merges to one at a time
+across processes; a merge whose process died stays RUNNING and is resumed.
+"""
+import logging
+import re
+import time
+from collections import defaultdict
+from difflib import SequenceMatcher
+from types import SimpleNamespace
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from masterdata.models import ExamName, ExamType, Referrer, Sonologist
+from masterdata.tenancy import using_branch
+from . import audit, rollups
+from .archive import archive_model, archived_years, partitions, union_all
+from .locks import SingleFlight
+from .models import ChangeSequence, MasterdataMerge, Report
+
+logger = logging.getLogger(__name__)
+
+# kind: (masterdata model, Report column)
+KINDS = {
+    'referrer': (Referrer, 'referred_by_id'),
+    'exam_name': (ExamName, 'exam_name_id'),
+    'exam_type': (ExamType, 'exam_type_id'),
+    'sonologist': (Sonologist, 'sonologist_id'),
+}
+
+TITLES = {'dr', 'doctor', 'prof', 'professor', 'mr', 'mrs', 'ms', 'miss', 'md', 'mbbs', 'fcps', 'frcs', 'mrcp'}
+
+MAX_BLOCK = 100
+THRESHOLD = 0.85
+CHUNK_SIZE = 500
+PAUSE_SECONDS = 0.1
+LOCK_KEY = 'masterdata-merge'
+
+
+def name_tokens(name):
+    """Sorted lower-case tokens of a name, without punctuation and titles."""
+    tokens = re.findall(r'[a-z0-9]+', (name or '').lower())
+    return tuple(sorted({token for token in tokens if token not in TITLES}))
+
+
+def _blocking_keys(tokens):
+    for token in tokens:
+        if len(token) > 1:
+            yield token
+        if len(token) > 4:
+            # Catches one-letter typos in the rest of the word (Rahman / Rahaman)
+            yield token[:4] + '*'
+
+
+def similarity(a, b, threshold=0.0):
+    """Score in [0, 1] for two token tuples: 1 for the same token set, 0 if clearly below ``threshold``."""
+    if a == b:
+        return 1.0
+    a, b = ' '.join(a), ' '.join(b)
+    # Cheap upper bounds rule out most pairs before the full comparison
+    if 2 * min(len(a), len(b)) / (len(a) + len(b)) < threshold:
+        return 0.0
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+
+def report_counts(kind, ids):
+    """{masterdata id: number of reports}, live and archived."""
+    column = KINDS[kind][1]
+    counts = defaultdict(int)
+    with using_branch(None):
+        rows = union_all([
+            qs.values_list(column).annotate(n=Count('id')).order_by()
+            for qs in partitions(Q(**{f'{column}__in': list(ids)}))
+        ])
+        for pk, n in rows:
+            counts[pk] += n
+    return counts
+
+
+def find_duplicates(kind, threshold=THRESHOLD):
+    """
+    Groups of likely duplicates among the active rows of ``kind``.
+
+    Each group is a list of (object, report count, score against the first),
+    best survivor first: shared rows before branch rows, then most reports.
+    """
+    model = KINDS[kind][0]
+    objects = {obj.pk: obj for obj in model.objects.filter(is_active=True)}
+    tokens = {pk: name_tokens(obj.name) for pk, obj in objects.items()}
+
+    blocks = defaultdict(list)
+    for pk, words in tokens.items():
+        for key in _blocking_keys(words):
+            blocks[key].append(pk)
+
+    parent = {}
+
+    def find(pk):
+        while parent.get(pk, pk) != pk:
+            pk = parent[pk]
+        return pk
+
+    compared = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK:
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pair = (a, b) if a < b else (b, a)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                if similarity(tokens[a], tokens[b], threshold) >= threshold:
+                    parent.setdefault(a, a)
+                    parent.setdefault(b, b)
+                    parent[find(a)] = find(b)
+
+    groups = defaultdict(list)
+    for pk in parent:
+        groups[find(pk)].append(pk)
+    counts = report_counts(kind, parent)
+
+    result = []
+    for members in groups.values():
+        members.sort(key=lambda pk: (objects[pk].branch_id is not None, -counts[pk], objects[pk].name))
+        first = tokens[members[0]]
+        result.append([(objects[pk], counts[pk], similarity(first, tokens[pk])) for pk in members])
+    result.sort(key=lambda group: group[0][0].name.lower())
+    return result
+
+
+def _move_chunk(manager, column, survivor_id, loser_ids, chunk_size, live, progress):
+    """Move up to ``chunk_size`` reports in one transaction; returns how many moved."""
+    fields = dict.fromkeys(('pk', 'created_at', column, *Report.AGGREGATED_FIELDS))
+    with transaction.atomic():
+        rows = list(manager.filter(**{f'{column}__in': loser_ids}).order_by('pk').values(*fields)[:chunk_size])
+        if not rows:
+            return 0
+        ids = [row['pk'] for row in rows]
+        if live:
+            manager.filter(pk__in=ids).update(**{
+                column: survivor_id,
+                'version': F('version') + 1,
+                'updated_at': timezone.now(),
+            })
+            # Every row needs its own change_seq (the feed pages by it). Raw SQL on
+            # purpose: the ORM's per-row CASE expression is quadratic in the chunk size.
+            first = ChangeSequence.reserve(Report.CHANGE_STREAM, len(ids))
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'UPDATE {quote(Report._meta.db_table)} SET {quote("change_seq")} = %s WHERE {quote("id")} = %s',
+                    [(first + i, pk) for i, pk in enumerate(ids)],
+                )
+            audit.record_updates({row['pk']: {column: [row[column], survivor_id]} for row in rows})
+        else:
+            manager.filter(pk__in=ids).update(**{column: survivor_id})
+        if column in Report.AGGREGATED_FIELDS:
+            changes = []
+            for row in rows:
+                old = {field: row[field] for field in Report.AGGREGATED_FIELDS}
+                changes.append((old, {**old, column: survivor_id}, row['created_at']))
+            rollups.apply_changes(changes)
+        progress(len(rows))
+    return len(rows)
+
+
+def _move_all(column, survivor_id, loser_ids, chunk_size, pause, progress):
+    tables = [(Report._base_manager, True)]
+    tables += [(archive_model(year)._base_manager, False) for year in archived_years()]
+    moved = 0
+    for manager, live in tables:
+        while True:
+            count = _move_chunk(manager, column, survivor_id, loser_ids, chunk_size, live, progress)
+            if not count:
+                break
+            moved += count
+            time.sleep(pause)
+    return moved
+
+
+def check(kind, survivor, losers):
+    """The losers to merge into ``survivor``; ValueError if the merge is not allowed."""
+    model = KINDS[kind][0]
+    losers = [loser for loser in losers if loser.pk != survivor.pk]
+    if not losers:
+        raise ValueError("Nothing to merge: choose at least one row besides the survivor.")
+    if any(not isinstance(obj, model) for obj in (survivor, *losers)):
+        raise ValueError(f"Every row must be a {model._meta.verbose_name}.")
+    if not survivor.is_active:
+        raise ValueError(f"{survivor} is inactive and cannot take over other rows.")
+    if survivor.branch_id is not None and any(loser.branch_id != survivor.branch_id for loser in losers):
+        raise ValueError("Rows from other branches can only be merged into a shared row.")
+    return losers
+
+
+def merge(kind, survivor, losers, chunk_size=CHUNK_SIZE, pause=PAUSE_SECONDS, progress=None):
+    """
+    Move all reports of ``losers`` to ``survivor``, then deactivate the losers.
+
+    Safe to run again after an interruption: it carries on with the reports
+    still left. ``progress(n)`` is called inside each chunk's transaction.
+    Returns the number of reports moved, live and archived.
+    """
+    column = KINDS[kind][1]
+    losers = check(kind, survivor, losers)
+    loser_ids = [loser.pk for loser in losers]
+    progress = progress or (lambda count: None)
+
+    moved = _move_all(column, survivor.pk, loser_ids, chunk_size, pause, progress)
+    for loser in losers:
+        if loser.is_active:
+            loser.is_active = False
+            loser.save(update_fields=['is_active'])
+    # Reports entered for a loser before it left the dropdowns
+    return moved + _move_all(column, survivor.pk, loser_ids, chunk_size, pause, progress)
+
+
+def queue(kind, survivor, losers, user=None):
+    """Queue a merge for run_queued(); raises ValueError as check() does."""
+    losers = check(kind, survivor, losers)
+    return MasterdataMerge.objects.create(
+        kind=kind, survivor_id=survivor.pk, loser_ids=[loser.pk for loser in losers], requested_by=user,
+    )
+
+
+def _run(job, chunk_size, pause):
+    rows = KINDS[job.kind][0].objects.in_bulk([job.survivor_id, *job.loser_ids])
+    job.status = MasterdataMerge.RUNNING
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    def progress(count):
+        MasterdataMerge.objects.filter(pk=job.pk).update(moved=F('moved') + count)
+
+    # The requesting user is the acting user of the audit entries
+    token = audit.set_current_request(SimpleNamespace(user=job.requested_by))
+    try:
+        survivor = rows.get(job.survivor_id)
+        if survivor is None:
+            raise ValueError("The row to keep no longer exists.")
+        losers = [rows[pk] for pk in job.loser_ids if pk in rows]
+        merge(job.kind, survivor, losers, chunk_size, pause, progress)
+    except Exception as exc:
+        logger.exception("Merge %s failed", job.pk)
+        job.status, job.error = MasterdataMerge.FAILED, str(exc)
+    else:
+        job.status, job.error = MasterdataMerge.DONE, ''
+        logger.info("Merge %s done: %s", job.pk, job)
+    finally:
+        audit.reset_current_request(token)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def run_queued(chunk_size=CHUNK_SIZE, pause=PAUSE_SECONDS):
+    """
+    Resume interrupted merges and run queued ones, oldest first.
+
+    Returns how many ran, or None when another process holds the merge lock.
+    """
+    lock = SingleFlight(LOCK_KEY)
+    if not lock.acquire(wait=0):
+        return None
+    ran = 0
+    try:
+        while True:
+            # Re-read each time: staff may queue more while a merge runs
+            job = (
+                MasterdataMerge.objects.filter(status__in=[MasterdataMerge.RUNNING, MasterdataMerge.PENDING])
+                .select_related('requested_by').order_by('requested_at', 'pk').first()
+            )
+            if job is None:
+                return ran
+            _run(job, chunk_size, pause)
+            ran += 1
+    finally:
+        lock.release()
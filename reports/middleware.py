@@ -0,0 +1,121 @@
+# reports/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import FileResponse
+
+from . import memory, profiling
+from .audit import reset_current_request, set_current_request
+
+
+class AuditUserMiddleware:
+    """Make ``request.user`` the acting user for audit entries written during the request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = set_current_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            reset_current_request(token)
+
+    async def __acall__(self, request):
+        token = set_current_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            reset_current_request(token)
+
+
+class ProfilingMiddleware:
+    """Profile the request when a staff user asks for it with ?_profile=1 or X-Profile: 1 (see reports.profiling)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not profiling.requested(request) or not request.user.is_staff:
+            return self.get_response(request)
+        profile, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.stop(token)
+        return self.finish(request.user, profile, response)
+
+    async def __acall__(self, request):
+        if not profiling.requested(request) or not (await request.auser()).is_staff:
+            return await self.get_response(request)
+        profile, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.stop(token)
+        return self.finish(request.user, profile, response)
+
+    @staticmethod
+    def start(request):
+        request.profiling = True  # bypasses the page cache, which would make the profile meaningless
+        return profiling.start(request)
+
+    @staticmethod
+    def finish(user, profile, response):
+        # Saved when the response is closed, after a streamed body's last chunk
+        if response.streaming and not isinstance(response, FileResponse):
+            profiling.trace_stream(profile, response)
+        status = response.status_code
+        response._resource_closers.append(lambda: profile.finish(status, user))
+        response['X-Profile'] = profile.name
+        return response
+
+
+class MemoryWatchdogMiddleware:
+    """Measure each request's memory and retire bloated workers (see reports.memory). Goes first."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        measurement = memory.Measurement(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            measurement.finish(500)
+            raise
+        return self.finish(measurement, response)
+
+    async def __acall__(self, request):
+        measurement = memory.Measurement(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            measurement.finish(500)
+            raise
+        return self.finish(measurement, response)
+
+    @staticmethod
+    def finish(measurement, response):
+        status = response.status_code
+        response._resource_closers.append(lambda: measurement.finish(status))
+        return response
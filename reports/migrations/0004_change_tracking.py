@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:14
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_reports(apps, schema_editor):
+    # Give pre-existing rows a cursor position so a first sync from since=0 sees them.
+    Report = apps.get_model('reports', 'Report')
+    ChangeSequence = apps.get_model('reports', 'ChangeSequence')
+    Report.objects.update(change_seq=F('id'))
+    last = Report.objects.aggregate(last=Max('id'))['last'] or 0
+    ChangeSequence.objects.update_or_create(name='report', defaults={'value': last})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_alter_report_exam_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_id', models.BigIntegerField()),
+                ('change_seq', models.PositiveBigIntegerField(unique=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['change_seq'],
+            },
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.RunPython(number_existing_reports, migrations.RunPython.noop),
+    ]
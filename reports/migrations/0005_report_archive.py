@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0004_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportArchive',
+            fields=[
+                ('year', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('table_name', models.CharField(max_length=63)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('total_ultra', models.PositiveBigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['year'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0001_initial'),
+        ('reports', '0005_report_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferrerStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the statement month')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('total_ultra', models.PositiveIntegerField(default=0)),
+                ('pdf', models.BinaryField()),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('referrer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statements', to='masterdata.referrer')),
+            ],
+            options={
+                'ordering': ['-month', 'referrer__name'],
+                'constraints': [models.UniqueConstraint(fields=('referrer', 'month'), name='unique_referrer_statement')],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_rollups(apps, schema_editor):
+    # Live table only: archived years get rollups from `manage.py rebuild_rollups`
+    Report = apps.get_model('reports', 'Report')
+    DailyRollup = apps.get_model('reports', 'DailyRollup')
+    fields = ('branch_id', 'date', 'sonologist_id', 'referred_by_id', 'exam_type_id')
+    rows = Report.objects.values(*fields).annotate(report_count=Count('id'), total=Sum('total_ultra')).order_by()
+    DailyRollup.objects.bulk_create(
+        [
+            DailyRollup(**{f: row[f] for f in fields}, report_count=row['report_count'], total_ultra=row['total'])
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0002_branch'),
+        ('reports', '0006_referrer_statement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('total_ultra', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='referrerstatement',
+            name='unique_referrer_statement',
+        ),
+        migrations.AddField(
+            model_name='referrerstatement',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='masterdata.branch'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reports', to='masterdata.branch'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['branch', 'date'], name='report_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['branch', 'sonologist', 'date'], name='report_branch_son_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='referrerstatement',
+            constraint=models.UniqueConstraint(fields=('branch', 'referrer', 'month'), name='unique_referrer_statement'),
+        ),
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='masterdata.branch'),
+        ),
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='exam_type',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='masterdata.examtype'),
+        ),
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='referred_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='masterdata.referrer'),
+        ),
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='sonologist',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='masterdata.sonologist'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyrollup',
+            index=models.Index(fields=['branch', 'date'], name='rollup_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyrollup',
+            index=models.Index(fields=['date'], name='rollup_date_idx'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:33
+
+from django.db import migrations, models
+
+
+def default_jobs(apps, schema_editor):
+    ScheduledJob = apps.get_model('reports', 'ScheduledJob')
+    ScheduledJob.objects.get_or_create(name='Closing-time warm-up', defaults={'task': 'warm_reports', 'cron': '45 19 * * *'})
+    ScheduledJob.objects.get_or_create(name='Month-end warm-up', defaults={'task': 'warm_reports', 'cron': '30 18 28-31 * *'})
+    ScheduledJob.objects.get_or_create(name='Referrer statements', defaults={'task': 'referrer_statements', 'cron': '0 2 1 * *'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0007_branch_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('task', models.CharField(choices=[('warm_reports', 'Pre-warm report pages and exports'), ('referrer_statements', "Generate last month's referrer statements")], max_length=50)),
+                ('cron', models.CharField(help_text="minute hour day-of-month month day-of-week, e.g. '45 19 * * *'", max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_status', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RunPython(default_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_scheduled_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:39
+
+from django.db import migrations, models
+
+
+def fill_periods(apps, schema_editor):
+    # Live table and rollups only: archive tables get the columns and values
+    # from reports.archive.sync_tables after migrate.
+    Report = apps.get_model('reports', 'Report')
+    DailyRollup = apps.get_model('reports', 'DailyRollup')
+    for day in Report.objects.order_by().values_list('date', flat=True).distinct():
+        iso_year, iso_week, iso_weekday = day.isocalendar()
+        Report.objects.filter(date=day).update(
+            year=day.year,
+            month=day.replace(day=1),
+            iso_week=iso_year * 100 + iso_week,
+            weekday=iso_weekday,
+        )
+    for day in DailyRollup.objects.order_by().values_list('date', flat=True).distinct():
+        DailyRollup.objects.filter(date=day).update(month=day.replace(day=1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0002_branch'),
+        ('reports', '0010_report_audit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='month',
+            field=models.DateField(editable=False, help_text='First day of the month', null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='iso_week',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='ISO year * 100 + ISO week'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='month',
+            field=models.DateField(editable=False, help_text='First day of the month', null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='weekday',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='ISO weekday, Monday = 1'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='year',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_periods, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['date', 'referred_by', 'branch', 'total_ultra'], name='report_date_ref_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['month', 'sonologist', 'branch', 'date', 'total_ultra'], name='report_month_son_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['month', 'referred_by', 'branch', 'date', 'total_ultra'], name='report_month_ref_idx'),
+        ),
+    ]
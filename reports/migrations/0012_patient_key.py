@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:40
+
+import re
+
+from django.db import migrations, models
+
+
+def fill_patient_keys(apps, schema_editor):
+    # Same normalization as reports.models.normalize_patient_id; archive tables
+    # are filled by reports.archive.sync_tables after migrate.
+    Report = apps.get_model('reports', 'Report')
+    for id_number in Report.objects.exclude(id_number=None).order_by().values_list('id_number', flat=True).distinct():
+        key = re.sub(r'[\s\-/.]', '', id_number).upper() or None
+        Report.objects.filter(id_number=id_number).update(patient_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0002_branch'),
+        ('reports', '0011_period_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='patient_key',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(fill_patient_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(condition=models.Q(('patient_key__isnull', False)), fields=['patient_key', 'date', 'exam_name'], name='report_patient_idx'),
+        ),
+    ]
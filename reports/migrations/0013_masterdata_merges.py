@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_job(apps, schema_editor):
+    ScheduledJob = apps.get_model('reports', 'ScheduledJob')
+    ScheduledJob.objects.get_or_create(name='Master data merges', defaults={'task': 'masterdata_merges', 'cron': '* * * * *'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0012_patient_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scheduledjob',
+            name='task',
+            field=models.CharField(choices=[('warm_reports', 'Pre-warm report pages and exports'), ('referrer_statements', "Generate last month's referrer statements"), ('masterdata_merges', 'Run queued master data merges')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='MasterdataMerge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('survivor_id', models.PositiveIntegerField()),
+                ('loser_ids', models.JSONField()),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('moved', models.PositiveIntegerField(default=0, help_text='Reports moved so far, live and archived')),
+                ('error', models.TextField(blank=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-requested_at'],
+            },
+        ),
+        migrations.RunPython(merge_job, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+
+
+def build_hourly_rollups(apps, schema_editor):
+    # Live table only, like 0007: archived years get theirs from `manage.py rebuild_rollups`
+    Report = apps.get_model('reports', 'Report')
+    HourlyRollup = apps.get_model('reports', 'HourlyRollup')
+    rows = (
+        Report.objects.filter(created_at__isnull=False)
+        .values('branch_id', 'sonologist_id', day=TruncDate('created_at'), hour=ExtractHour('created_at'))
+        .annotate(report_count=Count('id'), total=Sum('total_ultra'))
+        .order_by()
+    )
+    HourlyRollup.objects.bulk_create(
+        [
+            HourlyRollup(branch_id=row['branch_id'], sonologist_id=row['sonologist_id'], date=row['day'],
+                         hour=row['hour'], report_count=row['report_count'], total_ultra=row['total'])
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('masterdata', '0003_active_name_indexes'),
+        ('reports', '0014_request_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('total_ultra', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['date', 'hour'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['created_at'], name='report_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='hourlyrollup',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='masterdata.branch'),
+        ),
+        migrations.AddField(
+            model_name='hourlyrollup',
+            name='sonologist',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='masterdata.sonologist'),
+        ),
+        migrations.AddIndex(
+            model_name='hourlyrollup',
+            index=models.Index(fields=['branch', 'date'], name='hourly_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hourlyrollup',
+            index=models.Index(fields=['date'], name='hourly_date_idx'),
+        ),
+        migrations.RunPython(build_hourly_rollups, migrations.RunPython.noop),
+    ]
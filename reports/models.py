@@ -1,8 +1,85 @@
-from django.db import models
-from masterdata.models import ExamType
+import json
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Q
+from masterdata.models import BranchManager, BranchQuerySet, ExamType
+from masterdata.tenancy import get_current_branch
+
+
+# Change stream bumped by any masterdata save or delete (see reports.signals)
+MASTERDATA_STREAM = 'masterdata'
+
+
+class ChangeSequence(models.Model):
+    """Monotonic counter per change stream (e.g. 'report'), used as a sync cursor."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def next(cls, name):
+        """Increment and return the counter. Call inside the transaction that uses the value:
+        the row stays locked until commit, so sequence order matches commit order."""
+        return cls.reserve(name, 1)
+
+    @classmethod
+    def reserve(cls, name, count):
+        """Advance the counter by ``count`` and return the first value of the block, as next() does for one."""
+        from django.utils import timezone
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(value=F('value') + count, updated_at=timezone.now()):
+                cls.objects.create(name=name, value=count)
+            return cls.objects.values_list('value', flat=True).get(name=name) - count + 1
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+def normalize_patient_id(value):
+    """Patient ID as matched for history lookups: no spaces or separators, upper case; None if blank."""
+    key = re.sub(r'[\s\-/.]', '', value or '').upper()
+    return key or None
+
+
+def period_values(day):
+    """Stored period columns for a report date (see Report.year, month, iso_week and weekday)."""
+    iso_year, iso_week, iso_weekday = day.isocalendar()
+    return {
+        'year': day.year,
+        'month': day.replace(day=1),
+        'iso_week': iso_year * 100 + iso_week,
+        'weekday': iso_weekday,
+    }
+
+
+class ReportConflict(Exception):
+    """Raised when saving a Report that someone else changed or deleted since it was loaded."""
+
+
+class ReportQuerySet(BranchQuerySet):
+    def branch_q(self, branch):
+        # Unlike masterdata, reports are never shared between branches
+        return Q(branch=branch)
+
+
+class ReportManager(BranchManager.from_queryset(ReportQuerySet)):
+    pass
+
 
 class Report(models.Model):
+    branch = models.ForeignKey(
+        'masterdata.Branch',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='reports'
+    )
     id_number = models.CharField(max_length=100, blank=True, null=True)
+    # normalize_patient_id(id_number), set in save(); indexed for patient history and duplicate checks
+    patient_key = models.CharField(max_length=100, null=True, editable=False)
     date = models.DateField()
 
     exam_name = models.ForeignKey(
@@ -23,7 +100,7 @@ class Report(models.Model):
 
     def get_self_referrer():
         from masterdata.models import Referrer
-        return Referrer.objects.get_or_create(name='Self')[0].pk 
+        return Referrer.objects.get_or_create(name='Self', branch=None)[0].pk 
     
     referred_by = models.ForeignKey(
         'masterdata.Referrer',
@@ -51,11 +128,353 @@ class Report(models.Model):
     patient_name = models.CharField(max_length=200, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
 
+    # Change tracking (see ChangeFeedView)
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+    change_seq = models.PositiveBigIntegerField(default=0, db_index=True, editable=False)
+    # Optimistic locking: bumped on every save, which fails if the row moved on meanwhile
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Periods of `date`, stored so grouping reads plain indexed columns (set in save())
+    year = models.PositiveSmallIntegerField(default=0, editable=False)
+    month = models.DateField(null=True, editable=False, help_text="First day of the month")
+    iso_week = models.PositiveIntegerField(default=0, editable=False, help_text="ISO year * 100 + ISO week")
+    weekday = models.PositiveSmallIntegerField(default=0, editable=False, help_text="ISO weekday, Monday = 1")
+
+    CHANGE_STREAM = 'report'
+    PERIOD_FIELDS = ('year', 'month', 'iso_week', 'weekday')
+    # Fields the rollups aggregate on; report_changed carries their old and new values
+    AGGREGATED_FIELDS = ('branch_id', 'date', 'sonologist_id', 'referred_by_id', 'exam_type_id', 'total_ultra')
+    # Bookkeeping columns left out of the audit log
+    UNTRACKED_FIELDS = ('id', 'created_at', 'updated_at', 'change_seq', 'version', 'patient_key', *PERIOD_FIELDS)
+    DERIVED_FIELDS = ('patient_key', *PERIOD_FIELDS)
+
+    objects = ReportManager()  # Limited to the current branch, when there is one
+
     class Meta:
         ordering = ['-date']
-        indexes = [models.Index(fields=['date'])]
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['branch', 'date'], name='report_branch_date_idx'),
+            models.Index(fields=['branch', 'sonologist', 'date'], name='report_branch_son_date_idx'),
+            models.Index(fields=['created_at'], name='report_created_idx'),
+            # Covering indexes for period grouping
+            models.Index(fields=['date', 'referred_by', 'branch', 'total_ultra'], name='report_date_ref_idx'),
+            models.Index(fields=['month', 'sonologist', 'branch', 'date', 'total_ultra'], name='report_month_son_idx'),
+            models.Index(fields=['month', 'referred_by', 'branch', 'date', 'total_ultra'], name='report_month_ref_idx'),
+            models.Index(
+                fields=['patient_key', 'date', 'exam_name'],
+                name='report_patient_idx',
+                condition=Q(patient_key__isnull=False),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.branch_id is None and self._state.adding:
+            branch = get_current_branch()
+            self.branch_id = branch.pk if branch else None
+        self.date = self._meta.get_field('date').to_python(self.date)  # e.g. Report(date='2024-03-01')
+        self.check_year_open()
+        for field, value in period_values(self.date).items():
+            setattr(self, field, value)
+        self.patient_key = normalize_patient_id(self.id_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'change_seq', 'updated_at', 'version', *self.DERIVED_FIELDS}
+        # Stamp the row and save it in one transaction so change_seq order matches commit order.
+        with transaction.atomic():
+            self._previous = None if self._state.adding else self._check_version()
+            self.version += 1
+            self.change_seq = ChangeSequence.next(self.CHANGE_STREAM)
+            super().save(*args, **kwargs)
+
+    def clean(self):
+        super().clean()
+        if self.date is not None:
+            self.check_year_open()
+
+    def check_year_open(self):
+        """
+        Refuse dates in archived years (see reports.archive).
+
+        Report queries union per-year partitions without grouping again, so a
+        year's reports must all live in one table.
+        """
+        if ReportArchive.objects.filter(year=self.date.year).exists():
+            raise ValidationError({'date': f"{self.date.year} is archived; its reports can no longer be "
+                                           "added or changed."})
+
+    def _check_version(self):
+        """Lock the stored row and return its tracked fields; ReportConflict if it is not the version we loaded."""
+        stored = (
+            Report._base_manager.select_for_update()
+            .filter(pk=self.pk)
+            .values('version', *self.tracked_fields())
+            .first()
+        )
+        if stored is None or stored.pop('version') != self.version:
+            raise ReportConflict(f"Report {self.pk} was changed by someone else.")
+        return stored
+
+    @classmethod
+    def tracked_fields(cls):
+        return [f.attname for f in cls._meta.concrete_fields if f.attname not in cls.UNTRACKED_FIELDS]
+
+    def tracked_values(self):
+        return {field: getattr(self, field) for field in self.tracked_fields()}
+
+    def same_visit(self):
+        """Other reports of this patient, exam and date (a likely duplicate entry)."""
+        key = normalize_patient_id(self.id_number)
+        if key is None:
+            return Report.objects.none()
+        return Report.objects.filter(patient_key=key, date=self.date, exam_name_id=self.exam_name_id).exclude(pk=self.pk)
+
+    def aggregated_values(self):
+        return {field: getattr(self, field) for field in self.AGGREGATED_FIELDS}
 
     def __str__(self):
         exam = self.exam_name.name if self.exam_name else "—"
         referred = self.referred_by.name if self.referred_by else "—"
-        return f"{self.id_number or self.pk} - {self.date} - {referred} - {exam}"
\ No newline at end of file
+        return f"{self.id_number or self.pk} - {self.date} - {referred} - {exam}"
+
+
+class ReportTombstone(models.Model):
+    """Marks a deleted Report so change-feed consumers can drop it too."""
+    report_id = models.BigIntegerField()
+    change_seq = models.PositiveBigIntegerField(unique=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['change_seq']
+
+    def __str__(self):
+        return f"Report {self.report_id} deleted (seq {self.change_seq})"
+
+
+class ReportAuditQuerySet(models.QuerySet):
+    def for_report(self, report_id):
+        return self.filter(report_id=report_id)
+
+    def by_user(self, user):
+        return self.filter(user=user)
+
+    def between(self, start=None, end=None):
+        qs = self
+        if start:
+            qs = qs.filter(at__gte=start)
+        if end:
+            qs = qs.filter(at__lt=end)
+        return qs
+
+
+class ReportAudit(models.Model):
+    """
+    One save or delete of a Report, appended by reports.audit and never changed.
+
+    ``changes`` is compact JSON of only the fields that changed, by column
+    (foreign keys as ids): ``{"field": [old, new]}`` for an edit, the initial
+    values for a create and the last values for a delete. ``report_id`` is not
+    a foreign key, so the history outlives the report and its archive move.
+    """
+    CREATE, UPDATE, DELETE = 1, 2, 3
+    ACTION_CHOICES = [(CREATE, 'Create'), (UPDATE, 'Update'), (DELETE, 'Delete')]
+
+    report_id = models.BigIntegerField()
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    at = models.DateTimeField()
+    changes = models.TextField()
+
+    objects = ReportAuditQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-at']
+        indexes = [
+            models.Index(fields=['report_id', 'at'], name='audit_report_at_idx'),
+            models.Index(fields=['user', 'at'], name='audit_user_at_idx'),
+            models.Index(fields=['at'], name='audit_at_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Audit entries are append-only.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Audit entries are append-only.")
+
+    @property
+    def decoded_changes(self):
+        return json.loads(self.changes)
+
+    def __str__(self):
+        return f"Report {self.report_id} {self.get_action_display().lower()} at {self.at:%Y-%m-%d %H:%M}"
+
+
+class ReportArchive(models.Model):
+    """A closed year moved out of reports_report into its own table (see reports.archive)."""
+    year = models.PositiveSmallIntegerField(primary_key=True)
+    table_name = models.CharField(max_length=63)
+    report_count = models.PositiveIntegerField(default=0)
+    total_ultra = models.PositiveBigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['year']
+
+    def __str__(self):
+        return f"{self.year} ({self.report_count} reports)"
+
+
+class ReferrerStatement(models.Model):
+    """Rendered monthly statement PDF for one referrer, reused while its content is unchanged."""
+    branch = models.ForeignKey('masterdata.Branch', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    referrer = models.ForeignKey('masterdata.Referrer', on_delete=models.CASCADE, related_name='statements')
+    month = models.DateField(help_text="First day of the statement month")
+    content_hash = models.CharField(max_length=64)
+    report_count = models.PositiveIntegerField(default=0)
+    total_ultra = models.PositiveIntegerField(default=0)
+    pdf = models.BinaryField()
+    generated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month', 'referrer__name']
+        constraints = [models.UniqueConstraint(fields=['branch', 'referrer', 'month'], name='unique_referrer_statement')]
+
+    def __str__(self):
+        return f"{self.referrer} - {self.month:%B %Y}"
+
+
+class DailyRollup(models.Model):
+    """
+    Per-branch daily totals by sonologist, referrer and exam type (see reports.rollups).
+
+    Cross-branch reports read these instead of the report tables; a report save or
+    delete applies its change to the rows it moved out of and into.
+    """
+    branch = models.ForeignKey('masterdata.Branch', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    date = models.DateField()
+    month = models.DateField(null=True, editable=False, help_text="First day of the month")
+    sonologist = models.ForeignKey('masterdata.Sonologist', on_delete=models.SET_NULL, null=True, related_name='+')
+    referred_by = models.ForeignKey('masterdata.Referrer', on_delete=models.SET_NULL, null=True, related_name='+')
+    exam_type = models.ForeignKey('masterdata.ExamType', on_delete=models.SET_NULL, null=True, related_name='+')
+    report_count = models.PositiveIntegerField(default=0)
+    total_ultra = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['branch', 'date'], name='rollup_branch_date_idx'),
+            models.Index(fields=['date'], name='rollup_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch or 'No branch'} - {self.date}: {self.total_ultra}"
+
+
+class HourlyRollup(models.Model):
+    """
+    Reports entered per branch, day, hour and sonologist, by ``Report.created_at``
+    in local time (see reports.rollups). The dashboard's intraday panel reads these.
+    """
+    branch = models.ForeignKey('masterdata.Branch', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    sonologist = models.ForeignKey('masterdata.Sonologist', on_delete=models.SET_NULL, null=True, related_name='+')
+    report_count = models.PositiveIntegerField(default=0)
+    total_ultra = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['date', 'hour']
+        indexes = [
+            models.Index(fields=['branch', 'date'], name='hourly_branch_date_idx'),
+            models.Index(fields=['date'], name='hourly_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch or 'No branch'} - {self.date} {self.hour:02d}:00: {self.report_count}"
+
+
+class ScheduledJob(models.Model):
+    """A task run by the ``run_scheduler`` daemon on a cron schedule (see reports.scheduler)."""
+    TASK_CHOICES = [
+        ('warm_reports', 'Pre-warm report pages and exports'),
+        ('referrer_statements', "Generate last month's referrer statements"),
+        ('masterdata_merges', 'Run queued master data merges'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    task = models.CharField(max_length=50, choices=TASK_CHOICES)
+    cron = models.CharField(max_length=100, help_text="minute hour day-of-month month day-of-week, e.g. '45 19 * * *'")
+    is_active = models.BooleanField(default=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_status = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.cron})"
+
+
+class MasterdataMerge(models.Model):
+    """
+    A queued merge of duplicate master data rows (see reports.merge).
+
+    Staff queue merges from the duplicates page; the scheduler runs them. A merge
+    that was interrupted stays RUNNING and is resumed on the next run.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=20)
+    survivor_id = models.PositiveIntegerField()
+    loser_ids = models.JSONField()
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='+')
+    requested_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    moved = models.PositiveIntegerField(default=0, help_text="Reports moved so far, live and archived")
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-requested_at']
+
+    def __str__(self):
+        return f"{self.kind} {self.loser_ids} -> {self.survivor_id} ({self.status})"
+
+
+class RequestProfile(models.Model):
+    """One profiled request (see reports.profiling); the flamegraph and SQL timeline are files in PROFILE_DIR."""
+    created_at = models.DateTimeField(db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    status_code = models.PositiveSmallIntegerField(null=True)
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField()
+    sql_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    name = models.CharField(max_length=100, unique=True)  # file stem in PROFILE_DIR
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,196 @@
+# reports/pivot.py
+"""
+Cross-tab (pivot) reports over two or three dimensions.
+
+The dimensions are the report's foreign keys and its stored period columns.
+The whole matrix comes from one GROUP BY over all chosen dimensions (per
+archive partition). It is read from the daily rollups instead when every
+dimension is one the rollups keep. The grouped rows are then scattered into
+a dense NumPy grid with ``np.bincount`` over their flattened cell index, and
+totals are axis sums. No Python loop runs per cell until rendering. Grids of
+more than MAX_CELLS cells (date x referrer x exam name over years) raise
+PivotTooLarge before anything is allocated.
+"""
+import calendar
+from datetime import date
+
+from django.db.models import Count, Q, Sum
+
+from masterdata.models import Branch, ExamName, ExamType, Referrer, Sonologist
+from masterdata.tenancy import get_current_branch
+from .archive import partitions, union_all
+from .models import DailyRollup
+
+# name: (label, Report column, masterdata model for names or None for a period)
+DIMENSIONS = {
+    'referrer': ('Referrer', 'referred_by_id', Referrer),
+    'sonologist': ('Sonologist', 'sonologist_id', Sonologist),
+    'exam_type': ('Exam type', 'exam_type_id', ExamType),
+    'exam_name': ('Exam name', 'exam_name_id', ExamName),
+    'branch': ('Branch', 'branch_id', Branch),
+    'date': ('Date', 'date', None),
+    'iso_week': ('Week', 'iso_week', None),
+    'month': ('Month', 'month', None),
+    'year': ('Year', 'year', None),
+    'weekday': ('Weekday', 'weekday', None),
+}
+
+MEASURES = {
+    'usg': 'Total USG',
+    'reports': 'Reports',
+}
+
+# Columns DailyRollup also has, so pivots over only these can skip the report tables
+ROLLUP_COLUMNS = {'referred_by_id', 'sonologist_id', 'exam_type_id', 'branch_id', 'date', 'month'}
+
+NONE_LABEL = '(none)'
+
+# 8 MB of float64 while counting; far more cells than a page or spreadsheet can show
+MAX_CELLS = 1_000_000
+
+
+class PivotTooLarge(ValueError):
+    pass
+
+
+def _period_label(column, value):
+    if value is None:
+        return NONE_LABEL
+    if column == 'date':
+        return value.strftime('%d/%m/%Y')
+    if column == 'month':
+        return value.strftime('%b %Y')
+    if column == 'iso_week':
+        return f'{value // 100}-W{value % 100:02d}'
+    if column == 'weekday':
+        return calendar.day_abbr[value - 1]
+    return str(value)
+
+
+def _labels(dimension, keys):
+    """Display labels for a dimension's keys, in the order the axis should show them."""
+    _, column, model = DIMENSIONS[dimension]
+    if model is None:
+        labels = [_period_label(column, key) for key in keys]
+        order = sorted(range(len(keys)), key=lambda i: (keys[i] is None, keys[i] or 0))
+    else:
+        names = dict(model.objects.filter(pk__in=[k for k in keys if k is not None]).values_list('pk', 'name'))
+        labels = [names.get(key, NONE_LABEL) if key is not None else NONE_LABEL for key in keys]
+        order = sorted(range(len(keys)), key=lambda i: (keys[i] is None, labels[i].lower()))
+    return order, labels
+
+
+def _grouped(columns, start, end, source):
+    if source == 'rollups':
+        qs = DailyRollup.objects.filter(date__gte=start, date__lte=end)
+        branch = get_current_branch()
+        if branch is not None:
+            qs = qs.filter(branch=branch)
+        return qs.values_list(*columns).annotate(usg=Sum('total_ultra'), reports=Sum('report_count')).order_by()
+    filters = Q(date__gte=start, date__lte=end)
+    return union_all([
+        qs.values_list(*columns).annotate(usg=Sum('total_ultra'), reports=Count('id')).order_by()
+        for qs in partitions(filters, start, end)
+    ])
+
+
+class Pivot:
+    """
+    A computed pivot: ``grid[layer, row, column]`` holds the measure.
+
+    Without a layer dimension there is a single layer labelled ''.
+    """
+
+    def __init__(self, rows, columns, layer=None, start=None, end=None, measure='usg'):
+        import numpy as np
+
+        dims = [d for d in (layer, rows, columns) if d]
+        if len(set(dims)) != len(dims) or any(d not in DIMENSIONS for d in dims):
+            raise ValueError("Pivot dimensions must be distinct names from DIMENSIONS.")
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure {measure!r}")
+        self.row_dim, self.col_dim, self.layer_dim = rows, columns, layer
+        self.measure = measure
+        self.start, self.end = start, end
+
+        db_columns = [DIMENSIONS[d][1] for d in dims]
+        self.source = 'rollups' if set(db_columns) <= ROLLUP_COLUMNS else 'reports'
+        data = list(_grouped(db_columns, start, end, self.source))
+        n = len(data)
+        weights = np.fromiter((row[-2 if measure == 'usg' else -1] or 0 for row in data), dtype=np.float64, count=n)
+
+        axes = []
+        for position, dimension in enumerate(dims):
+            keys = [row[position] for row in data]
+            # Keys can be None, dates or ints: factorize with a dict instead of np.unique
+            codes, index = np.empty(n, dtype=np.int64), {}
+            for i, key in enumerate(keys):
+                codes[i] = index.setdefault(key, len(index))
+            unique = list(index)
+            order, labels = _labels(dimension, unique)
+            # Renumber codes so they follow the display order
+            rank = np.empty(len(unique), dtype=np.int64)
+            rank[order] = np.arange(len(unique))
+            axes.append((rank[codes], [labels[i] for i in order]))
+
+        if layer is None:
+            axes.insert(0, (np.zeros(n, dtype=np.int64), ['']))
+        (layer_codes, self.layer_labels), (row_codes, self.row_labels), (col_codes, self.col_labels) = axes
+        shape = (len(self.layer_labels), len(self.row_labels), len(self.col_labels))
+        cells = shape[0] * shape[1] * shape[2]
+        if cells > MAX_CELLS:
+            raise PivotTooLarge(
+                f"This pivot would have {cells:,} cells (at most {MAX_CELLS:,} are allowed). "
+                "Choose a shorter date range or coarser dimensions."
+            )
+        flat = (layer_codes * shape[1] + row_codes) * shape[2] + col_codes
+        self.grid = np.bincount(flat, weights=weights, minlength=cells).reshape(shape).astype(np.int64)
+
+    @property
+    def labels(self):
+        return {
+            'rows': DIMENSIONS[self.row_dim][0],
+            'columns': DIMENSIONS[self.col_dim][0],
+            'layer': DIMENSIONS[self.layer_dim][0] if self.layer_dim else '',
+            'measure': MEASURES[self.measure],
+        }
+
+    def tables(self):
+        """
+        One dict per layer: label, rows of (label, values, total), column totals and grand total.
+
+        Rows that are empty in a layer (a referrer with no reports that month) are left out.
+        """
+        for label, grid in zip(self.layer_labels, self.grid):
+            totals = grid.sum(axis=1)
+            shown = totals.nonzero()[0]
+            yield {
+                'label': label,
+                'rows': list(zip([self.row_labels[i] for i in shown], grid[shown].tolist(), totals[shown].tolist())),
+                'column_totals': grid.sum(axis=0).tolist(),
+                'total': int(grid.sum()),
+            }
+
+    def headers(self):
+        labels = self.labels
+        leading = [labels['layer'], labels['rows']] if self.layer_dim else [labels['rows']]
+        return leading + self.col_labels + ['Total']
+
+    def export_rows(self):
+        """
+        Flat rows for the export writers: one per layer and row, then each layer's totals.
+
+        Empty cells are left blank, as on screen; pivots are mostly empty, and
+        spreadsheet writers pay per written cell.
+        """
+        for table in self.tables():
+            leading = [table['label']] if self.layer_dim else []
+            for label, values, total in table['rows']:
+                yield leading + [label] + [value or None for value in values] + [total]
+            yield leading + ['Total'] + table['column_totals'] + [table['total']]
+
+
+def default_range(today=None):
+    """Year to date."""
+    today = today or date.today()
+    return today.replace(month=1, day=1), today
@@ -0,0 +1,264 @@
+# reports/profiling.py
+"""
+Opt-in request profiler for staff.
+
+A staff user adds ``?_profile=1`` to any URL (or sends ``X-Profile: 1``) and
+ProfilingMiddleware profiles that one request. It covers report pages,
+exports, master-data pages and anything else, with no change to the views.
+
+- A sampling profiler thread reads the stacks of the threads working on the
+  request every PROFILE_INTERVAL seconds, using ``sys._current_frames()``.
+  Those are the request's own thread while it runs the view, every thread
+  while it runs one of the request's queries, which covers pool threads
+  (reports.aio) and the shared sync thread under ASGI, and the thread that
+  generates a streamed body's next chunk. Other work on those threads is not
+  sampled. Idle frames (waiting on a lock, queue or selector) are not
+  counted. The stacks are saved in the collapsed format ("a;b;c 42") that
+  flamegraph.pl and speedscope read.
+- A database execute wrapper records every query: its start offset and
+  duration, and the project frames it came from. These are saved as the SQL
+  timeline (JSON).
+
+Profiling ends when the response is closed, so a streamed export is profiled
+until its last chunk. Profiles are listed in the admin (Request profiles);
+only the newest PROFILE_KEEP are kept.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from .models import RequestProfile
+
+_active = ContextVar('request_profile', default=None)
+
+# (file name, function) of frames where a thread sits idle
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('selectors.py', 'select'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+}
+ORIGIN_DEPTH = 6
+FILES = {'flamegraph': '.collapsed', 'sql': '.sql.json'}
+
+
+def requested(request):
+    return request.GET.get('_profile') not in (None, '', '0') or request.headers.get('X-Profile') == '1'
+
+
+@lru_cache(maxsize=1)
+def _prefixes():
+    return sorted({str(settings.BASE_DIR), *filter(None, sys.path)}, key=len, reverse=True)
+
+
+def _short(filename):
+    for prefix in _prefixes():
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _is_project(filename):
+    return filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in filename
+
+
+class Profile:
+    def __init__(self, request):
+        self.name = f'{timezone.localtime():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+        self.method = request.method
+        self.path = request.get_full_path()[:500]
+        self.started = time.perf_counter()
+        self.threads = Counter()  # thread ident -> blocks it is running for this request
+        self._threads_lock = threading.Lock()
+        self.samples = Counter()
+        self.queries = []
+        self.labels = {}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+        self._sampler.start()
+
+    # Sampling
+
+    def enter(self):
+        """Sample the calling thread until the matching leave()."""
+        with self._threads_lock:
+            self.threads[threading.get_ident()] += 1
+
+    def leave(self):
+        ident = threading.get_ident()
+        with self._threads_lock:
+            self.threads[ident] -= 1
+            if not self.threads[ident]:
+                del self.threads[ident]
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f'{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})'
+        return label
+
+    def _sample(self):
+        interval = settings.PROFILE_INTERVAL
+        names = {}
+        while not self._stop.wait(interval):
+            with self._threads_lock:
+                idents = list(self.threads)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                if ident not in names:
+                    names[ident] = next((t.name for t in threading.enumerate() if t.ident == ident), str(ident))
+                stack.append(names[ident])
+                self.samples[';'.join(reversed(stack))] += 1
+
+    # SQL timeline
+
+    def record_query(self, sql, many, started, duration):
+        origin = []
+        frame = sys._getframe(2)
+        while frame is not None and len(origin) < ORIGIN_DEPTH:
+            code = frame.f_code
+            if _is_project(code.co_filename) and not code.co_filename.endswith('profiling.py'):
+                origin.append(f'{_short(code.co_filename)}:{frame.f_lineno} {code.co_name}')
+            frame = frame.f_back
+        self.queries.append({
+            'start_ms': round((started - self.started) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+            'sql': sql[:2000],
+            'many': many,
+            'thread': threading.current_thread().name,
+            'origin': origin,
+        })
+
+    # Saving
+
+    def finish(self, status_code, user):
+        self._stop.set()
+        self._sampler.join()
+        duration = time.perf_counter() - self.started
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        base = os.path.join(settings.PROFILE_DIR, self.name)
+        with open(base + FILES['flamegraph'], 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(base + FILES['sql'], 'w') as f:
+            json.dump({'method': self.method, 'path': self.path, 'queries': self.queries}, f, indent=1)
+
+        RequestProfile.objects.create(
+            created_at=timezone.now(),
+            method=self.method,
+            path=self.path,
+            user=user,
+            status_code=status_code,
+            duration_ms=duration * 1000,
+            samples=sum(self.samples.values()),
+            sql_count=len(self.queries),
+            sql_ms=sum(q['duration_ms'] for q in self.queries),
+            name=self.name,
+        )
+        prune()
+
+
+def file_path(profile, kind):
+    """Path of a profile's 'flamegraph' (collapsed stacks) or 'sql' (timeline) file."""
+    return os.path.join(settings.PROFILE_DIR, profile.name + FILES[kind])
+
+
+def prune():
+    """Delete all but the newest PROFILE_KEEP profiles and their files."""
+    old = RequestProfile.objects.order_by('-created_at')[settings.PROFILE_KEEP:]
+    for profile in old:
+        for kind in FILES:
+            try:
+                os.remove(file_path(profile, kind))
+            except FileNotFoundError:
+                pass
+    RequestProfile.objects.filter(pk__in=[profile.pk for profile in old]).delete()
+
+
+def start(request):
+    profile = Profile(request)
+    profile.enter()
+    return profile, _active.set(profile)
+
+
+def stop(token):
+    _active.get().leave()
+    _active.reset(token)
+
+
+def _traced(profile, iterator):
+    iterator = iter(iterator)
+    while True:
+        token = _active.set(profile)
+        profile.enter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            profile.leave()
+            _active.reset(token)
+        yield chunk
+
+
+async def _atraced(profile, iterator):
+    iterator = aiter(iterator)
+    while True:
+        token = _active.set(profile)
+        profile.enter()
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            profile.leave()
+            _active.reset(token)
+        yield chunk
+
+
+def trace_stream(profile, response):
+    """Keep profiling while a streaming response's body is generated, after the view has returned."""
+    content = response.streaming_content
+    response.streaming_content = _atraced(profile, content) if response.is_async else _traced(profile, content)
+
+
+def _execute(execute, sql, params, many, context):
+    profile = _active.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    profile.enter()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record_query(sql, many, started, time.perf_counter() - started)
+        profile.leave()
+
+
+def _install(sender, connection, **kwargs):
+    # Every connection gets the wrapper; it only records inside a profiled request
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+connection_created.connect(_install)
@@ -0,0 +1,276 @@
+# reports/rollups.py
+"""
+Daily rollups for cross-branch reporting.
+
+``DailyRollup`` holds one row per (branch, day, sonologist, referrer, exam type)
+with the report count and USG total. Saving or deleting a report applies the
+exact change from the ``report_changed`` signal: one row loses the report and
+one gains it, and edits that touch none of the grouped fields or the USG count
+skip the rollups altogether. ``rebuild()`` recomputes a whole date range, for
+backfills and after bulk updates that bypass signals.
+
+``HourlyRollup`` buckets the same changes by the hour the report was entered
+(``created_at`` in local time), per branch and sonologist, for the dashboard's
+intraday panel. ``created_at`` never changes, so an edit only moves a report
+between buckets of the same hour.
+"""
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from masterdata.models import Branch, Sonologist
+from masterdata.tenancy import using_branch
+from .archive import partitions, union_all
+from .models import DailyRollup, HourlyRollup
+
+GROUP_FIELDS = ('branch_id', 'date', 'sonologist_id', 'referred_by_id', 'exam_type_id')
+HOURLY_FIELDS = ('branch_id', 'sonologist_id')
+TRAILING_WEEKS = 4
+
+
+def _aggregate(filters, start=None, end=None):
+    with using_branch(None):  # callers pass the branch explicitly
+        return union_all([
+            qs.values(*GROUP_FIELDS).annotate(report_count=Count('id'), total=Sum('total_ultra'))
+            for qs in partitions(filters, start, end)
+        ])
+
+
+def _store(rows):
+    DailyRollup.objects.bulk_create(
+        [
+            DailyRollup(**{field: row[field] for field in GROUP_FIELDS}, month=row['date'].replace(day=1),
+                        report_count=row['report_count'], total_ultra=row['total'])
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+def recompute_day(branch_id, day):
+    """Replace the rollup rows of one branch and day with fresh totals."""
+    with transaction.atomic():
+        DailyRollup.objects.filter(branch_id=branch_id, date=day).delete()
+        _store(_aggregate(Q(branch_id=branch_id, date=day), day, day))
+
+
+def hour_bucket(created_at):
+    """(local date, hour) of the HourlyRollup bucket a report entered at ``created_at`` counts in."""
+    local = timezone.localtime(created_at)
+    return local.date(), local.hour
+
+
+def _entered(start, end):
+    filters = Q(created_at__isnull=False)
+    if start:
+        filters &= Q(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        filters &= Q(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    return filters
+
+
+def _aggregate_hourly(filters, start=None, end=None):
+    # Reports are entered on or after their date, and not more than a year after it
+    first = date(start.year - 1, 1, 1) if start else None
+    with using_branch(None):
+        return union_all([
+            qs.values(*HOURLY_FIELDS, day=TruncDate('created_at'), hour=ExtractHour('created_at'))
+            .annotate(report_count=Count('id'), total=Sum('total_ultra'))
+            for qs in partitions(filters & _entered(start, end), first, end)
+        ])
+
+
+def _store_hourly(rows):
+    # Report dates never span partitions (Report.check_year_open), but entry times
+    # do: a report dated late in a year may be entered early in the next, and
+    # only its own year is archived. One bucket can come back once per partition.
+    buckets = defaultdict(lambda: [0, 0])
+    for row in rows:
+        bucket = buckets[(*(row[field] for field in HOURLY_FIELDS), row['day'], row['hour'])]
+        bucket[0] += row['report_count']
+        bucket[1] += row['total']
+    HourlyRollup.objects.bulk_create(
+        [
+            HourlyRollup(**dict(zip(HOURLY_FIELDS, key)), date=key[-2], hour=key[-1],
+                         report_count=count, total_ultra=total)
+            for key, (count, total) in buckets.items()
+        ],
+        batch_size=1000,
+    )
+    return len(buckets)
+
+
+def recompute_hours(branch_id, day):
+    """Replace the hourly rollup rows of one branch and entry day with fresh totals."""
+    with transaction.atomic():
+        HourlyRollup.objects.filter(branch_id=branch_id, date=day).delete()
+        _store_hourly(_aggregate_hourly(Q(branch_id=branch_id), day, day))
+
+
+def _bump(model, key, count, total_ultra, **defaults):
+    rows = model.objects.filter(**key)
+    changed = rows.update(
+        report_count=F('report_count') + count,
+        total_ultra=F('total_ultra') + total_ultra,
+    )
+    if count > 0 and not changed:
+        model.objects.create(**key, **defaults, report_count=count, total_ultra=total_ultra)
+    elif count < 0:
+        rows.filter(report_count__lte=0).delete()
+
+
+def _daily_key(values):
+    return tuple(values[field] for field in GROUP_FIELDS)
+
+
+def _hourly_key(values, created_at):
+    return (*(values[field] for field in HOURLY_FIELDS), *hour_bucket(created_at))
+
+
+def apply_changes(changes):
+    """
+    Apply many reports' changes at once, as (old, new, created_at) like apply_change().
+
+    Changes that land in the same rollup row are netted first, so moving a
+    thousand reports costs a few updates per row touched, not per report.
+    """
+    daily, hourly = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+    for old, new, created_at in changes:
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            for deltas, key in ((daily, _daily_key(values)),
+                                (hourly, _hourly_key(values, created_at) if created_at else None)):
+                if key is not None:
+                    deltas[key][0] += sign
+                    deltas[key][1] += sign * values['total_ultra']
+    with transaction.atomic():
+        for key, (count, total) in daily.items():
+            if count or total:
+                _bump(DailyRollup, dict(zip(GROUP_FIELDS, key)), count, total, month=key[1].replace(day=1))
+        for key, (count, total) in hourly.items():
+            if count or total:
+                _bump(HourlyRollup, dict(zip((*HOURLY_FIELDS, 'date', 'hour'), key)), count, total)
+
+
+def apply_change(old, new, created_at=None):
+    """
+    Move one report's contribution from the ``old`` values to the ``new`` ones (either may be None).
+
+    With ``created_at`` the report's hourly bucket is updated too.
+    """
+    if old != new:
+        apply_changes([(old, new, created_at)])
+
+
+def rebuild(start=None, end=None):
+    """
+    Recompute every rollup row between start and end (all dates when omitted). Returns rows written.
+
+    Daily rows are selected by report date, hourly rows by the day the report was entered.
+    """
+    filters = Q()
+    if start:
+        filters &= Q(date__gte=start)
+    if end:
+        filters &= Q(date__lte=end)
+    with transaction.atomic():
+        DailyRollup.objects.filter(filters).delete()
+        rows = list(_aggregate(filters, start, end))
+        _store(rows)
+        HourlyRollup.objects.filter(filters).delete()
+        hourly = _store_hourly(_aggregate_hourly(Q(), start, end))
+    return len(rows) + hourly
+
+
+def hourly_throughput(day, branch=None):
+    """
+    Reports entered per hour on ``day`` against the mean of the same weekday over
+    the previous TRAILING_WEEKS weeks, and each sonologist's busiest hour that day.
+    Read from the hourly rollups only.
+    """
+    past = [day - timedelta(weeks=week) for week in range(1, TRAILING_WEEKS + 1)]
+    rows = HourlyRollup.objects.filter(date__in=[day, *past])
+    if branch is not None:
+        rows = rows.filter(branch=branch)
+
+    today, trailing = [0] * 24, [0] * 24
+    per_sonologist = defaultdict(lambda: [0] * 24)
+    for row in rows.values('date', 'hour', 'sonologist_id').annotate(reports=Sum('report_count')).order_by():
+        if row['date'] == day:
+            today[row['hour']] += row['reports']
+            per_sonologist[row['sonologist_id']][row['hour']] += row['reports']
+        else:
+            trailing[row['hour']] += row['reports']
+    average = [round(total / TRAILING_WEEKS, 1) for total in trailing]
+
+    busy = [hour for hour in range(24) if today[hour] or average[hour]]
+    hours = range(busy[0], busy[-1] + 1) if busy else range(0)
+    names = dict(Sonologist.objects.filter(pk__in=[pk for pk in per_sonologist if pk]).values_list('id', 'name'))
+    sonologists = sorted(
+        (
+            {
+                'sonologist': names.get(sonologist_id, 'Unassigned'),
+                'reports': sum(counts),
+                'peak_hour': f'{counts.index(max(counts)):02d}:00',
+                'peak': max(counts),
+            }
+            for sonologist_id, counts in per_sonologist.items()
+        ),
+        key=lambda row: -row['reports'],
+    )
+    return {
+        'hours': [f'{hour:02d}:00' for hour in hours],
+        'today': [today[hour] for hour in hours],
+        'average': [average[hour] for hour in hours],
+        'weeks': TRAILING_WEEKS,
+        'sonologists': sonologists,
+    }
+
+
+def consolidated(start, end):
+    """
+    Monthly totals per branch for [start, end], read from the rollups only.
+
+    Returns (months, rows, totals): ``rows`` has one entry per branch with its
+    per-month USG totals aligned to ``months``.
+    """
+    data = (
+        DailyRollup.objects.filter(date__gte=start, date__lte=end)
+        .values('branch_id', 'month')
+        .annotate(reports=Sum('report_count'), total=Sum('total_ultra'))
+        .order_by('month')
+    )
+    months = []
+    branches = OrderedDict()
+    for row in data:
+        if row['month'] not in months:
+            months.append(row['month'])
+        entry = branches.setdefault(row['branch_id'], {'months': {}, 'reports': 0, 'total': 0})
+        entry['months'][row['month']] = row['total']
+        entry['reports'] += row['reports']
+        entry['total'] += row['total']
+
+    names = dict(Branch.objects.filter(pk__in=[b for b in branches if b]).values_list('id', 'name'))
+    rows = sorted(
+        (
+            {
+                'branch': names.get(branch_id, 'Unassigned'),
+                'monthly': [entry['months'].get(month, 0) for month in months],
+                'reports': entry['reports'],
+                'total': entry['total'],
+            }
+            for branch_id, entry in branches.items()
+        ),
+        key=lambda row: row['branch'],
+    )
+    totals = {
+        'monthly': [sum(row['monthly'][i] for row in rows) for i in range(len(months))],
+        'reports': sum(row['reports'] for row in rows),
+        'total': sum(row['total'] for row in rows),
+    }
+    return months, rows, totals
@@ -0,0 +1,188 @@
+# reports/scheduler.py
+"""
+Cron-style jobs for the ``run_scheduler`` daemon.
+
+``ScheduledJob`` rows hold a standard five-field cron spec and a task name.
+The main task, ``warm_reports``, renders the daily, exam-type and monthly report
+pages and their xlsx/pdf exports through the normal views, which puts them in
+the page cache (reports.caching) before the closing-time rush. Cached entries
+are keyed by the data version, so a report entered after the warm-up simply
+misses the cache and renders fresh; the next scheduled run warms it again.
+``masterdata_merges`` runs the master data merges staff queued (reports.merge).
+"""
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.timezone import localdate
+
+from masterdata.middleware import branch_for_code
+from masterdata.tenancy import using_branch
+from .models import ScheduledJob
+
+FIELD_RANGES = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 6),  # 0 = Sunday; 7 is accepted as Sunday too
+)
+
+
+class CronSpec:
+    """Minimal cron spec: ``*``, ``a``, ``a-b``, lists and ``/step`` in each of the five fields."""
+
+    def __init__(self, spec):
+        parts = spec.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron spec needs 5 fields, got {spec!r}")
+        self.spec = spec
+        self.fields = {}
+        for text, (name, low, high) in zip(parts, FIELD_RANGES):
+            self.fields[name] = self._parse_field(text, low, 7 if name == 'weekday' else high)
+        if 7 in self.fields['weekday']:
+            self.fields['weekday'] = (self.fields['weekday'] - {7}) | {0}
+        # Like cron: when both day fields are restricted, either may match
+        self.any_day = parts[2] == '*' or parts[4] == '*'
+
+    @staticmethod
+    def _parse_field(text, low, high):
+        values = set()
+        for item in text.split(','):
+            body, _, step = item.partition('/')
+            step = int(step) if step else 1
+            if body == '*':
+                start, end = low, high
+            elif '-' in body:
+                start, end = map(int, body.split('-', 1))
+            else:
+                start = end = int(body)
+                if step > 1:
+                    end = high
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"Bad cron field {text!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, moment):
+        fields = self.fields
+        if moment.minute not in fields['minute'] or moment.hour not in fields['hour']:
+            return False
+        if moment.month not in fields['month']:
+            return False
+        day_ok = moment.day in fields['day']
+        weekday_ok = (moment.isoweekday() % 7) in fields['weekday']
+        return (day_ok and weekday_ok) if self.any_day else (day_ok or weekday_ok)
+
+    def next_after(self, moment, limit_days=366):
+        """First matching minute strictly after ``moment``."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = candidate + timedelta(days=limit_days)
+        while candidate < end:
+            if self.matches(candidate):
+                return candidate
+            candidate += timedelta(minutes=1)
+        return None
+
+
+# Tasks
+
+def _warm_targets(today):
+    """(url name, kwargs, query) for the pages and exports staff open at closing time."""
+    fmt = '%d/%m/%Y'
+    today_range = {'start_date': today.strftime(fmt), 'end_date': today.strftime(fmt)}
+    month_range = {'start_date': today.replace(day=1).strftime(fmt), 'end_date': today.strftime(fmt)}
+    reports = [
+        ('reports:daily_report', 'reports:daily_export', [{}, today_range]),
+        ('reports:exam_type_report', 'reports:exam_type_export', [{}, today_range]),
+        ('reports:monthly_report', 'reports:monthly_export', [{}, month_range]),
+    ]
+    for page, export, queries in reports:
+        for query in queries:
+            yield page, {}, query
+            for fmt_name in ('xlsx', 'pdf'):
+                yield export, {'fmt': fmt_name}, query
+
+
+def _render(request_factory, branch, name, kwargs, query):
+    path = reverse(name, kwargs=kwargs)
+    request = request_factory.get(path, query)
+    request.branch = branch
+    request.resolver_match = match = resolve(path)
+    view = match.func
+    if iscoroutinefunction(view):
+        return async_to_sync(view)(request, *match.args, **match.kwargs)
+    return view(request, *match.args, **match.kwargs)
+
+
+def warm_reports(job):
+    from django.test import RequestFactory  # scheduler process only
+
+    factory = RequestFactory()
+    branch = branch_for_code(settings.BRANCH_CODE)
+    warmed = failed = 0
+    started = time.monotonic()
+    with using_branch(branch):
+        for name, kwargs, query in _warm_targets(localdate()):
+            response = _render(factory, branch, name, kwargs, query)
+            if response.status_code == 200:
+                warmed += 1
+            else:
+                failed += 1
+    return f"warmed {warmed}, failed {failed} in {time.monotonic() - started:.1f}s"
+
+
+def referrer_statements(job):
+    from . import statements
+
+    last_month = (localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+    with using_branch(branch_for_code(settings.BRANCH_CODE)):
+        result = statements.generate(last_month)
+    return f"{last_month:%Y-%m}: rendered {result['rendered']}, unchanged {result['unchanged']}"
+
+
+def masterdata_merges(job):
+    from . import merge
+
+    ran = merge.run_queued()
+    return "another process is running merges" if ran is None else f"ran {ran} merges"
+
+
+TASKS = {
+    'warm_reports': warm_reports,
+    'referrer_statements': referrer_statements,
+    'masterdata_merges': masterdata_merges,
+}
+
+
+def run_job(job):
+    """Run one job now and record the outcome on it."""
+    try:
+        status = TASKS[job.task](job)
+    except Exception as exc:
+        status = f"failed: {exc!r}"
+    ScheduledJob.objects.filter(pk=job.pk).update(last_status=status[:1000])
+    return status
+
+
+def claim(job, minute):
+    """Mark ``job`` as run for ``minute``; False if another scheduler process already did."""
+    return bool(
+        ScheduledJob.objects.filter(pk=job.pk)
+        .exclude(last_run_at__gte=minute)
+        .update(last_run_at=minute)
+    )
+
+
+def due_jobs(moment):
+    moment = timezone.localtime(moment).replace(second=0, microsecond=0)
+    for job in ScheduledJob.objects.filter(is_active=True):
+        try:
+            spec = CronSpec(job.cron)
+        except ValueError:
+            continue
+        if spec.matches(moment):
+            yield job, moment
@@ -0,0 +1,56 @@
+# reports/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from masterdata.models import Branch, ExamName, ExamType, Referrer, Sonologist
+from . import audit, rollups
+from .models import MASTERDATA_STREAM, ChangeSequence, Report, ReportTombstone
+
+
+@receiver(post_delete, sender=Report)
+def record_tombstone(sender, instance, **kwargs):
+    # Runs inside the deletion transaction, for queryset deletes too.
+    ReportTombstone.objects.create(
+        report_id=instance.pk,
+        change_seq=ChangeSequence.next(Report.CHANGE_STREAM),
+    )
+
+
+# Sent inside the saving transaction with the AGGREGATED_FIELDS values before and
+# after a report save or delete; ``old`` is None for a new report, ``new`` after a delete.
+report_changed = Signal()
+
+
+@receiver(post_save, sender=Report)
+def send_report_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # Fixture loading bypasses Report.save(), so there is no old state to diff against
+        rollups.recompute_day(instance.branch_id, instance.date)
+        if instance.created_at is not None:
+            rollups.recompute_hours(instance.branch_id, rollups.hour_bucket(instance.created_at)[0])
+        return
+    previous = instance._previous
+    old = {field: previous[field] for field in Report.AGGREGATED_FIELDS} if previous else None
+    report_changed.send(sender=Report, instance=instance, old=old, new=instance.aggregated_values())
+    audit.record_save(instance, created)
+
+
+@receiver(post_delete, sender=Report)
+def send_report_deleted(sender, instance, **kwargs):
+    report_changed.send(sender=Report, instance=instance, old=instance.aggregated_values(), new=None)
+    audit.record_delete(instance)
+
+
+@receiver(report_changed)
+def update_rollups(sender, instance, old, new, **kwargs):
+    rollups.apply_change(old, new, instance.created_at)
+
+
+@receiver([post_save, post_delete], sender=Branch)
+@receiver([post_save, post_delete], sender=ExamName)
+@receiver([post_save, post_delete], sender=ExamType)
+@receiver([post_save, post_delete], sender=Referrer)
+@receiver([post_save, post_delete], sender=Sonologist)
+def bump_masterdata_version(sender, instance, **kwargs):
+    # Names and dropdowns on cached report pages come from masterdata (see reports.caching)
+    ChangeSequence.next(MASTERDATA_STREAM)
@@ -0,0 +1,119 @@
+# reports/statements.py
+"""
+Monthly referrer (commission) statements.
+
+``generate()`` computes every referrer's totals for a month in one aggregate
+query per archive partition and renders each statement's HTML. Only PDFs whose
+HTML changed since the last run are re-rendered, in a process pool because
+xhtml2pdf layout is CPU-bound. It runs from the referrer_statements scheduler
+task and ``manage.py generate_statements``, never in a web worker.
+``write_zip()`` packs the month's stored PDFs for download.
+"""
+import calendar
+import hashlib
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.template.loader import get_template
+
+from masterdata.models import Referrer
+from masterdata.tenancy import get_current_branch
+from .archive import partitions, union_all
+from .models import ReferrerStatement
+from .utils import render_pdf_bytes
+
+TEMPLATE = "reports/referrer_statement_pdf.html"
+
+
+def month_bounds(month):
+    first = month.replace(day=1)
+    return first, first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+
+def statement_lines(first, last):
+    """{referrer_id: [{"exam_name", "reports", "total_usg"}, ...]} for the period, in one pass."""
+    rows = union_all([
+        qs.values("referred_by_id", "exam_name__name")
+          .annotate(reports=Count("id"), total_usg=Sum("total_ultra"))
+        for qs in partitions(Q(date__gte=first, date__lte=last, referred_by__isnull=False), first, last)
+    ]).order_by("referred_by_id", "exam_name__name")
+
+    lines = {}
+    for r in rows:
+        referrer_lines = lines.setdefault(r["referred_by_id"], [])
+        exam_name = r["exam_name__name"] or "Unknown"
+        if referrer_lines and referrer_lines[-1]["exam_name"] == exam_name:
+            # Same group from another archive partition
+            referrer_lines[-1]["reports"] += r["reports"]
+            referrer_lines[-1]["total_usg"] += r["total_usg"]
+        else:
+            referrer_lines.append({"exam_name": exam_name, "reports": r["reports"], "total_usg": r["total_usg"]})
+    return lines
+
+
+def render_all(htmls, workers=None):
+    """Render HTML documents to PDF bytes, in a process pool when there is more than one."""
+    workers = workers or getattr(settings, "STATEMENT_WORKERS", None) or os.cpu_count() or 1
+    if workers == 1 or len(htmls) < 2:
+        return [render_pdf_bytes(html) for html in htmls]
+    with ProcessPoolExecutor(max_workers=min(workers, len(htmls))) as pool:
+        return list(pool.map(render_pdf_bytes, htmls, chunksize=4))
+
+
+def generate(month, workers=None):
+    """Bring the month's statements (for the current branch) up to date. Returns {"rendered": n, "unchanged": n}."""
+    first, last = month_bounds(month)
+    branch = get_current_branch()
+    lines = statement_lines(first, last)
+    referrers = Referrer.objects.in_bulk(list(lines))
+    stored = ReferrerStatement.objects.filter(branch=branch, month=first)
+    existing = dict(stored.values_list("referrer_id", "content_hash"))
+    template = get_template(TEMPLATE)
+
+    pending = []
+    for referrer_id, referrer_lines in lines.items():
+        context = {
+            "referrer": referrers[referrer_id],
+            "month": first,
+            "month_end": last,
+            "lines": referrer_lines,
+            "report_count": sum(line["reports"] for line in referrer_lines),
+            "total_ultra": sum(line["total_usg"] for line in referrer_lines),
+        }
+        html = template.render(context)
+        content_hash = hashlib.sha256(html.encode()).hexdigest()
+        if existing.get(referrer_id) != content_hash:
+            pending.append((referrer_id, context, html, content_hash))
+
+    pdfs = render_all([html for _, _, html, _ in pending], workers)
+    for (referrer_id, context, _, content_hash), pdf in zip(pending, pdfs):
+        ReferrerStatement.objects.update_or_create(branch=branch, referrer_id=referrer_id, month=first, defaults={
+            "content_hash": content_hash,
+            "report_count": context["report_count"],
+            "total_ultra": context["total_ultra"],
+            "pdf": pdf,
+        })
+
+    # Referrers whose reports were all moved or deleted no longer get a statement
+    stored.exclude(referrer_id__in=list(lines)).delete()
+    return {"rendered": len(pending), "unchanged": len(lines) - len(pending)}
+
+
+def stored(month):
+    """The month's generated statements for the current branch."""
+    first, _ = month_bounds(month)
+    return ReferrerStatement.objects.filter(branch=get_current_branch(), month=first)
+
+
+def write_zip(month, fileobj):
+    """Write the month's statement PDFs (for the current branch) into ``fileobj`` as a zip archive."""
+    first, _ = month_bounds(month)
+    statements = stored(month).order_by("referrer__name").values_list("referrer_id", "referrer__name", "pdf")
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+        for referrer_id, name, pdf in statements.iterator(chunk_size=20):
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+            archive.writestr(f"{first:%Y_%m}_{slug}_{referrer_id}.pdf", bytes(pdf))
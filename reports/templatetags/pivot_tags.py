@@ -0,0 +1,21 @@
+# usg_records/reports/templatetags/pivot_tags.py
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@register.simple_tag
+def pivot_rows(rows):
+    """
+    Body rows of a pivot table: label, cells (blank for zero) and a bold total.
+
+    Built as one string because a large pivot has hundreds of thousands of cells,
+    far more than per-cell template tags render in reasonable time.
+    """
+    parts = []
+    for label, values, total in rows:
+        cells = '</td><td>'.join(str(value) if value else '' for value in values)
+        parts.append(f'<tr><td>{escape(label)}</td><td>{cells}</td><td class="fw-bold">{total}</td></tr>')
+    return mark_safe('\n'.join(parts))
@@ -0,0 +1,919 @@
+import contextvars
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import zipfile
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from masterdata.models import ExamName, ExamType, Referrer, Sonologist
+from . import analytics, archive, audit, caching, memory, merge, pivot, profiling, rollups, statements
+from .forms import AnalyticsFilterForm, ReportForm
+from .locks import SingleFlight, take_export_slot
+from .models import (
+    DailyRollup, HourlyRollup, MasterdataMerge, Report, ReportArchive, ReportAudit, ReportConflict, RequestProfile,
+    normalize_patient_id,
+)
+from .scheduler import CronSpec
+
+
+# Fresh test databases restart the data version, so cached pages must not outlive a run
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ReportFixtures:
+    """Master data and report helpers shared by the tests below (which run with LOCAL_CACHE)."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.sonologists = [Sonologist.objects.create(name=f'Sonologist {i}') for i in range(3)]
+        self.referrers = [Referrer.objects.create(name=f'Referrer {i}') for i in range(3)]
+        self.exam_name = ExamName.objects.create(name='Whole abdomen')
+        self.exam_types = [ExamType.objects.create(name=name) for name in ('Normal', 'Special')]
+
+    def tearDown(self):
+        audit.flush()  # the writer thread must not outlive the test's data
+        super().tearDown()
+
+    def report(self, day, i=0, **fields):
+        values = {
+            'date': day,
+            'id_number': f'P{i}',
+            'exam_name': self.exam_name,
+            'exam_type': self.exam_types[i % 2],
+            'referred_by': self.referrers[i % 3],
+            'sonologist': self.sonologists[i % 3],
+            'total_ultra': i % 2 + 1,
+        }
+        values.update(fields)
+        return Report.objects.create(**values)
+
+    def assertRollupsMatchRebuild(self):
+        def rows():
+            return (
+                sorted(DailyRollup.objects.values_list('branch_id', 'date', 'sonologist_id', 'referred_by_id',
+                                                       'exam_type_id', 'report_count', 'total_ultra'), key=str),
+                sorted(HourlyRollup.objects.values_list('branch_id', 'date', 'hour', 'sonologist_id',
+                                                        'report_count', 'total_ultra'), key=str),
+            )
+        incremental = rows()
+        rollups.rebuild()
+        self.assertEqual(incremental, rows())
+
+
+class ArchiveTables:
+    """Drop the archive tables a TransactionTestCase created; flushing leaves unmanaged tables behind."""
+
+    def tearDown(self):
+        with connection.schema_editor() as editor:
+            for year in archive.archived_years():
+                editor.delete_model(archive.archive_model(year))
+        super().tearDown()
+
+
+class AnalyticsRangeTests(SimpleTestCase):
+    def form(self, **data):
+        return AnalyticsFilterForm(data)
+
+    def test_missing_dates_default_to_the_last_year(self):
+        form = self.form()
+        self.assertTrue(form.is_valid())
+        start, end = analytics.default_range(timezone.localdate())
+        self.assertEqual((form.cleaned_data['start_date'], form.cleaned_data['end_date']), (start, end))
+
+    def test_start_alone_after_the_default_end_is_rejected(self):
+        self.assertFalse(self.form(start_date='01/01/2030').is_valid())
+
+    def test_end_alone_before_the_default_start_is_rejected(self):
+        self.assertFalse(self.form(end_date='01/01/2020').is_valid())
+
+    def test_inverted_range_is_rejected(self):
+        self.assertFalse(self.form(start_date='02/01/2024', end_date='01/01/2024').is_valid())
+
+    def test_span_is_capped(self):
+        end = date(2024, 12, 31)
+        start = end - timedelta(days=analytics.MAX_DAYS)
+        self.assertFalse(self.form(start_date=start.isoformat(), end_date=end.isoformat()).is_valid())
+        start += timedelta(days=1)
+        self.assertTrue(self.form(start_date=start.isoformat(), end_date=end.isoformat()).is_valid())
+
+
+class CronSpecTests(SimpleTestCase):
+    def test_fields(self):
+        spec = CronSpec('*/15 8-10,18 1 * *')
+        self.assertEqual(spec.fields['minute'], {0, 15, 30, 45})
+        self.assertEqual(spec.fields['hour'], {8, 9, 10, 18})
+        self.assertEqual(spec.fields['day'], {1})
+        self.assertEqual(spec.fields['month'], set(range(1, 13)))
+        self.assertEqual(CronSpec('5/20 * * * *').fields['minute'], {5, 25, 45})
+
+    def test_weekdays(self):
+        closing = CronSpec('30 18 * * 1-5')
+        self.assertTrue(closing.matches(datetime(2024, 3, 4, 18, 30)))  # Monday
+        self.assertTrue(closing.matches(datetime(2024, 3, 8, 18, 30)))  # Friday
+        self.assertFalse(closing.matches(datetime(2024, 3, 9, 18, 30)))  # Saturday
+        self.assertFalse(closing.matches(datetime(2024, 3, 4, 18, 31)))
+        sunday = datetime(2024, 3, 3)
+        self.assertTrue(CronSpec('0 0 * * 0').matches(sunday))
+        self.assertTrue(CronSpec('0 0 * * 7').matches(sunday))
+        self.assertEqual(CronSpec('0 0 * * 7').fields['weekday'], {0})
+
+    def test_day_of_month_or_weekday_when_both_are_restricted(self):
+        spec = CronSpec('0 0 1 * 1')
+        self.assertTrue(spec.matches(datetime(2024, 3, 1)))  # the 1st, a Friday
+        self.assertTrue(spec.matches(datetime(2024, 3, 4)))  # a Monday
+        self.assertFalse(spec.matches(datetime(2024, 3, 5)))
+        first_only = CronSpec('0 0 1 * *')
+        self.assertFalse(first_only.matches(datetime(2024, 3, 4)))
+
+    def test_next_after_is_strictly_later(self):
+        closing = CronSpec('30 18 * * 1-5')
+        self.assertEqual(closing.next_after(datetime(2024, 3, 8, 18, 29, 59)), datetime(2024, 3, 8, 18, 30))
+        self.assertEqual(closing.next_after(datetime(2024, 3, 8, 18, 30)), datetime(2024, 3, 11, 18, 30))
+        self.assertIsNone(CronSpec('0 0 31 2 *').next_after(datetime(2024, 1, 1), limit_days=60))
+
+    def test_invalid_specs(self):
+        for spec in ('* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *', '* * * * 8',
+                     '*/0 * * * *', '5-1 * * * *', 'x * * * *'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                CronSpec(spec)
+
+
+class AnalyticsViewTests(TestCase):
+    def test_one_sided_ranges_are_a_bad_request(self):
+        for query in ('start_date=01/01/2030', 'end_date=01/01/2020'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/dashboard/analytics/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('errors', response.json())
+
+    def test_single_day_range(self):
+        day = date(2024, 3, 1)
+        result = analytics.compute(day, day, horizon=3)
+        self.assertEqual(len(result['days']), 1)
+        self.assertEqual(len(result['forecast']), 3)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StatementTests(ReportFixtures, TestCase):
+    url = '/reports/statements/'
+    month = date(2024, 3, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.report(date(2024, 3, 1), 0)
+        self.second = self.report(date(2024, 3, 2), 1)
+        patcher = mock.patch.object(statements, 'render_pdf_bytes', side_effect=lambda html: html.encode())
+        self.renders = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self):
+        return statements.generate(self.month, workers=1)
+
+    def test_unchanged_statements_are_not_rendered_again(self):
+        self.assertEqual(self.generate(), {'rendered': 2, 'unchanged': 0})
+        self.assertEqual(self.generate(), {'rendered': 0, 'unchanged': 2})
+        self.assertEqual(self.renders.call_count, 2)
+
+        self.first.total_ultra = 5
+        self.first.save()
+        self.assertEqual(self.generate(), {'rendered': 1, 'unchanged': 1})
+        stored = statements.stored(self.month).get(referrer=self.referrers[0])
+        self.assertEqual((stored.report_count, stored.total_ultra), (1, 5))
+
+    def test_statements_of_referrers_without_reports_are_deleted(self):
+        self.generate()
+        self.second.delete()
+        self.assertEqual(self.generate(), {'rendered': 0, 'unchanged': 1})
+        self.assertEqual(list(statements.stored(self.month).values_list('referrer', flat=True)),
+                         [self.referrers[0].pk])
+
+    def test_download_serves_stored_statements_without_generating(self):
+        with mock.patch.object(statements, 'generate') as generate:
+            response = self.client.get(self.url, {'month': '2024-03'})
+            self.assertRedirects(response, '/reports/daily/', fetch_redirect_response=False)
+            generate.assert_not_called()
+
+        self.generate()
+        with mock.patch.object(statements, 'generate') as generate:
+            response = self.client.get(self.url, {'month': '2024-03'})
+            generate.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as zipped:
+            self.assertEqual(len(zipped.namelist()), 2)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class OptimisticLockTests(ReportFixtures, TestCase):
+    def edit_data(self, report, **changes):
+        data = {
+            'date': report.date.strftime('%d/%m/%Y'),
+            'id_number': report.id_number,
+            'exam_name': report.exam_name_id,
+            'exam_type': report.exam_type_id,
+            'referred_by': report.referred_by_id,
+            'sonologist': report.sonologist_id,
+            'total_ultra': report.total_ultra,
+            'notes': '',
+            'version': report.version,
+        }
+        data.update(changes)
+        return data
+
+    def test_every_save_bumps_the_version(self):
+        report = self.report(date(2024, 3, 1))
+        self.assertEqual(report.version, 1)
+        report.notes = 'checked'
+        report.save()
+        self.assertEqual(Report.objects.get(pk=report.pk).version, 2)
+
+    def test_stale_save_is_a_conflict(self):
+        report = self.report(date(2024, 3, 1))
+        theirs, mine = Report.objects.get(pk=report.pk), Report.objects.get(pk=report.pk)
+        theirs.total_ultra = 2
+        theirs.save()
+        mine.notes = 'mine'
+        with self.assertRaises(ReportConflict):
+            mine.save()
+        stored = Report.objects.get(pk=report.pk)
+        self.assertEqual((stored.total_ultra, stored.notes, stored.version), (2, None, 2))
+        self.assertRollupsMatchRebuild()
+
+    def test_saving_a_deleted_report_is_a_conflict(self):
+        report = self.report(date(2024, 3, 1))
+        Report.objects.filter(pk=report.pk).delete()
+        with self.assertRaises(ReportConflict):
+            report.save()
+
+    def test_edit_view_shows_the_conflict_and_resubmits_over_it(self):
+        report = self.report(date(2024, 3, 1))
+        url = f'/edit/{report.pk}/'
+        stale = self.edit_data(report, sonologist=self.sonologists[2].pk)
+        response = self.client.post(url, self.edit_data(report, total_ultra=2))
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.post(url, stale)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['conflicts'])
+        self.assertEqual(response.context['form']['version'].value(), 2)
+        self.assertEqual(Report.objects.get(pk=report.pk).sonologist, report.sonologist)
+
+        response = self.client.post(url, {**stale, 'version': 2})
+        self.assertEqual(response.status_code, 302)
+        stored = Report.objects.get(pk=report.pk)
+        self.assertEqual((stored.sonologist, stored.version), (self.sonologists[2], 3))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PeriodColumnTests(ReportFixtures, TestCase):
+    def test_string_dates_are_converted_before_the_periods_are_set(self):
+        report = Report(date='2024-03-03', exam_name=self.exam_name, sonologist=self.sonologists[0])
+        report.save()
+        report.refresh_from_db()
+        self.assertEqual(report.date, date(2024, 3, 3))
+        self.assertEqual((report.year, report.month, report.iso_week, report.weekday),
+                         (2024, date(2024, 3, 1), 202409, 7))
+
+    def test_periods_follow_a_date_change_saved_with_update_fields(self):
+        report = self.report(date(2024, 3, 31))
+        report.date = '2024-04-01'
+        report.save(update_fields=['date'])
+        stored = Report.objects.get(pk=report.pk)
+        self.assertEqual((stored.month, stored.iso_week, stored.weekday), (date(2024, 4, 1), 202414, 1))
+        self.assertRollupsMatchRebuild()
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PageCacheTests(ReportFixtures, TransactionTestCase):
+    url = '/reports/'
+
+    def setUp(self):
+        super().setUp()
+        self.report(date(2024, 3, 1), 0, id_number='FIRST')
+        patcher = mock.patch('reports.views.partitions', side_effect=archive.partitions)
+        self.renders = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        self.assertEqual(self.renders.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.client.get(self.url, {'search': 'FIRST'})
+        self.assertEqual(self.renders.call_count, 2)
+
+    def test_report_changes_invalidate_the_page(self):
+        etag = self.client.get(self.url)['ETag']
+        self.report(date(2024, 3, 2), 1, id_number='SECOND')
+        response = self.client.get(self.url)
+        self.assertEqual(self.renders.call_count, 2)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'SECOND')
+
+    def test_masterdata_changes_invalidate_the_page(self):
+        self.client.get(self.url)
+        sonologist = self.sonologists[0]
+        sonologist.name = 'Renamed'
+        sonologist.save()
+        self.assertContains(self.client.get(self.url), 'Renamed')
+        self.assertEqual(self.renders.call_count, 2)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 304)
+        Report.objects.get(id_number='FIRST').delete()
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 200)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PivotTests(ReportFixtures, TransactionTestCase):
+    query = {'rows': 'sonologist', 'columns': 'date', 'layer': 'exam_type',
+             'start_date': '01/03/2024', 'end_date': '31/03/2024'}
+
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            self.report(date(2024, 3, 1 + i % 3), i)
+
+    def test_grid_and_totals(self):
+        result = pivot.Pivot('sonologist', 'date', start=date(2024, 3, 1), end=date(2024, 3, 31))
+        self.assertEqual(result.grid.shape, (1, 3, 3))
+        self.assertEqual(int(result.grid.sum()), sum(i % 2 + 1 for i in range(6)))
+        reports = pivot.Pivot('sonologist', 'date', 'exam_type', date(2024, 3, 1), date(2024, 3, 31), 'reports')
+        self.assertEqual(reports.grid.shape, (2, 3, 3))
+        self.assertEqual(int(reports.grid.sum()), 6)
+
+    def test_oversized_pivot_is_refused_before_allocating(self):
+        with mock.patch.object(pivot, 'MAX_CELLS', 17), mock.patch('numpy.bincount') as bincount:
+            with self.assertRaises(pivot.PivotTooLarge):
+                pivot.Pivot('sonologist', 'date', 'exam_type', date(2024, 3, 1), date(2024, 3, 31))
+            bincount.assert_not_called()
+
+    def test_oversized_pivot_is_a_form_error(self):
+        with mock.patch.object(pivot, 'MAX_CELLS', 17):
+            response = self.client.get('/reports/pivot/', self.query)
+            self.assertContains(response, '18 cells')
+            self.assertIsNone(response.context['pivot'])
+            response = self.client.get('/reports/pivot/export/csv/', self.query)
+            self.assertContains(response, '18 cells', status_code=400)
+            smaller = {**self.query, 'layer': ''}
+            self.assertEqual(self.client.get('/reports/pivot/', smaller).context['pivot'].grid.size, 9)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RollupTests(ReportFixtures, TestCase):
+    def test_create_edit_and_delete_keep_rollups_exact(self):
+        reports = [self.report(date(2024, 3, 1 + i % 3), i) for i in range(9)]
+        self.assertRollupsMatchRebuild()
+
+        moved = reports[0]
+        moved.date = date(2024, 4, 1)
+        moved.sonologist = self.sonologists[2]
+        moved.total_ultra = 2
+        moved.save()
+        reports[1].referred_by = None
+        reports[1].save()
+        reports[2].exam_type = self.exam_types[1]
+        reports[2].save(update_fields=['exam_type'])
+        self.assertRollupsMatchRebuild()
+
+        reports[3].delete()
+        Report.objects.filter(pk__in=[r.pk for r in reports[4:6]]).delete()
+        self.assertRollupsMatchRebuild()
+
+    def test_rows_emptied_by_changes_are_removed(self):
+        report = self.report(date(2024, 3, 1))
+        report.date = date(2024, 3, 2)
+        report.save()
+        self.assertEqual(list(DailyRollup.objects.values_list('date', 'report_count')), [(date(2024, 3, 2), 1)])
+        report.delete()
+        self.assertFalse(DailyRollup.objects.exists())
+        self.assertFalse(HourlyRollup.objects.exists())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ChangeFeedTests(ReportFixtures, TestCase):
+    def feed(self, since=0, limit=None):
+        query = {'since': since}
+        if limit:
+            query['limit'] = limit
+        response = self.client.get('/changes/', query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_come_in_commit_order_with_tombstones(self):
+        first, second, third = (self.report(date(2024, 3, 1), i) for i in range(3))
+        first.notes = 'edited'
+        first.save()
+        deleted_id = second.pk
+        second.delete()
+
+        page = self.feed()
+        self.assertFalse(page['has_more'])
+        self.assertEqual(
+            [(change['op'], change['id']) for change in page['changes']],
+            [('upsert', third.pk), ('upsert', first.pk), ('delete', deleted_id)],
+        )
+        seqs = [change['seq'] for change in page['changes']]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(page['changes'][1]['report']['notes'], 'edited')
+        self.assertEqual(page['next_cursor'], seqs[-1])
+        self.assertEqual(self.feed(since=page['next_cursor'])['changes'], [])
+
+    def test_paging_with_the_cursor_sees_every_change_once(self):
+        reports = [self.report(date(2024, 3, 1), i) for i in range(5)]
+        Report.objects.filter(pk__in=[reports[0].pk, reports[3].pk]).delete()
+
+        seen, cursor, has_more = [], 0, True
+        while has_more:
+            page = self.feed(since=cursor, limit=2)
+            self.assertLessEqual(len(page['changes']), 2)
+            seen += [(change['op'], change['id']) for change in page['changes']]
+            cursor, has_more = page['next_cursor'], page['has_more']
+        self.assertEqual(sorted(seen), sorted(
+            [('upsert', r.pk) for r in (reports[1], reports[2], reports[4])]
+            + [('delete', reports[0].pk), ('delete', reports[3].pk)]
+        ))
+
+    def test_bad_cursor_is_a_bad_request(self):
+        self.assertEqual(self.client.get('/changes/', {'since': 'x'}).status_code, 400)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ArchiveTests(ReportFixtures, ArchiveTables, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        for year in (2022, 2023):
+            for i in range(4):
+                self.report(date(year, 3, 1 + i), i)
+            archive.archive_year(year)
+        for i in range(3):
+            self.report(date(2024, 3, 1 + i), i)
+
+    def test_archive_moves_rows_and_records_totals(self):
+        self.assertEqual(archive.archived_years(), [2022, 2023])
+        self.assertEqual(Report.objects.count(), 3)
+        self.assertEqual(archive.archive_model(2022).objects.count(), 4)
+        self.assertEqual(
+            list(ReportArchive.objects.values_list('year', 'report_count', 'total_ultra')),
+            [(2022, 4, 6), (2023, 4, 6)],
+        )
+
+    def test_archiving_advances_the_data_version(self):
+        before = caching.data_version()
+        archive.archive_year(2024)
+        self.assertNotEqual(caching.data_version(), before)
+        self.assertEqual(archive.archive_year(2024), 0)
+
+    def test_partitions_only_include_overlapping_years(self):
+        def tables(start=None, end=None):
+            return [qs.model._meta.db_table for qs in archive.partitions(start=start, end=end)]
+
+        live = Report._meta.db_table
+        self.assertEqual(tables(), [live, archive.table_name(2022), archive.table_name(2023)])
+        self.assertEqual(tables(date(2023, 6, 1)), [live, archive.table_name(2023)])
+        self.assertEqual(tables(end=date(2022, 12, 31)), [live, archive.table_name(2022)])
+        self.assertEqual(tables(date(2024, 1, 1), date(2024, 12, 31)), [live])
+
+    def test_totals_span_live_and_archived_tables(self):
+        self.assertEqual(archive.total_ultra(), 6 + 6 + 4)
+        self.assertEqual(archive.total_ultra(Q(date__gte=date(2023, 3, 3)), date(2023, 3, 3)), 2 + 1 + 4)
+        self.assertEqual(archive.all_time_total_ultra(), archive.total_ultra())
+
+    def test_report_list_marks_archived_rows_read_only(self):
+        response = self.client.get('/reports/', {'start_date': '01/03/2023', 'end_date': '31/03/2024'})
+        rows = list(response.context['reports'])
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(sorted(r.date.year for r in rows if r.archived), [2023] * 4)
+        live = Report.objects.values_list('pk', flat=True)
+        for pk in live:
+            self.assertContains(response, f'/edit/{pk}/')
+        self.assertContains(response, 'Archived', count=4)
+
+    def test_dates_in_archived_years_are_refused(self):
+        with self.assertRaises(ValidationError):
+            self.report(date(2023, 12, 31))
+        report = Report.objects.get(date=date(2024, 3, 1))
+        report.date = date(2023, 12, 31)
+        with self.assertRaises(ValidationError):
+            report.save()
+
+        form = ReportForm(data={
+            'date': '31/12/2023',
+            'exam_name': self.exam_name.pk,
+            'exam_type': self.exam_types[0].pk,
+            'referred_by': self.referrers[0].pk,
+            'sonologist': self.sonologists[0].pk,
+            'total_ultra': 1,
+        })
+        self.assertIn('2023 is archived', str(form.errors['date']))
+        self.assertEqual(Report.objects.filter(date__year=2023).count(), 0)
+        self.assertEqual(archive.archive_model(2023).objects.count(), 4)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AuditTests(ReportFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clerk = get_user_model().objects.create_user('clerk')
+        self.act_as(self.clerk)
+
+    def act_as(self, user):
+        token = audit.set_current_request(SimpleNamespace(user=user))
+        self.addCleanup(audit.reset_current_request, token)
+
+    def entries(self, report_id):
+        return [(e.action, e.user, e.decoded_changes)
+                for e in ReportAudit.objects.for_report(report_id).order_by('pk')]
+
+    def test_saves_and_deletes_are_recorded_with_their_changes(self):
+        report = self.report(date(2024, 3, 1), patient_name='')
+        report_id = report.pk
+        report.sonologist = self.sonologists[1]
+        report.save()
+        report.save()  # nothing changed, nothing recorded
+        report.delete()
+
+        values = {
+            'date': '2024-03-01',
+            'id_number': 'P0',
+            'exam_name_id': self.exam_name.pk,
+            'exam_type_id': self.exam_types[0].pk,
+            'referred_by_id': self.referrers[0].pk,
+            'sonologist_id': self.sonologists[0].pk,
+            'total_ultra': 1,
+        }
+        self.assertEqual(self.entries(report_id), [
+            (ReportAudit.CREATE, self.clerk, values),
+            (ReportAudit.UPDATE, self.clerk, {'sonologist_id': [self.sonologists[0].pk, self.sonologists[1].pk]}),
+            (ReportAudit.DELETE, self.clerk, {**values, 'sonologist_id': self.sonologists[1].pk}),
+        ])
+
+    def test_entry_is_written_in_the_saving_transaction(self):
+        report = self.report(date(2024, 3, 1))
+        with transaction.atomic():
+            report.total_ultra = 2
+            report.save()
+            self.assertEqual(len(self.entries(report.pk)), 2)
+            transaction.set_rollback(True)
+        self.assertEqual(len(self.entries(report.pk)), 1)
+
+    def test_queries(self):
+        other = get_user_model().objects.create_user('other')
+        with mock.patch.object(timezone, 'now', return_value=timezone.make_aware(datetime(2024, 3, 1, 9))):
+            first = self.report(date(2024, 3, 1))
+        self.act_as(other)
+        with mock.patch.object(timezone, 'now', return_value=timezone.make_aware(datetime(2024, 3, 2, 9))):
+            second = self.report(date(2024, 3, 2), 1)
+            first.total_ultra = 2
+            first.save()
+
+        self.assertEqual(ReportAudit.objects.for_report(first.pk).count(), 2)
+        self.assertEqual(set(ReportAudit.objects.by_user(self.clerk).values_list('report_id', flat=True)), {first.pk})
+        self.assertEqual(ReportAudit.objects.by_user(other).count(), 2)
+        march_2 = timezone.make_aware(datetime(2024, 3, 2))
+        self.assertEqual(ReportAudit.objects.between(end=march_2).get().report_id, first.pk)
+        self.assertEqual(
+            sorted(ReportAudit.objects.between(march_2, march_2 + timedelta(days=1)).values_list('report_id', 'action')),
+            sorted([(second.pk, ReportAudit.CREATE), (first.pk, ReportAudit.UPDATE)]),
+        )
+
+
+class PatientKeyTests(SimpleTestCase):
+    def test_normalization(self):
+        self.assertEqual(normalize_patient_id(' ab-12/3.4 '), 'AB1234')
+        self.assertEqual(normalize_patient_id('AB 1234'), 'AB1234')
+        for blank in (None, '', ' - / '):
+            self.assertIsNone(normalize_patient_id(blank))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PatientHistoryTests(ReportFixtures, ArchiveTables, TransactionTestCase):
+    def form_data(self, **changes):
+        data = {
+            'date': '01/03/2024',
+            'id_number': 'ab 12',
+            'exam_name': self.exam_name.pk,
+            'exam_type': self.exam_types[0].pk,
+            'referred_by': self.referrers[0].pk,
+            'sonologist': self.sonologists[0].pk,
+            'total_ultra': 1,
+            'notes': '',
+        }
+        data.update(changes)
+        return data
+
+    def test_migration_backfills_the_key(self):
+        self.report(date(2023, 5, 1), id_number='cd.34')
+        archive.archive_year(2023)
+        report = self.report(date(2024, 3, 1), id_number='ab-12/3')
+        blank = self.report(date(2024, 3, 1), id_number=' ')
+        archived = archive.archive_model(2023)
+        for model in (Report, archived):
+            model.objects.update(patient_key=None)
+
+        migration = importlib.import_module('reports.migrations.0012_patient_key')
+        migration.fill_patient_keys(django_apps, None)
+        archive.fill_derived(archived, {'patient_key'})  # what sync_tables does after migrate
+        self.assertEqual(Report.objects.get(pk=report.pk).patient_key, 'AB123')
+        self.assertIsNone(Report.objects.get(pk=blank.pk).patient_key)
+        self.assertEqual(archived.objects.get().patient_key, 'CD34')
+
+    def test_timeline_spans_live_and_archived_reports(self):
+        old = self.report(date(2023, 5, 1), id_number='AB-12')
+        archive.archive_year(2023)
+        new = self.report(date(2024, 3, 1), id_number='ab 12')
+        self.report(date(2024, 3, 1), id_number='AB-13')
+
+        response = self.client.get('/patients/timeline/', {'id': 'Ab12'})
+        data = response.json()
+        self.assertEqual(data['patient_key'], 'AB12')
+        self.assertEqual([r['id'] for r in data['reports']], [new.pk, old.pk])
+        self.assertEqual(self.client.get('/patients/timeline/').status_code, 400)
+
+    def test_same_visit(self):
+        report = self.report(date(2024, 3, 1), id_number='AB-12')
+        self.assertFalse(report.same_visit().exists())
+        again = self.report(date(2024, 3, 1), 1, id_number='ab12')
+        self.report(date(2024, 3, 2), id_number='AB-12')
+        self.assertEqual(list(report.same_visit()), [again])
+
+    def test_duplicate_entry_is_saved_only_once_confirmed(self):
+        first = self.report(date(2024, 3, 1), id_number='AB-12')
+        response = self.client.post('/', self.form_data())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['duplicates'], [first])
+        self.assertEqual(Report.objects.count(), 1)
+
+        response = self.client.post('/', self.form_data(confirm_duplicate='1'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Report.objects.filter(patient_key='AB12').count(), 2)
+
+        response = self.client.post('/', self.form_data(date='02/03/2024'))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class MergeTests(ReportFixtures, ArchiveTables, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.survivor, self.loser = self.sonologists[0], self.sonologists[1]
+        last_year = timezone.localdate().year - 1
+        for i in range(6):
+            self.report(date(last_year, 6, 1 + i), i, sonologist=self.loser)
+        archive.archive_year(last_year)
+        for i in range(7):
+            self.report(timezone.localdate() - timedelta(days=i), i, sonologist=self.loser)
+
+    def reports_of(self, sonologist):
+        return sum(qs.filter(sonologist=sonologist).count() for qs in archive.partitions())
+
+    def test_queued_merge_moves_live_and_archived_reports(self):
+        job = merge.queue('sonologist', self.survivor, [self.loser])
+        self.assertEqual(merge.run_queued(chunk_size=4, pause=0), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.moved), (MasterdataMerge.DONE, 13))
+        self.assertEqual(self.reports_of(self.loser), 0)
+        self.loser.refresh_from_db()
+        self.assertFalse(self.loser.is_active)
+        self.assertRollupsMatchRebuild()
+        seqs = list(Report.objects.values_list('change_seq', flat=True))
+        self.assertEqual(len(seqs), len(set(seqs)))
+
+    def test_interrupted_merge_resumes(self):
+        job = merge.queue('sonologist', self.survivor, [self.loser])
+        move_chunk = merge._move_chunk
+        calls = []
+
+        def dies_on_second_chunk(*args):
+            calls.append(1)
+            if len(calls) == 2:
+                raise SystemExit  # the worker process is killed
+            return move_chunk(*args)
+
+        with mock.patch.object(merge, '_move_chunk', dies_on_second_chunk):
+            with self.assertRaises(SystemExit):
+                merge.run_queued(chunk_size=4, pause=0)
+
+        job.refresh_from_db()
+        self.loser.refresh_from_db()
+        self.assertEqual((job.status, job.moved), (MasterdataMerge.RUNNING, 4))
+        self.assertTrue(self.loser.is_active)  # still has reports, so still selectable
+        self.assertEqual(self.reports_of(self.loser), 9)
+        self.assertRollupsMatchRebuild()
+
+        self.assertEqual(merge.run_queued(chunk_size=4, pause=0), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.moved), (MasterdataMerge.DONE, 13))
+        self.assertEqual(self.reports_of(self.loser), 0)
+        self.assertRollupsMatchRebuild()
+
+    def test_one_merge_at_a_time_across_processes(self):
+        merge.queue('sonologist', self.survivor, [self.loser])
+        lock = SingleFlight(merge.LOCK_KEY)
+        self.assertTrue(lock.acquire(wait=0))
+        try:
+            self.assertIsNone(merge.run_queued(pause=0))
+        finally:
+            lock.release()
+        self.assertEqual(self.reports_of(self.loser), 13)
+
+    def test_failed_merge_is_recorded(self):
+        job = merge.queue('sonologist', self.survivor, [self.loser])
+        self.survivor.is_active = False
+        self.survivor.save()
+        merge.run_queued(pause=0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, MasterdataMerge.FAILED)
+        self.assertIn('inactive', job.error)
+        self.assertEqual(self.reports_of(self.loser), 13)
+
+
+@override_settings(CACHES=LOCAL_CACHE, EXPORT_CONCURRENCY=1)
+class ExportSlotTests(ReportFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.report(date(2024, 3, 1))
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir)
+        lock_dir_setting = self.settings(LOCK_DIR=lock_dir)
+        lock_dir_setting.enable()
+        self.addCleanup(lock_dir_setting.disable)
+
+    def take_slot(self):
+        slot = take_export_slot()
+        if slot is not None:
+            self.addCleanup(slot.close)
+        return slot
+
+    def test_export_is_refused_while_every_slot_is_taken(self):
+        self.assertIsNotNone(self.take_slot())
+        self.assertIsNone(self.take_slot())
+        response = self.client.get('/export/xlsx/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.EXPORT_RETRY_AFTER))
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+    def test_slot_is_released_when_the_response_is_closed(self):
+        self.assertEqual(self.client.get('/export/xlsx/').status_code, 200)  # the test client closes it
+        self.assertIsNotNone(self.take_slot())
+
+    def test_streamed_export_holds_its_slot_until_the_last_chunk(self):
+        response = self.client.get('/export/csv/')
+        self.assertTrue(response.streaming)
+        self.assertIsNone(self.take_slot())
+        self.assertIn(b'P0', b''.join(response.streaming_content))
+        self.assertIsNotNone(self.take_slot())
+
+
+@override_settings(CACHES=LOCAL_CACHE, PROFILE_KEEP=2)
+class ProfilerTests(ReportFixtures, TransactionTestCase):
+    url = '/reports/'
+
+    def setUp(self):
+        super().setUp()
+        self.report(date(2024, 3, 1))
+        self.staff = get_user_model().objects.create_user('admin', is_staff=True)
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        profile_dir = self.settings(PROFILE_DIR=self.profile_dir)
+        profile_dir.enable()
+        self.addCleanup(profile_dir.disable)
+        patcher = mock.patch('reports.views.partitions', side_effect=archive.partitions)
+        self.renders = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def profiled(self):
+        # The test client closes the response, which saves the profile
+        return self.client.get(self.url, headers={'x-profile': '1'})
+
+    def test_only_staff_can_profile(self):
+        self.client.force_login(get_user_model().objects.create_user('clerk'))
+        response = self.client.get(self.url, {'_profile': '1'})
+        self.assertNotIn('X-Profile', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_profile_is_saved_with_its_files(self):
+        self.client.force_login(self.staff)
+        response = self.profiled()
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile'], profile.name)
+        self.assertEqual((profile.path, profile.status_code, profile.user), (self.url, 200, self.staff))
+        with open(profiling.file_path(profile, 'sql')) as f:
+            self.assertEqual(len(json.load(f)['queries']), profile.sql_count)
+        self.assertGreater(profile.sql_count, 0)
+        download = self.client.get(f'/settings/profiles/{profile.pk}/flamegraph/')
+        self.assertEqual(download.status_code, 200)
+        download.close()
+
+    def test_profiled_requests_bypass_the_page_cache(self):
+        self.client.force_login(self.staff)
+        self.client.get(self.url)
+        self.profiled()
+        self.profiled()
+        self.assertEqual(self.renders.call_count, 3)
+        self.client.get(self.url)
+        self.assertEqual(self.renders.call_count, 3)
+
+    def test_prune_keeps_the_newest_profiles_and_their_files(self):
+        self.client.force_login(self.staff)
+        names = [self.profiled()['X-Profile'] for _ in range(3)]
+        self.assertEqual(list(RequestProfile.objects.values_list('name', flat=True)), names[:0:-1])
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         sorted(name + ext for name in names[1:] for ext in profiling.FILES.values()))
+
+    def test_threads_are_sampled_only_while_they_work_for_the_request(self):
+        profile, token = profiling.start(RequestFactory().get(self.url))
+        here = threading.get_ident()
+        during_query = []
+
+        def spy(execute, sql, params, many, context):
+            during_query.append(set(profile.threads))
+            return execute(sql, params, many, context)
+
+        def query():
+            connection.ensure_connection()  # installs the profiler's wrapper, outside the spy
+            with connection.execute_wrapper(spy):
+                Report.objects.count()
+            connection.close()
+
+        try:
+            self.assertEqual(set(profile.threads), {here})
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(query,))
+            worker.start()
+            worker.join()
+        finally:
+            profiling.stop(token)
+            profile.finish(200, None)
+        self.assertEqual(during_query, [{here, worker.ident}])
+        self.assertFalse(profile.threads)
+
+
+@override_settings(MEMORY_RECYCLE_MB=512, MEMORY_LOG_MB=50, MEMORY_TRACE_EVERY=0)
+class MemoryWatchdogTests(SimpleTestCase):
+    request = SimpleNamespace(method='GET', path='/reports/')
+
+    def setUp(self):
+        for name, value in (('_retire', None), ('_retiring', False)):
+            patcher = mock.patch.object(memory, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.rss = 100 * memory.MB
+        patcher = mock.patch.object(memory, 'rss', side_effect=lambda: self.rss)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request_done(self):
+        memory.Measurement(self.request).finish(200)
+
+    def test_worker_is_retired_once_past_the_limit(self):
+        retire = mock.Mock()
+        memory.enable_recycling(retire=retire)
+        self.request_done()
+        retire.assert_not_called()
+
+        self.rss = 600 * memory.MB
+        with self.assertLogs('reports.memory', 'WARNING'):
+            self.request_done()
+        self.request_done()
+        retire.assert_called_once_with()
+
+    def test_nothing_is_retired_before_recycling_is_enabled(self):
+        self.rss = 600 * memory.MB
+        self.request_done()
+        self.assertFalse(memory._retiring)
+
+    @override_settings(MEMORY_TRACE_EVERY=1)
+    def test_tracing_lock_is_always_released(self):
+        with self.assertLogs('reports.memory', 'INFO'):
+            first = memory.Measurement(self.request)
+            self.assertTrue(first.traced)
+            self.assertFalse(memory.Measurement(self.request).traced)  # one traced request at a time
+            first.finish(200)
+        self.assertFalse(memory._tracing.locked())
+        self.assertFalse(tracemalloc.is_tracing())
+
+        failing = memory.Measurement(self.request)
+        with mock.patch.object(tracemalloc, 'take_snapshot', side_effect=MemoryError):
+            with self.assertRaises(MemoryError):
+                failing.finish(500)
+        self.assertFalse(memory._tracing.locked())
+        self.assertFalse(tracemalloc.is_tracing())
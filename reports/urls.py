@@ -4,6 +4,7 @@ from .views import (
     ReportEditView,
     DashboardPageView,
     DashboardDataView,
+    AnalyticsDataView,
     ReportListView,
     DailyReportView,
     MonthlyReportView,
@@ -12,6 +13,14 @@ from .views import (
     MonthlyReportExportView,
     ExamTypeReportView,
     ExamTypeReportExportView,
+    ChangeFeedView,
+    ReferrerStatementsView,
+    BranchSummaryView,
+    PatientTimelineView,
+    PivotReportView,
+    PivotExportView,
+    MasterdataMergeView,
+    profile_file,
 )
 
 app_name = "reports"
@@ -21,6 +30,7 @@ urlpatterns = [
     path('edit/<int:pk>/', ReportEditView.as_view(), name='report_edit'),
     path('dashboard/', DashboardPageView.as_view(), name='dashboard'),
     path('dashboard/data/', DashboardDataView.as_view(), name='dashboard-data'),
+    path('dashboard/analytics/', AnalyticsDataView.as_view(), name='dashboard-analytics'),
     path('reports/', ReportListView.as_view(), name='report_list'),
     path('reports/daily/', DailyReportView.as_view(), name='daily_report'),
     path('reports/daily/export/<str:fmt>/', DailyReportExportView.as_view(), name='daily_export'),
@@ -29,5 +39,13 @@ urlpatterns = [
     path('export/<str:fmt>/', ExportView.as_view(), name='export'),
     path('reports/exam-type/', ExamTypeReportView.as_view(), name='exam_type_report'),
     path('reports/exam-type/export/<str:fmt>/', ExamTypeReportExportView.as_view(), name='exam_type_export'),
+    path('changes/', ChangeFeedView.as_view(), name='changes'),
+    path('patients/timeline/', PatientTimelineView.as_view(), name='patient_timeline'),
+    path('reports/branches/', BranchSummaryView.as_view(), name='branch_summary'),
+    path('reports/pivot/', PivotReportView.as_view(), name='pivot_report'),
+    path('reports/pivot/export/<str:fmt>/', PivotExportView.as_view(), name='pivot_export'),
+    path('reports/statements/', ReferrerStatementsView.as_view(), name='referrer_statements'),
+    path('settings/merge/<str:kind>/', MasterdataMergeView.as_view(), name='masterdata_merge'),
+    path('settings/profiles/<int:pk>/<str:kind>/', profile_file, name='profile_file'),
 
 ]
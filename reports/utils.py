@@ -1,36 +1,42 @@
 # utils.py
-import openpyxl
+# openpyxl and xhtml2pdf are imported inside the export functions: they are only
+# needed for export requests, and xhtml2pdf drags in reportlab, html5lib, pyHanko
+# and the crypto stack. Workers load them through reports.exporters on first use.
 from django.http import HttpResponse
-from io import BytesIO
-from xhtml2pdf import pisa
 from django.template.loader import get_template
 
 def export_to_excel(rows, headers, filename="report"):
     import openpyxl
-    from django.http import HttpResponse
+    from openpyxl.utils import get_column_letter
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = filename
+    # Write-only mode streams rows straight into the sheet XML, several times
+    # faster than building cell objects; column widths are worked out up front.
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=filename[:31])
 
-    # Add headers
-    ws.append(headers)
-
-    # Add data (convert all model objects to string before writing)
-    for row in rows:
-        safe_row = []
-        for cell in row:
-            # Convert any model instance or non-Excel type to string
-            if not isinstance(cell, (str, int, float, bool, type(None))):
-                safe_row.append(str(cell))
-            else:
-                safe_row.append(cell)
-        ws.append(safe_row)
+    # Convert any model instance or non-Excel type to string
+    rows = [
+        [cell if isinstance(cell, (str, int, float, bool, type(None))) else str(cell) for cell in row]
+        for row in rows
+    ]
 
     # Adjust column widths
-    for col in ws.columns:
-        max_length = max(len(str(cell.value)) if cell.value else 0 for cell in col)
-        ws.column_dimensions[col[0].column_letter].width = max_length + 2
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        for i, cell in enumerate(row):
+            if cell is not None and cell != '':
+                length = len(str(cell))
+                if i >= len(widths):
+                    widths.append(length)
+                elif length > widths[i]:
+                    widths[i] = length
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width + 2
+
+    # Add headers and data
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
 
     # Build response
     response = HttpResponse(
@@ -42,8 +48,10 @@ def export_to_excel(rows, headers, filename="report"):
 
 
 
-def export_to_pdf(rows, headers, filename, extra_context=None):
-    template = get_template("reports/report_pdf.html")
+def export_to_pdf(rows, headers, filename, extra_context=None, template_name="reports/report_pdf.html"):
+    from xhtml2pdf import pisa
+
+    template = get_template(template_name)
     context = {"rows": rows, "headers": headers}
 
     if extra_context:
@@ -58,20 +66,14 @@ def export_to_pdf(rows, headers, filename, extra_context=None):
         return HttpResponse("Error generating PDF", status=500)
     return response
 
-def export_pdf_grouped(grouped_data, headers, filename, extra_context=None):
-    template = get_template("reports/exam_type_report_pdf.html")
-    context = {"grouped_data": grouped_data, "headers": headers}
-
-    if extra_context:
-        context.update(extra_context)
 
-    html = template.render(context)
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="{filename}.pdf"'
+def render_pdf_bytes(html):
+    """Render HTML to PDF bytes. Module-level (and Django-free) so a process pool can run it."""
+    from io import BytesIO
+    from xhtml2pdf import pisa
 
-    pisa_status = pisa.CreatePDF(html, dest=response)
+    buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=buffer)
     if pisa_status.err:
-        return HttpResponse("Error generating PDF", status=500)
-    return response
-
-
+        raise ValueError("Error generating PDF")
+    return buffer.getvalue()
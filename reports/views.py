@@ -1,45 +1,60 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.views import View
 from django.views.generic import TemplateView
 from django.core.paginator import Paginator
 from django.db.models import Sum, Count
-from django.db.models.functions import TruncDay, TruncMonth
-from django.http import HttpResponse
-from django.template.loader import get_template
-from io import BytesIO
-import openpyxl
-from xhtml2pdf import pisa
+from django.http import Http404, HttpResponse
 from django.contrib import messages
-from .models import Report
-from .forms import ReportForm, ReportFilterForm, DailyReportFilterForm, MonthlyReportFilterForm, ExamTypeReportFilterForm
-from .utils import export_to_excel, export_to_pdf, export_pdf_grouped
-from django.db.models import Sum, F, Q
+from django.contrib.admin.views.decorators import staff_member_required
+from masterdata.tenancy import get_current_branch
+from .models import MasterdataMerge, Report, ReportConflict, ReportTombstone, RequestProfile, normalize_patient_id
+from .forms import ReportForm, ReportEditForm, ReportFilterForm, DailyReportFilterForm, MonthlyReportFilterForm, ExamTypeReportFilterForm, AnalyticsFilterForm, StatementMonthForm, BranchSummaryFilterForm, PivotForm
+from .exporters import get_writer, is_asgi, wants_gzip
+from .archive import partitions, union_all, total_ultra, all_time_total_ultra
+from . import analytics, exam_types, merge, pivot, profiling, rollups, statements
+from .caching import cached_page
+from .locks import admit_export
+from .aio import ThreadedView, gather_queries, run_query
+from django.utils.decorators import method_decorator
+from django.db.models import Sum, F, Q, Value
 from datetime import date
+from itertools import chain
 from django.utils.timezone import localtime, now
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse
+import tempfile
 from django.views.generic import UpdateView
 from django.urls import reverse_lazy
 
 # Home / Add New Report
-class HomeView(View):
+# Runs in pool threads: under ASGI, sync views share one thread per worker with
+# the exports, and report entry must not queue behind a PDF being rendered.
+class HomeView(ThreadedView):
     template_name = "reports/home.html"
 
-    def get(self, request):
+    def render_get(self, request):
         form = ReportForm()
         reports = Report.objects.order_by('-date')[:10]
         return render(request, self.template_name, {"form": form, "reports": reports})
 
-    def post(self, request):
+    async def post(self, request):
+        return await run_query(self.render_post, request)
+
+    def render_post(self, request):
         form = ReportForm(request.POST)
+        duplicates = []
         if form.is_valid():
-            form.save()
-            # Success message
-            messages.success(request, "Report saved successfully!")
-            return redirect("reports:home")
+            # Same patient, exam and date already entered: ask before saving a second copy
+            if not request.POST.get("confirm_duplicate"):
+                duplicates = list(form.instance.same_visit().select_related("referred_by", "sonologist")[:5])
+            if not duplicates:
+                form.save()
+                # Success message
+                messages.success(request, "Report saved successfully!")
+                return redirect("reports:home")
         else:
             messages.error(request, "Please correct the errors below.")
         reports = Report.objects.order_by('-date')[:10]
-        return render(request, self.template_name, {"form": form, "reports": reports})
+        return render(request, self.template_name, {"form": form, "reports": reports, "duplicates": duplicates})
 
 # Dashboard page (HTML)
 class DashboardPageView(TemplateView):
@@ -49,34 +64,37 @@ class DashboardPageView(TemplateView):
 class DashboardDataView(View):
     """Return live dashboard summary data as JSON (for AJAX refresh)."""
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         today = localtime(now()).date()
-
-        total_ultra_today = Report.objects.filter(date=today).aggregate(total=Sum('total_ultra'))['total'] or 0
-        total_ultra_all = Report.objects.aggregate(total=Sum('total_ultra'))['total'] or 0
-
-        # Exam type summary
-        category_summary = list(
-            Report.objects
-            .filter(date=today)
-            .values('exam_type__name')
-            .annotate(
-                report_count=Count('id'),
-                ultra_sum=Sum('total_ultra')
-            )
-            .order_by('-report_count')
-        )
-
-        # Sonologist summary
-        sonologist_summary = list(
-            Report.objects
-            .filter(date=today)
-            .values('sonologist__name')
-            .annotate(
-                report_count=Count('id'),
-                ultra_sum=Sum('total_ultra')
-            )
-            .order_by('-report_count')
+        today_reports = Report.objects.filter(date=today)
+        branch = get_current_branch()
+
+        # Independent queries: run them concurrently, so the response takes as long as the slowest
+        total_ultra_today, total_ultra_all, category_summary, sonologist_summary, hourly = await gather_queries(
+            lambda: today_reports.aggregate(total=Sum('total_ultra'))['total'] or 0,
+            all_time_total_ultra,  # live rows + archived years' stored totals
+            # Exam type summary
+            lambda: list(
+                today_reports
+                .values('exam_type__name')
+                .annotate(
+                    report_count=Count('id'),
+                    ultra_sum=Sum('total_ultra')
+                )
+                .order_by('-report_count')
+            ),
+            # Sonologist summary
+            lambda: list(
+                today_reports
+                .values('sonologist__name')
+                .annotate(
+                    report_count=Count('id'),
+                    ultra_sum=Sum('total_ultra')
+                )
+                .order_by('-report_count')
+            ),
+            # Intraday throughput, from the hourly rollups
+            lambda: rollups.hourly_throughput(today, branch),
         )
 
         return JsonResponse({
@@ -84,17 +102,34 @@ class DashboardDataView(View):
             'total_ultra_all': total_ultra_all,
             'category_summary': category_summary,
             'sonologist_summary': sonologist_summary,
+            'hourly': hourly,
             'timestamp': localtime(now()).strftime("%H:%M:%S"),
         })
 
 
+class AnalyticsDataView(View):
+    """Trend, seasonality, load percentiles and forecast as JSON (dashboard charts)."""
+
+    async def get(self, request):
+        form = AnalyticsFilterForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        start, end = form.cleaned_data['start_date'], form.cleaned_data['end_date']
+        horizon = form.cleaned_data.get('horizon') or 14
+
+        return JsonResponse(await run_query(analytics.compute, start, end, horizon=horizon))
+
+
 # Report List
-class ReportListView(View):
+@method_decorator(cached_page, name='get')
+class ReportListView(ThreadedView):
     template_name = "reports/report_list.html"
 
-    def get(self, request):
+    def render_get(self, request):
         form = ReportFilterForm(request.GET or None)
-        qs = Report.objects.all().order_by('-date')
+        filters = Q()
+        sd = ed = None
         applied_filters = []
 
         # Apply filters from form
@@ -107,28 +142,28 @@ class ReportListView(View):
             exam_name = form.cleaned_data.get("exam_name")
 
             if sd:
-                qs = qs.filter(date__gte=sd)
+                filters &= Q(date__gte=sd)
                 applied_filters.append(f"Start Date: {sd.strftime('%d-%m-%Y')}")
             if ed:
-                qs = qs.filter(date__lte=ed)
+                filters &= Q(date__lte=ed)
                 applied_filters.append(f"End Date: {ed.strftime('%d-%m-%Y')}")
             if referred_by:
-                qs = qs.filter(referred_by=referred_by)
+                filters &= Q(referred_by=referred_by)
                 applied_filters.append(f"Doctor: {referred_by}")
             if sonologist:
-                qs = qs.filter(sonologist=sonologist)
+                filters &= Q(sonologist=sonologist)
                 applied_filters.append(f"Sonologist: {sonologist}")
             if exam_type:
-                qs = qs.filter(exam_type=exam_type)
+                filters &= Q(exam_type=exam_type)
                 applied_filters.append(f"Exam Type: {exam_type}")
             if exam_name:
-                qs = qs.filter(exam_name=exam_name)
+                filters &= Q(exam_name=exam_name)
                 applied_filters.append(f"Exam Name: {exam_name}")
 
         # Search functionality
         search_query = request.GET.get('search')
         if search_query:
-            qs = qs.filter(
+            filters &= (
                 Q(id_number__icontains=search_query) |
                 Q(exam_name__name__icontains=search_query) |
                 Q(exam_type__name__icontains=search_query) |
@@ -137,6 +172,13 @@ class ReportListView(View):
             )
             applied_filters.append(f"Search: {search_query}")
 
+        # Only the live table and archived years overlapping the date range are queried.
+        # Archived rows are read-only: ReportEditView only sees the live table.
+        live, *archived = partitions(filters, sd, ed)
+        qs = union_all(
+            [live.annotate(archived=Value(False))] + [year.annotate(archived=Value(True)) for year in archived]
+        ).order_by('-date')
+
         # Pagination
         paginator = Paginator(qs, 10)
         page_number = request.GET.get("page")
@@ -155,12 +197,35 @@ class ReportListView(View):
 # Edit
 class ReportEditView(UpdateView):
     model = Report
-    form_class = ReportForm
+    form_class = ReportEditForm
     template_name = "reports/report_edit.html"
 
     def form_valid(self, form):
+        # Save against the version the user started editing, not the one loaded for this POST
+        form.instance.version = form.cleaned_data["version"]
+        try:
+            self.object = form.save()
+        except ReportConflict:
+            return self.conflict(form)
         messages.success(self.request, "Report updated successfully!")
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
+
+    def conflict(self, form):
+        """Someone saved this report first: show both versions and let the user resubmit over theirs."""
+        current = Report.objects.filter(pk=self.object.pk).first()
+        if current is None:
+            messages.error(self.request, "This report was deleted while you were editing it.")
+            return redirect(self.get_success_url())
+        conflicts = form.conflicts(current)
+        data = form.data.copy()
+        data["version"] = current.version  # submitting again overwrites the newer save
+        resubmit = self.get_form_class()(data, instance=current)
+        resubmit.is_valid()
+        return self.render_to_response(self.get_context_data(
+            form=resubmit,
+            conflicts=conflicts,
+            current=current,
+        ))
 
     def get_success_url(self):
         return reverse_lazy("reports:report_list")  # redirect to report list page
@@ -168,37 +233,38 @@ class ReportEditView(UpdateView):
 
 
 # Daily Report
-class DailyReportView(View):
+@method_decorator(cached_page, name='get')
+class DailyReportView(ThreadedView):
     template_name = "reports/daily_report.html"
 
-    def get_queryset(self, request):
+    def get_querysets(self, request):
         form = DailyReportFilterForm(request.GET or None)
-        qs = Report.objects.all()
+        filters = Q()
+        sd = ed = None
 
         if form.is_valid():
             sd = form.cleaned_data.get("start_date")
             ed = form.cleaned_data.get("end_date")
             referred_by = form.cleaned_data.get("referred_by")
 
-            if sd: qs = qs.filter(date__gte=sd)
-            if ed: qs = qs.filter(date__lte=ed)
-            if referred_by: qs = qs.filter(referred_by=referred_by)
+            if sd: filters &= Q(date__gte=sd)
+            if ed: filters &= Q(date__lte=ed)
+            if referred_by: filters &= Q(referred_by=referred_by)
 
-        return qs, form
+        return partitions(filters, sd, ed), form
 
-    def get(self, request):
-        qs, form = self.get_queryset(request)
+    def render_get(self, request):
+        querysets, form = self.get_querysets(request)
 
         # Annotate the doctor name
-        daily_by_doctor = (
-            qs.annotate(day=TruncDay("date"))
-              .values("day", "referred_by")
+        daily_by_doctor = union_all([
+            qs.values("referred_by", day=F("date"))
               .annotate(
                   referred_by_name=F("referred_by__name"),
                   total_usg=Sum("total_ultra")
               )
-              .order_by("-day")
-        )
+            for qs in querysets
+        ]).order_by("-day")
 
         paginator = Paginator(daily_by_doctor, 20)
         page = request.GET.get("page")
@@ -212,14 +278,15 @@ class DailyReportView(View):
 
 
 
-class ExamTypeReportView(View):
+@method_decorator(cached_page, name='get')
+class ExamTypeReportView(ThreadedView):
 
-    def get(self, request):
+    def render_get(self, request):
         today = date.today()
 
         form = ExamTypeReportFilterForm(request.GET or None)
 
-        qs = Report.objects.select_related('sonologist', 'exam_type').all()
+        filters = Q()
 
         # Default dates
         start_date = today
@@ -230,48 +297,26 @@ class ExamTypeReportView(View):
             start_date = form.cleaned_data.get("start_date") or today
             end_date = form.cleaned_data.get("end_date") or today
 
-            qs = qs.filter(date__gte=start_date, date__lte=end_date)
+            filters &= Q(date__gte=start_date, date__lte=end_date)
 
             sonologist = form.cleaned_data.get("sonologist")
             exam_type = form.cleaned_data.get("exam_type")
 
             if sonologist:
-                qs = qs.filter(sonologist=sonologist)
+                filters &= Q(sonologist=sonologist)
             if exam_type:
-                qs = qs.filter(exam_type=exam_type)
-
-        # Aggregate by sonologist + exam type
-        raw = (
-            qs.values("sonologist__name", "exam_type__name")
-              .annotate(total_usg=Sum("total_ultra"))
-              .order_by("sonologist__name", "exam_type__name")
-        )
-
-        # Group by sonologist
-        grouped_reports = {}
-        for r in raw:
-            sname = r["sonologist__name"] or "Unknown"
-            if sname not in grouped_reports:
-                grouped_reports[sname] = {
-                    "exams": [],
-                    "total_usg": 0
-                }
-
-            grouped_reports[sname]["exams"].append({
-                "exam_type": r["exam_type__name"] or "Unknown",
-                "total_usg": r["total_usg"]
-            })
+                filters &= Q(exam_type=exam_type)
 
-            grouped_reports[sname]["total_usg"] += r["total_usg"]
-
-        grand_total_usg = sum(v["total_usg"] for v in grouped_reports.values())
-
-        # --- Pagination of sonologists ---
-        sonologist_list = list(grouped_reports.items())
-        paginator = Paginator(sonologist_list, 10)  # 10 sonologists per page
+        # Phase one: the page's sonologist subtotals and the grand total in one query
         page_number = request.GET.get("page")
+        subtotals = exam_types.SonologistSubtotals(filters, start_date, end_date, page=page_number, per_page=10)
+        paginator = Paginator(subtotals, 10)  # 10 sonologists per page
         page_obj = paginator.get_page(page_number)
 
+        # Phase two: exam type breakdown for just those sonologists
+        page_obj.object_list = exam_types.grouped(filters, start_date, end_date, page_obj.object_list)
+        grand_total_usg = subtotals.grand_total
+
         return render(request, "reports/exam_type_report.html", {
             "form": form,
             "grouped_reports": page_obj,   # pass page_obj instead of full dict
@@ -289,12 +334,14 @@ class ExamTypeReportView(View):
 
 
 # Monthly Report (Grouped by Sonologist)
-class MonthlyReportView(View):
+@method_decorator(cached_page, name='get')
+class MonthlyReportView(ThreadedView):
     template_name = "reports/monthly_report.html"
 
-    def get_queryset(self, request):
+    def get_querysets(self, request):
         form = MonthlyReportFilterForm(request.GET or None)
-        qs = Report.objects.all()
+        filters = Q()
+        sd = ed = None
 
         if form.is_valid():
             sd = form.cleaned_data.get("start_date")
@@ -303,27 +350,27 @@ class MonthlyReportView(View):
             exam_type = form.cleaned_data.get("exam_type")
             exam_name = form.cleaned_data.get("exam_name")
 
-            if sd: qs = qs.filter(date__gte=sd)
-            if ed: qs = qs.filter(date__lte=ed)
-            if sonologist: qs = qs.filter(sonologist=sonologist)
-            if exam_type: qs = qs.filter(exam_type__icontains=exam_type)
-            if exam_name: qs = qs.filter(exam_name=exam_name)
+            # Bounding the stored month too lets the (month, sonologist) index serve the range
+            if sd: filters &= Q(date__gte=sd, month__gte=sd.replace(day=1))
+            if ed: filters &= Q(date__lte=ed, month__lte=ed)
+            if sonologist: filters &= Q(sonologist=sonologist)
+            if exam_type: filters &= Q(exam_type__icontains=exam_type)
+            if exam_name: filters &= Q(exam_name=exam_name)
 
-        return qs, form
+        return partitions(filters, sd, ed), form
 
-    def get(self, request):
-        qs, form = self.get_queryset(request)
+    def render_get(self, request):
+        querysets, form = self.get_querysets(request)
 
         # Annotate sonologist name
-        monthly_by_sonologist = (
-            qs.annotate(month=TruncMonth("date"))
-              .values("month", "sonologist")
+        monthly_by_sonologist = union_all([
+            qs.values("month", "sonologist")
               .annotate(
                   sonologist_name=F("sonologist__name"),
                   total_usg=Sum("total_ultra")
               )
-              .order_by("-month", "sonologist")
-        )
+            for qs in querysets
+        ]).order_by("-month", "sonologist")
 
         paginator = Paginator(monthly_by_sonologist, 20)
         page = request.GET.get("page")
@@ -336,10 +383,17 @@ class MonthlyReportView(View):
 
 
 # Export (All)
+@method_decorator(cached_page, name='get')
+@method_decorator(admit_export, name='get')
 class ExportView(View):
     def get(self, request, fmt):
+        writer = get_writer(fmt)
+        if writer is None:
+            return HttpResponse("Invalid format", status=400)
+
         form = ReportFilterForm(request.GET or None)
-        qs = Report.objects.select_related('exam_type', 'referred_by', 'sonologist', 'exam_name').all().order_by('-date')
+        filters = Q()
+        sd = ed = None
         applied_filters = []
 
         # Apply filters from form
@@ -352,28 +406,28 @@ class ExportView(View):
             exam_name = form.cleaned_data.get("exam_name")
 
             if sd:
-                qs = qs.filter(date__gte=sd)
+                filters &= Q(date__gte=sd)
                 applied_filters.append(f"Start Date: {sd.strftime('%d-%m-%Y')}")
             if ed:
-                qs = qs.filter(date__lte=ed)
+                filters &= Q(date__lte=ed)
                 applied_filters.append(f"End Date: {ed.strftime('%d-%m-%Y')}")
             if referred_by:
-                qs = qs.filter(referred_by=referred_by)
+                filters &= Q(referred_by=referred_by)
                 applied_filters.append(f"Doctor: {referred_by.name}")
             if sonologist:
-                qs = qs.filter(sonologist=sonologist)
+                filters &= Q(sonologist=sonologist)
                 applied_filters.append(f"Sonologist: {sonologist.name}")
             if exam_type:
-                qs = qs.filter(exam_type=exam_type)
+                filters &= Q(exam_type=exam_type)
                 applied_filters.append(f"Exam Type: {exam_type.name}")
             if exam_name:
-                qs = qs.filter(exam_name=exam_name)  # filter by object equality
+                filters &= Q(exam_name=exam_name)  # filter by object equality
                 applied_filters.append(f"Exam Name: {exam_name.name}")
 
         # Search functionality
         search_query = request.GET.get('search')
         if search_query:
-            qs = qs.filter(
+            filters &= (
                 Q(id_number__icontains=search_query) |
                 Q(exam_name__name__icontains=search_query) |
                 Q(exam_type__name__icontains=search_query) |
@@ -382,79 +436,91 @@ class ExportView(View):
             )
             applied_filters.append(f"Search: {search_query}")
 
-        # Prepare headers and rows
+        # Prepare headers and rows. values_list + iterator() streams straight
+        # from the cursor, so csv/jsonl exports run in constant memory.
         headers = ['Patient ID', 'Date', 'Referred By', 'Sonologist', 'Exam Type', 'Exam Name', 'Total USG']
-        rows = [
+        values = union_all([
+            qs.values_list(
+                'id_number', 'date', 'referred_by__name', 'sonologist__name',
+                'exam_type__name', 'exam_name__name', 'total_ultra',
+            )
+            for qs in partitions(filters, sd, ed)
+        ]).order_by('-date')
+        rows = (
             [
-                r.id_number or "—",
-                r.date.strftime("%d-%m-%Y"),
-                r.referred_by.name if r.referred_by else "—",
-                r.sonologist.name if r.sonologist else "—",
-                r.exam_type.name if r.exam_type else "—",
-                r.exam_name.name if r.exam_name else "—",
-                r.total_ultra
+                id_number or "—",
+                day.strftime("%d-%m-%Y"),
+                referred_by or "—",
+                sonologist or "—",
+                exam_type or "—",
+                exam_name or "—",
+                total_ultra
             ]
-            for r in qs
-        ]
+            for id_number, day, referred_by, sonologist, exam_type, exam_name, total_ultra
+            in values.iterator(chunk_size=2000)
+        )
 
-        grand_total_usg = qs.aggregate(total=Sum('total_ultra'))['total'] or 0
-        rows.append(['', '', '', '', '', 'Grand Total', grand_total_usg])
+        extra_context = {"applied_filters": applied_filters}
+        if writer.include_totals:
+            grand_total_usg = total_ultra(filters, sd, ed)
+            rows = chain(rows, [['', '', '', '', '', 'Grand Total', grand_total_usg]])
+            extra_context["grand_total_usg"] = grand_total_usg
 
-        # Export to Excel or PDF
-        if fmt.lower() == 'xlsx':
-            return export_to_excel(rows, headers, "all_reports")
-        elif fmt.lower() == 'pdf':
-            return export_to_pdf(rows, headers, "all_reports", extra_context={
-                "grand_total_usg": grand_total_usg,
-                "applied_filters": applied_filters
-            })
+        return writer.export(rows, headers, "all_reports", extra_context=extra_context, compress=wants_gzip(request), asgi=is_asgi(request))
 
-        return HttpResponse("Invalid format", status=400)
 
 
 
-
-#  Daily Export (Excel / PDF)
+#  Daily Export (Excel / PDF / CSV / JSONL)
+@method_decorator(cached_page, name='get')
+@method_decorator(admit_export, name='get')
 class DailyReportExportView(View):
     def get(self, request, fmt):
+        writer = get_writer(fmt)
+        if writer is None:
+            return HttpResponse("Invalid format", status=400)
+
         form = DailyReportFilterForm(request.GET or None)
-        qs = Report.objects.all()
+        filters = Q()
+        sd = ed = None
 
         if form.is_valid():
             sd = form.cleaned_data.get("start_date")
             ed = form.cleaned_data.get("end_date")
             referred_by = form.cleaned_data.get("referred_by")
-            if sd: qs = qs.filter(date__gte=sd)
-            if ed: qs = qs.filter(date__lte=ed)
-            if referred_by: qs = qs.filter(referred_by=referred_by)
+            if sd: filters &= Q(date__gte=sd)
+            if ed: filters &= Q(date__lte=ed)
+            if referred_by: filters &= Q(referred_by=referred_by)
 
-        daily_data = (
-            qs.annotate(day=TruncDay('date'))
-              .values('day', 'referred_by')
+        daily_data = union_all([
+            qs.values('referred_by', day=F('date'))
               .annotate(
                   referred_by_name=F('referred_by__name'),
                   total_usg=Sum('total_ultra')
               )
-              .order_by('day')
-        )
+            for qs in partitions(filters, sd, ed)
+        ]).order_by('day')
 
         headers = ['Date', 'Referred By', 'Total USG']
-        rows = [[r['day'].strftime("%d-%m-%Y"), r['referred_by_name'], r['total_usg']] for r in daily_data]
+        rows = ([r['day'].strftime("%d-%m-%Y"), r['referred_by_name'], r['total_usg']] for r in daily_data.iterator())
 
-        grand_total_usg = sum(r['total_usg'] for r in daily_data)
+        extra_context = {'group_by': 'daily'}
+        if writer.include_totals:
+            rows = list(rows)
+            extra_context['grand_total_usg'] = sum(r[2] for r in rows)
 
-        if fmt.lower() == 'xlsx':
-            return export_to_excel(rows, headers, "daily_report")
-        elif fmt.lower() == 'pdf':
-            return export_to_pdf(rows, headers, "daily_report", extra_context={
-                'grand_total_usg': grand_total_usg, 'group_by': 'daily'
-            })
-        return HttpResponse("Invalid format", status=400)
+        return writer.export(rows, headers, "daily_report", extra_context=extra_context, compress=wants_gzip(request), asgi=is_asgi(request))
 
+@method_decorator(cached_page, name='get')
+@method_decorator(admit_export, name='get')
 class ExamTypeReportExportView(View):
-    """Export exam-type-wise USG report by sonologist (Excel / PDF)."""
+    """Export exam-type-wise USG report by sonologist (Excel / PDF / CSV / JSONL)."""
 
     def get(self, request, fmt):
+        writer = get_writer(fmt)
+        if writer is None:
+            return HttpResponse("Invalid format", status=400)
+
         today = date.today()
         form = ExamTypeReportFilterForm(request.GET or None)
 
@@ -473,50 +539,34 @@ class ExamTypeReportExportView(View):
         # Text for header
         filter_range_text = f"Showing data from {sd.strftime('%d-%m-%Y')} to {ed.strftime('%d-%m-%Y')}"
 
-        # Base queryset
-        qs = Report.objects.select_related("sonologist", "exam_type").filter(
-            date__gte=sd,
-            date__lte=ed
-        )
+        # Base filters
+        filters = Q(date__gte=sd, date__lte=ed)
 
         # Optional filters
         if sonologist:
-            qs = qs.filter(sonologist=sonologist)
+            filters &= Q(sonologist=sonologist)
         if exam_type:
-            qs = qs.filter(exam_type=exam_type)
+            filters &= Q(exam_type=exam_type)
 
-        # Aggregate totals
-        db_rows = (
-            qs.values("sonologist", "exam_type")
-              .annotate(
-                  sonologist_name=F("sonologist__name"),
-                  exam_type_name=F("exam_type__name"),
-                  total_usg=Sum("total_ultra"),
-              )
-              .order_by("sonologist__name", "exam_type__name")
-        )
-
-        # Grouping
-        grouped_data = {}
-        for r in db_rows:
-            sname = r["sonologist_name"] or "Unknown"
-
-            if sname not in grouped_data:
-                grouped_data[sname] = {
-                    "exams": [],
-                    "total_usg": 0,
-                }
+        subtotals = exam_types.SonologistSubtotals(filters, sd, ed)
+        groups = exam_types.iter_grouped(filters, sd, ed, subtotals)
 
-            grouped_data[sname]["exams"].append({
-                "exam_type": r["exam_type_name"] or "Unknown",
-                "total_usg": r["total_usg"],
-            })
+        headers = ["Sonologist", "Exam Type", "Total USG"]
 
-            grouped_data[sname]["total_usg"] += r["total_usg"]
+        # Data formats get one flat row per sonologist / exam type
+        if not writer.include_totals:
+            rows = (
+                [sname, exam["exam_type"], exam["total_usg"]]
+                for sname, data in groups
+                for exam in data["exams"]
+            )
+            return writer.export(rows, headers, "exam_type_report", compress=wants_gzip(request), asgi=is_asgi(request))
 
         # Prepare export rows
+        grouped_data = {}
         rows = []
-        for sname, data in grouped_data.items():
+        for sname, data in groups:
+            grouped_data[sname] = data
             first = True
             for exam in data["exams"]:
                 rows.append([
@@ -530,65 +580,292 @@ class ExamTypeReportExportView(View):
             rows.append(["", "Total USG:", data["total_usg"]])
 
         # Grand total
-        grand_total_usg = sum(d["total_usg"] for d in grouped_data.values())
+        grand_total_usg = subtotals.grand_total
         rows.append(["", "Grand Total USG:", grand_total_usg])
 
-        headers = ["Sonologist", "Exam Type", "Total USG"]
-
-        # Export Excel
-        if fmt.lower() == "xlsx":
-            return export_to_excel(rows, headers, "exam_type_report")
-
-        # Export PDF
-        if fmt.lower() == "pdf":
-            return export_pdf_grouped(
-                grouped_data,
-                headers,
-                "exam_type_report",
-                extra_context={
-                    "grand_total_usg": grand_total_usg,
-                    "filter_range_text": filter_range_text,
-                },
-            )
-
-        return HttpResponse("Invalid format", status=400)
+        return writer.export(
+            rows,
+            headers,
+            "exam_type_report",
+            extra_context={
+                "grouped_data": grouped_data,
+                "grand_total_usg": grand_total_usg,
+                "filter_range_text": filter_range_text,
+            },
+            template_name="reports/exam_type_report_pdf.html",
+        )
 
 
 
 
-#  Monthly Export (Excel / PDF)
+#  Monthly Export (Excel / PDF / CSV / JSONL)
+@method_decorator(cached_page, name='get')
+@method_decorator(admit_export, name='get')
 class MonthlyReportExportView(View):
     def get(self, request, fmt):
+        writer = get_writer(fmt)
+        if writer is None:
+            return HttpResponse("Invalid format", status=400)
+
         form = MonthlyReportFilterForm(request.GET or None)
-        qs = Report.objects.all()
+        filters = Q()
+        sd = ed = None
 
         if form.is_valid():
             sd = form.cleaned_data.get("start_date")
             ed = form.cleaned_data.get("end_date")
             sonologist = form.cleaned_data.get("sonologist")
-            if sd: qs = qs.filter(date__gte=sd)
-            if ed: qs = qs.filter(date__lte=ed)
-            if sonologist: qs = qs.filter(sonologist=sonologist)
+            if sd: filters &= Q(date__gte=sd, month__gte=sd.replace(day=1))
+            if ed: filters &= Q(date__lte=ed, month__lte=ed)
+            if sonologist: filters &= Q(sonologist=sonologist)
 
-        monthly_data = (
-            qs.annotate(month=TruncMonth('date'))
-              .values('month', 'sonologist')
+        monthly_data = union_all([
+            qs.values('month', 'sonologist')
               .annotate(
                   sonologist_name=F('sonologist__name'),
                   total_usg=Sum('total_ultra')
               )
-              .order_by('month', 'sonologist')
-        )
+            for qs in partitions(filters, sd, ed)
+        ]).order_by('month', 'sonologist')
 
         headers = ['Month', 'Sonologist', 'Total USG']
-        rows = [[r['month'].strftime("%B %Y"), r['sonologist_name'], r['total_usg']] for r in monthly_data]
+        rows = ([r['month'].strftime("%B %Y"), r['sonologist_name'], r['total_usg']] for r in monthly_data.iterator())
+
+        extra_context = {'group_by': 'monthly_sonologist'}
+        if writer.include_totals:
+            rows = list(rows)
+            extra_context['grand_total_usg'] = sum(r[2] for r in rows)
+
+        return writer.export(rows, headers, "monthly_report", extra_context=extra_context, compress=wants_gzip(request), asgi=is_asgi(request))
+
+
+# Patient history
+class PatientTimelineView(View):
+    """Return every report for a patient ID as JSON, newest first: GET /patients/timeline/?id=<patient id>."""
+    fields = (
+        'id', 'date', 'id_number', 'total_ultra', 'notes',
+        'exam_name__name', 'exam_type__name', 'referred_by__name', 'sonologist__name',
+    )
+
+    def get(self, request):
+        key = normalize_patient_id(request.GET.get('id'))
+        if key is None:
+            return JsonResponse({'error': 'id is required'}, status=400)
+        # Exact match on the normalized key: an index lookup in every partition
+        reports = union_all([
+            qs.values(*self.fields) for qs in partitions(Q(patient_key=key))
+        ]).order_by('-date', '-id')
+        return JsonResponse({'patient_key': key, 'reports': list(reports)})
+
+
+# Change feed (incremental sync for downstream systems)
+class ChangeFeedView(View):
+    """
+    Return Report changes after a cursor as JSON: GET /changes/?since=<cursor>&limit=<n>.
+
+    Upserts carry the current row; deletes are tombstones with only the id.
+    Keep calling with ``since=next_cursor`` until ``has_more`` is false.
+    """
+    default_limit = 500
+    max_limit = 5000
+    fields = (
+        'id', 'change_seq', 'id_number', 'date', 'patient_name', 'notes', 'total_ultra',
+        'exam_name_id', 'exam_type_id', 'referred_by_id', 'sonologist_id', 'created_at', 'updated_at',
+    )
+
+    def get(self, request):
+        try:
+            since = max(int(request.GET.get('since', 0)), 0)
+            limit = min(max(int(request.GET.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            return JsonResponse({'error': 'since and limit must be integers'}, status=400)
+
+        upserts = (
+            Report.objects.filter(change_seq__gt=since)
+            .order_by('change_seq')
+            .values(*self.fields)[:limit + 1]
+        )
+        deletes = (
+            ReportTombstone.objects.filter(change_seq__gt=since)
+            .order_by('change_seq')
+            .values('report_id', 'change_seq', 'deleted_at')[:limit + 1]
+        )
+
+        changes = [
+            {'seq': row.pop('change_seq'), 'op': 'upsert', 'id': row['id'], 'report': row}
+            for row in upserts
+        ] + [
+            {'seq': row['change_seq'], 'op': 'delete', 'id': row['report_id'], 'deleted_at': row['deleted_at']}
+            for row in deletes
+        ]
+        changes.sort(key=lambda change: change['seq'])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        return JsonResponse({
+            'changes': changes,
+            'next_cursor': changes[-1]['seq'] if changes else since,
+            'has_more': has_more,
+        })
+
+
+# Referrer statements: one PDF per referrer for a month, downloaded as a zip
+@method_decorator(admit_export, name='get')
+class ReferrerStatementsView(View):
+    """Download the month's stored statements; the scheduler and ``generate_statements`` render them."""
+
+    def get(self, request):
+        form = StatementMonthForm(request.GET)
+        if not form.is_valid():
+            return HttpResponse("Invalid month (expected YYYY-MM)", status=400)
+        month = form.cleaned_data['month']
+
+        if not statements.stored(month).exists():
+            messages.warning(request, f"No referrer statements have been generated for {month:%B %Y} yet. "
+                                      f"Run: manage.py generate_statements --month {month:%Y-%m}")
+            return redirect("reports:daily_report")
+        archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        statements.write_zip(month, archive)
+        archive.seek(0)
+        return FileResponse(archive, as_attachment=True, filename=f"referrer_statements_{month:%Y_%m}.zip",
+                            content_type="application/zip")
+
+
+# Consolidated cross-branch report (head office), read from the daily rollups
+@method_decorator(cached_page, name='get')
+class BranchSummaryView(View):
+    template_name = "reports/branch_summary.html"
+
+    def get(self, request):
+        today = date.today()
+        form = BranchSummaryFilterForm(request.GET or None)
+        start_date, end_date = today.replace(month=1, day=1), today
+        if form.is_valid():
+            start_date = form.cleaned_data.get("start_date") or start_date
+            end_date = form.cleaned_data.get("end_date") or end_date
+
+        months, rows, totals = rollups.consolidated(start_date, end_date)
+        return render(request, self.template_name, {
+            "form": form,
+            "months": months,
+            "rows": rows,
+            "totals": totals,
+            "start_date": start_date,
+            "end_date": end_date,
+        })
+
+
+# Pivot (cross-tab) report
+PIVOT_FORMATS = ('csv', 'xlsx')
+
+
+def build_pivot(request):
+    """
+    The pivot for the request's filters (defaults: referrer x exam name, year to date), with its form.
 
-        grand_total_usg = sum(r['total_usg'] for r in monthly_data)
+    The pivot is None, with the reason as a form error, when it would be too large.
+    """
+    form = PivotForm(request.GET or None)
+    start, end = pivot.default_range()
+    options = {'rows': 'referrer', 'columns': 'exam_name', 'layer': None, 'measure': 'usg'}
+    if form.is_valid():
+        start = form.cleaned_data.get("start_date") or start
+        end = form.cleaned_data.get("end_date") or end
+        options = {name: form.cleaned_data[name] or None for name in options}
+    try:
+        return pivot.Pivot(start=start, end=end, **options), form
+    except pivot.PivotTooLarge as e:
+        form.add_error(None, str(e))
+        return None, form
 
-        if fmt.lower() == 'xlsx':
-            return export_to_excel(rows, headers, "monthly_report")
-        elif fmt.lower() == 'pdf':
-            return export_to_pdf(rows, headers, "monthly_report", extra_context={
-                'grand_total_usg': grand_total_usg, 'group_by': 'monthly_sonologist'
-            })
-        return HttpResponse("Invalid format", status=400)
+
+@method_decorator(cached_page, name='get')
+class PivotReportView(ThreadedView):
+    template_name = "reports/pivot_report.html"
+
+    def render_get(self, request):
+        result, form = build_pivot(request)
+        return render(request, self.template_name, {
+            "form": form,
+            "pivot": result,
+            "tables": list(result.tables()) if result else [],
+            "formats": PIVOT_FORMATS,
+        })
+
+
+@method_decorator(cached_page, name='get')
+@method_decorator(admit_export, name='get')
+class PivotExportView(View):
+    def get(self, request, fmt):
+        writer = get_writer(fmt)
+        if writer is None or fmt not in PIVOT_FORMATS:
+            return HttpResponse("Invalid format", status=400)
+        result, form = build_pivot(request)
+        if result is None:
+            return HttpResponse(" ".join(form.non_field_errors()), status=400)
+        return writer.export(result.export_rows(), result.headers(), "pivot_report",
+                             compress=wants_gzip(request), asgi=is_asgi(request))
+
+
+# Merging duplicate master data (staff only)
+@method_decorator(staff_member_required, name='dispatch')
+class MasterdataMergeView(View):
+    template_name = "reports/masterdata_merge.html"
+
+    def dispatch(self, request, kind):
+        if kind not in merge.KINDS:
+            raise Http404("Unknown master data kind")
+        self.model = merge.KINDS[kind][0]
+        return super().dispatch(request, kind)
+
+    def get(self, request, kind):
+        return render(request, self.template_name, {
+            "kind": kind,
+            "title": self.model._meta.verbose_name_plural,
+            "groups": merge.find_duplicates(kind),
+            "merges": MasterdataMerge.objects.filter(kind=kind).select_related("requested_by")[:10],
+        })
+
+    def post(self, request, kind):
+        if "retry" in request.POST:
+            retried = MasterdataMerge.objects.filter(
+                pk=request.POST["retry"], kind=kind, status=MasterdataMerge.FAILED,
+            ).update(status=MasterdataMerge.PENDING, error="")
+            if retried:
+                messages.success(request, "Merge queued again.")
+            return redirect("reports:masterdata_merge", kind=kind)
+        try:
+            survivor_id = int(request.POST["survivor"])
+            loser_ids = [int(pk) for pk in request.POST.getlist("losers")]
+        except (KeyError, ValueError):
+            messages.error(request, "Choose the row to keep and the rows to merge into it.")
+            return redirect("reports:masterdata_merge", kind=kind)
+
+        rows = self.model.objects.in_bulk([survivor_id, *loser_ids])
+        survivor = rows.get(survivor_id)
+        losers = [rows[pk] for pk in loser_ids if pk in rows]
+        try:
+            if survivor is None:
+                raise ValueError("The row to keep no longer exists.")
+            merge.queue(kind, survivor, losers, request.user)
+        except ValueError as exc:
+            messages.error(request, str(exc))
+        else:
+            messages.success(request, f"Queued merging {', '.join(map(str, losers))} into {survivor}. "
+                                      "The scheduler moves their reports within a minute or two.")
+        return redirect("reports:masterdata_merge", kind=kind)
+
+
+# Request profiles (staff only); see reports.profiling
+@staff_member_required
+def profile_file(request, pk, kind):
+    if kind not in profiling.FILES:
+        raise Http404("Unknown profile file")
+    profile = get_object_or_404(RequestProfile, pk=pk)
+    path = profiling.file_path(profile, kind)
+    try:
+        handle = open(path, 'rb')
+    except FileNotFoundError:
+        raise Http404("The profile's files have been removed")
+    return FileResponse(handle, as_attachment=True, filename=path.rsplit('/', 1)[-1],
+                        content_type='text/plain' if kind == 'flamegraph' else 'application/json')
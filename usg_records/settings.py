@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 from decouple import config
 
@@ -43,12 +45,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'reports.middleware.MemoryWatchdogMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'reports.middleware.ProfilingMiddleware',
+    'reports.middleware.AuditUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'masterdata.middleware.CurrentBranchMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -58,30 +65,139 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
+        'APP_DIRS': DEBUG,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'reports.caching.page_cache_context',
             ],
         },
     },
 ]
 
+# Production profile: compile each template once per process instead of
+# re-reading and re-parsing it on every render (loaders requires APP_DIRS off).
+if not DEBUG:
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'usg_records.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite performance profile for single-box deployments. WAL lets long reads
+# (exports, report pages) run alongside the reception desk's writes, and
+# IMMEDIATE transactions take the write lock up front so a writer waits for
+# busy_timeout instead of failing mid-transaction with "database is locked".
+SQLITE_WAL = config('SQLITE_WAL', default=True, cast=bool)
+
+SQLITE_PRAGMAS = {
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=20000, cast=int),   # ms
+    'journal_mode': 'WAL' if SQLITE_WAL else 'DELETE',
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL' if SQLITE_WAL else 'FULL'),
+    'cache_size': config('SQLITE_CACHE_SIZE', default=-64000, cast=int),      # negative = KiB (64 MB)
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=268435456, cast=int),     # 256 MB
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {key}={value}' for key, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
+    }
+}
+
+
+# Branch (diagnostic centre) this deployment serves. Leave empty on the head
+# office install to see every branch and switch with ?branch=<code>.
+BRANCH_CODE = config('BRANCH_CODE', default='')
+
+# Worker processes for rendering referrer statement PDFs (default: one per CPU).
+STATEMENT_WORKERS = config('STATEMENT_WORKERS', default=0, cast=int) or None
+
+# Cache for rendered report pages and fragments (see reports.caching). The file
+# cache is shared by every worker process on the box; point CACHE_BACKEND at
+# Redis/Memcached when running on several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(tempfile.gettempdir(), 'usg_records_cache')),
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
     }
 }
 
+# Seconds a rendered report page stays cached. Keys include the data version,
+# so edits never serve stale pages; this only bounds how long unused pages linger.
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=600, cast=int)
+
+# Sessions and flash messages live in signed cookies. Requests never touch SQLite
+# for the session: no django_session read per request and no write transaction
+# at login, logout or when a message overflows the cookie and falls back to the
+# session. ``manage.py bench_sessions`` counts the difference. Cookie sessions are
+# signed, not encrypted; only login state belongs in them.
+# SESSION_ENGINE=django.contrib.sessions.backends.cache keeps them server-side in
+# CACHES instead. ``manage.py purge_sessions`` empties the old django_session table.
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.signed_cookies')
+SESSION_COOKIE_HTTPONLY = True
+SESSION_COOKIE_SECURE = config('SESSION_COOKIE_SECURE', default=False, cast=bool)  # True when served over HTTPS
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Worker processes coordinate through file locks in LOCK_DIR (see reports.locks).
+# A request for a page that another worker is already rendering waits up to
+# SINGLE_FLIGHT_WAIT seconds for that render instead of repeating it. At most
+# EXPORT_CONCURRENCY exports render at once across all workers; further export
+# requests get 503 with Retry-After: EXPORT_RETRY_AFTER.
+LOCK_DIR = config('LOCK_DIR', default=os.path.join(tempfile.gettempdir(), 'usg_records_locks'))
+SINGLE_FLIGHT_WAIT = config('SINGLE_FLIGHT_WAIT', default=120, cast=float)
+EXPORT_CONCURRENCY = config('EXPORT_CONCURRENCY', default=2, cast=int)
+EXPORT_RETRY_AFTER = config('EXPORT_RETRY_AFTER', default=15, cast=int)
+
+# Staff can profile any request with ?_profile=1 or an X-Profile: 1 header (see
+# reports.profiling). Stacks are sampled every PROFILE_INTERVAL seconds; the
+# flamegraph and SQL timeline files go to PROFILE_DIR and the newest
+# PROFILE_KEEP profiles are kept.
+PROFILE_DIR = config('PROFILE_DIR', default=os.path.join(tempfile.gettempdir(), 'usg_records_profiles'))
+PROFILE_INTERVAL = config('PROFILE_INTERVAL', default=0.005, cast=float)
+PROFILE_KEEP = config('PROFILE_KEEP', default=200, cast=int)
+
+# Worker memory (see reports.memory). Requests that grow the worker by
+# MEMORY_LOG_MB are logged; one request in MEMORY_TRACE_EVERY (0: none) is
+# traced with tracemalloc. Under gunicorn a worker past MEMORY_RECYCLE_MB after
+# a request exits gracefully and is replaced.
+MEMORY_LOG_MB = config('MEMORY_LOG_MB', default=50, cast=int)
+MEMORY_TRACE_EVERY = config('MEMORY_TRACE_EVERY', default=0, cast=int)
+MEMORY_RECYCLE_MB = config('MEMORY_RECYCLE_MB', default=512, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'reports': {'handlers': ['console'], 'level': config('REPORTS_LOG_LEVEL', default='INFO')},
+    },
+}
+
+# Audit entries for bulk report changes (master data merges) are written in the
+# background, in batches of up to AUDIT_BATCH_SIZE at most AUDIT_FLUSH_SECONDS
+# after the change (see reports.audit). Single saves write theirs directly.
+AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=200, cast=int)
+AUDIT_FLUSH_SECONDS = config('AUDIT_FLUSH_SECONDS', default=2.0, cast=float)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -118,6 +234,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Whitenoise serves collected static files from the app processes. In production
+# collectstatic writes content-hashed names plus .br/.gz siblings, so clients on
+# slow links get compressed files and hashed files are cached "forever"
+# (max-age of ten years, immutable); unhashed ones get WHITENOISE_MAX_AGE.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'usg_records.storage.CompressedStaticFilesStorage',
+    },
+}
+WHITENOISE_MAX_AGE = 0 if DEBUG else config('WHITENOISE_MAX_AGE', default=86400, cast=int)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field